@@ -0,0 +1,28 @@
+import asyncio
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from prometheus_client import CONTENT_TYPE_LATEST
+from ..core.config import settings
+from ..core.metrics import metrics_sampler
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)) -> Response:
+    """Prometheus scrape endpoint, aggregated over every server worker"""
+    # Exempt from user auth; the scraper presents METRICS_TOKEN instead, and without one
+    # the endpoint is not served at all
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not hmac.compare_digest(
+        (authorization or "").encode(), f"Bearer {settings.METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    metrics_sampler.sample()
+    # Reading every worker's files is blocking I/O: keep it off the event loop
+    return Response(await asyncio.to_thread(metrics_sampler.render), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,139 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from typing import List, Literal, Optional
+
+from app.core.context import request_context
+from app.core.profiling import ProfiledRoute
+from app.core.responses import ORJSONResponse
+from app.models.api import API
+from app.models.user import User
+from app.schemas.api import APICreate, APIResponse, APIStatus, APIUpdate, PricingType
+from app.services.api_service import APIService
+from app.services.auth_service import get_current_user
+from app.services.catalog_index import catalog_index
+from app.services.proxy import api_upstream, upstream_proxy
+from app.services.upstream_guard import upstream_guard
+from app.services.usage_service import UsageService
+
+router = APIRouter(route_class=ProfiledRoute)
+
+PROXY_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE"]
+
+async def get_owned_api(api_id: str, current_user: User = Depends(get_current_user)) -> API:
+    """The API, if the caller owns it or is an admin"""
+    api = await APIService().get_api(api_id)
+    if not api:
+        raise HTTPException(status_code=404, detail="API not found")
+    if api.owner_id != current_user.id and not current_user.is_admin:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to modify this API"
+        )
+    return api
+
+@router.post("/", response_model=APIResponse)
+async def create_api(api_data: APICreate, current_user: User = Depends(get_current_user)):
+    """Publish an API; calls to it are forwarded to its endpoint"""
+    return await APIService().create_api(api_data, owner_id=current_user.id)
+
+@router.get("/", response_model=List[APIResponse])
+async def list_apis(
+    owner_id: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """List the published APIs; owners and admins also see the disabled ones"""
+    sees_all = owner_id is not None and (owner_id == current_user.id or current_user.is_admin)
+    return await APIService().list_apis(
+        owner_id=owner_id,
+        status=None if sees_all else "active",
+        skip=skip,
+        limit=limit
+    )
+
+@router.get("/search")
+async def search_apis(
+    q: str = Query("", max_length=200),
+    pricing_type: Optional[PricingType] = None,
+    api_status: Optional[APIStatus] = Query(None, alias="status"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: Literal["relevance", "newest"] = "relevance",
+    skip: int = Query(0, ge=0, le=1000),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Search the catalog by name and description, with filters on pricing type and
+    price and the result count of each pricing type. Served from the worker's
+    in-memory index. Only admins can search disabled APIs, with ``status``, and
+    get the status counts.
+    """
+    if not current_user.is_admin:
+        api_status = "active"
+    await catalog_index.ensure_loaded()
+    return ORJSONResponse(catalog_index.search(
+        q,
+        pricing_type=pricing_type,
+        status=api_status,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        skip=skip,
+        limit=limit,
+        status_facet=current_user.is_admin,
+    ))
+
+@router.get("/{api_id}", response_model=APIResponse)
+async def get_api(api_id: str, current_user: User = Depends(get_current_user)):
+    """Get a published API's details"""
+    api = await APIService().get_api(api_id)
+    if not api or (api.status != "active" and api.owner_id != current_user.id and not current_user.is_admin):
+        raise HTTPException(status_code=404, detail="API not found")
+    return api
+
+@router.put("/{api_id}", response_model=APIResponse)
+async def update_api(changes: APIUpdate, api: API = Depends(get_owned_api)):
+    """Update an API. Only accessible by its owner and admin users."""
+    updated = await APIService().update_api(api.id, changes)
+    if not updated:
+        raise HTTPException(status_code=404, detail="API not found")
+    return updated
+
+@router.delete("/{api_id}")
+async def delete_api(api: API = Depends(get_owned_api)):
+    """Delete an API. Only accessible by its owner and admin users."""
+    await APIService().delete_api(api.id)
+    return {"message": "API deleted successfully"}
+
+@router.get("/{api_id}/metrics")
+async def get_api_metrics(api: API = Depends(get_owned_api)):
+    """
+    Get an API's call count, latency and success rate, with the live concurrency
+    limit, queue and circuit state of its upstream in the worker answering. Only
+    accessible by its owner and admin users.
+    """
+    metrics = await UsageService().get_api_metrics(api.id) or {"total_calls": 0, "avg_response_time": None, "success_rate": None}
+    metrics.pop("_id", None)
+    return {"api_id": api.id, **metrics, "upstream": upstream_guard.snapshot(api_upstream(api))}
+
+@router.api_route("/{api_id}/call", methods=PROXY_METHODS, include_in_schema=False)
+@router.api_route("/{api_id}/call/{path:path}", methods=PROXY_METHODS)
+async def call_api(api_id: str, request: Request, path: str = ""):
+    """
+    Call a published API. The request, its body streamed as it arrives, is forwarded
+    to the API's endpoint with ``path`` and the query string appended, and the
+    upstream's response is streamed back. Metered and rate limited like any other call.
+    """
+    api = await APIService().get_cached_api(api_id)
+    if not api or api.status != "active":
+        raise HTTPException(status_code=404, detail="API not found")
+    if request.method != api.method:
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail=f"This API is called with {api.method}",
+            headers={"Allow": api.method}
+        )
+    # Tags the usage record the usage middleware writes for this call
+    request_context(request.scope).api_id = api.id
+    return await upstream_proxy.forward(api, path, request)
@@ -1,19 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import Annotated
 
 from ....services.auth_service import AuthService
 from ....schemas.user import UserCreate, UserResponse
 from ....schemas.token import Token
 from ....db.mongodb import get_database
+from ....core.config import settings
+from ....core.security import key_store
+from ....core.profiling import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.post("/register", response_model=UserResponse)
 async def register(
     user_data: UserCreate,
-    db: MongoClient = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ) -> UserResponse:
     auth_service = AuthService(db)
     return await auth_service.create_user(user_data)
@@ -21,7 +24,7 @@ async def register(
 @router.post("/login", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: MongoClient = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ) -> Token:
     auth_service = AuthService(db)
     user = await auth_service.authenticate_user(form_data.username, form_data.password)
@@ -33,5 +36,12 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = auth_service.create_user_token(user)
+    access_token = await auth_service.create_user_token(user)
     return Token(access_token=access_token, token_type="bearer")
+
+
+@router.get("/jwks.json")
+async def jwks(response: Response) -> dict:
+    """Public signing keys, so gateways can verify access tokens without calling us"""
+    response.headers["Cache-Control"] = f"public, max-age={settings.JWT_JWKS_MAX_AGE_SECONDS}"
+    return key_store.current().jwks()
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import List
+
+from app.core.profiling import ProfiledRoute, folded
+from app.models.user import User
+from app.schemas.profiling import ProfilingRules, ProfileSummary
+from app.services.auth_service import get_current_user
+from app.services.profiling import profiler
+
+router = APIRouter(route_class=ProfiledRoute)
+
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to access this endpoint"
+        )
+    return current_user
+
+@router.get("/rules", response_model=ProfilingRules)
+async def get_rules(current_user: User = Depends(get_admin_user)):
+    """
+    Get the rules selecting which requests are profiled. Only accessible by admin users.
+    """
+    await profiler.sync()
+    return profiler.rules
+
+@router.put("/rules", response_model=ProfilingRules)
+async def set_rules(rules: ProfilingRules, current_user: User = Depends(get_admin_user)):
+    """
+    Profile requests to the given endpoints, from the given users, or a sampled fraction
+    of all requests. Every worker applies new rules within a few seconds; send empty
+    rules to stop profiling. Only accessible by admin users.
+    """
+    await profiler.set_rules(rules)
+    return rules
+
+@router.get("/profiles", response_model=List[ProfileSummary])
+async def list_profiles(current_user: User = Depends(get_admin_user)):
+    """
+    List the captured profiles, newest first, with their per-stage timings. Only accessible by admin users.
+    """
+    return await profiler.list_profiles()
+
+@router.get("/profiles/{profile_id}", response_model=ProfileSummary)
+async def get_profile(profile_id: str, current_user: User = Depends(get_admin_user)):
+    """
+    Get a captured profile's per-stage timings. Only accessible by admin users.
+    """
+    profile = await profiler.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("/profiles/{profile_id}/flamegraph")
+async def download_flamegraph(profile_id: str, current_user: User = Depends(get_admin_user)):
+    """
+    Download a profile's sampled stacks in the collapsed format read by flamegraph.pl,
+    speedscope and inferno. Only accessible by admin users.
+    """
+    profile = await profiler.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        folded(tuple(stack) for stack in profile["stacks"]),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
+
+@router.delete("/profiles")
+async def clear_profiles(current_user: User = Depends(get_admin_user)):
+    """
+    Delete every captured profile. Only accessible by admin users.
+    """
+    deleted = await profiler.clear_profiles()
+    return {"deleted": deleted}
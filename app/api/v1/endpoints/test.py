@@ -4,8 +4,9 @@ from ....services.auth_service import AuthService, get_current_user
 from ....models.user import User
 from ....db.mongodb import get_database
 from typing import Dict
+from ....core.profiling import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.get("/sleep/{seconds}")
 async def sleep_endpoint(
@@ -1,36 +1,107 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+import csv
 import datetime
-from typing import Optional
+import io
+from typing import Literal, Optional
+import orjson
 
-from ....services.usage_service import UsageService
-from ....services.auth_service import AuthService
+from ....services.usage_service import UsageService, USAGE_EXPORT_FIELDS
+from ....services.auth_service import get_current_user
 from ....models.user import User
-from ....db.mongodb import get_database
+from ....core.routing import CachedRoute, cache_response
+from ....core.responses import ORJSONResponse
 
-router = APIRouter()
+router = APIRouter(route_class=CachedRoute)
+
+def _default_period(start_date: Optional[datetime.datetime], end_date: Optional[datetime.datetime]):
+    """Fill in the last 30 days for any missing bound of the requested period"""
+    if not start_date:
+        start_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=30)
+    if not end_date:
+        end_date = datetime.datetime.now(datetime.timezone.utc)
+    return start_date, end_date
 
 @router.get("/stats")
+@cache_response("usage")
 async def get_usage_stats(
     start_date: Optional[datetime.datetime] = None,
     end_date: Optional[datetime.datetime] = None,
-    current_user: User = Depends(AuthService(get_database()).get_current_user)
+    current_user: User = Depends(get_current_user)
 ):
     """Get usage statistics for the current user"""
     usage_service = UsageService()
+    start_date, end_date = _default_period(start_date, end_date)
     
-    if not start_date:
-        start_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=30)
-    if not end_date:
-        end_date = datetime.datetime.now(datetime.timezone.utc)
-    
-    usage = usage_service.get_user_usage(str(current_user.id), start_date, end_date)
-    costs = usage_service.calculate_user_costs(str(current_user.id))
+    usage = await usage_service.get_usage_summary(str(current_user.id), start_date, end_date)
+    costs = await usage_service.calculate_user_costs(str(current_user.id))
     
-    return {
+    return ORJSONResponse({
         "usage": usage,
         "costs": costs,
         "period": {
             "start": start_date,
             "end": end_date
         }
-    } 
\ No newline at end of file
+    })
+
+@router.get("/records")
+async def list_usage_records(
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """List raw usage records for the current user, one page at a time"""
+    usage_service = UsageService()
+    start_date, end_date = _default_period(start_date, end_date)
+
+    items, next_cursor = await usage_service.get_user_usage_page(
+        str(current_user.id), start_date, end_date, limit=limit, cursor=cursor
+    )
+    return ORJSONResponse({"items": items, "next_cursor": next_cursor})
+
+@router.get("/export")
+async def export_usage_records(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every raw usage record of the current user as NDJSON or CSV"""
+    usage_service = UsageService()
+    start_date, end_date = _default_period(start_date, end_date)
+    batches = usage_service.iter_user_usage(str(current_user.id), start_date, end_date)
+
+    async def ndjson_lines():
+        async for batch in batches:
+            # Same encoder as the JSON endpoints; datetimes come out in RFC 3339
+            yield b"".join(orjson.dumps(doc, default=_json_default) + b"\n" for doc in batch)
+
+    async def csv_lines():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=USAGE_EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        async for batch in batches:
+            for doc in batch:
+                doc["timestamp"] = _json_default(doc["timestamp"])
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    if format == "csv":
+        return StreamingResponse(
+            csv_lines(),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="usage.csv"'}
+        )
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
@@ -1,15 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Literal
 
 from app.models.user import User
 from app.models.usage import APIUsage
 from app.services.auth_service import get_current_user
-from app.services.usage_service import get_user_usage_cost
+from app.services.usage_service import get_users_costs as compute_users_costs
 from app.db.mongodb import get_database
+from app.core.routing import CachedRoute, cache_response
 
-router = APIRouter()
+router = APIRouter(route_class=CachedRoute)
 
 @router.get("/users", response_model=List[User])
+@cache_response("users")
 async def get_users(current_user: User = Depends(get_current_user), db=Depends(get_database)):
     """
     Get all users and their details. Only accessible by admin users.
@@ -25,9 +27,16 @@ async def get_users(current_user: User = Depends(get_current_user), db=Depends(g
     return users
 
 @router.get("/users/costs")
-async def get_users_costs(current_user: User = Depends(get_current_user), db=Depends(get_database)):
+@cache_response("users", "usage")
+async def get_users_costs(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    order: Literal["desc", "asc"] = "desc",
+    current_user: User = Depends(get_current_user),
+    db=Depends(get_database)
+):
     """
-    Get all users and their associated costs. Only accessible by admin users.
+    Get all users and their associated costs, sorted by cost. Only accessible by admin users.
     """
     if not current_user.is_admin:
         raise HTTPException(
@@ -35,17 +44,4 @@ async def get_users_costs(current_user: User = Depends(get_current_user), db=Dep
             detail="Not authorized to access this endpoint"
         )
     
-    users_collection = db["users"]
-    users = await users_collection.find().to_list(length=None)
-    
-    user_costs = []
-    for user in users:
-        cost = await get_user_usage_cost(user["id"], db)
-        user_costs.append({
-            "user_id": user["id"],
-            "email": user["email"],
-            "username": user["username"],
-            "total_cost": cost
-        })
-    
-    return user_costs
+    return await compute_users_costs(db, skip=skip, limit=limit, descending=order == "desc")
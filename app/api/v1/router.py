@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from .endpoints import auth, test, usage, tokens, users
+from .endpoints import auth, test, usage, tokens, users, profiling, apis
 
 api_router = APIRouter()
 
@@ -31,4 +31,16 @@ api_router.include_router(
     users.router,
     prefix="/users",
     tags=["users"]
-)
\ No newline at end of file
+)
+
+api_router.include_router(
+    apis.router,
+    prefix="/apis",
+    tags=["apis"]
+)
+
+api_router.include_router(
+    profiling.router,
+    prefix="/profiling",
+    tags=["profiling"]
+)
@@ -0,0 +1,20 @@
+"""Build the usage rollup buckets missing for the existing raw usage records.
+
+Usage:
+    python -m app.commands.backfill_rollups
+"""
+import asyncio
+from ..db.mongodb import MongoDB
+from ..services.usage_rollup_service import UsageRollupService
+
+async def main():
+    MongoDB.connect_to_mongo()
+    try:
+        await UsageRollupService().backfill()
+        count = await MongoDB.get_db().usage_rollups.count_documents({})
+        print(f"Usage rollups backfilled: {count} buckets")
+    finally:
+        MongoDB.close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""Add a new JWT signing key to the key set file, optionally making it the active one.
+
+Activating a key keeps the previous active key in the set with only its public half,
+so tokens it signed keep verifying until they expire. The file is replaced
+atomically, running workers pick it up within ``JWT_KEYSET_RELOAD_SECONDS``.
+
+Usage:
+    python -m app.commands.generate_signing_key --alg ES256 --kid 2026-10 --activate
+"""
+import argparse
+import datetime
+import json
+import os
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from ..core.config import settings
+from ..core.keys import ASYMMETRIC_KEY_TYPES
+
+def generate_private_key(alg: str):
+    if alg == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if alg == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if alg == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported algorithm {alg}")
+
+def private_pem(key) -> str:
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+def public_pem(key) -> str:
+    return key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+
+def add_key(keyset: dict, alg: str, kid: str, activate: bool) -> dict:
+    """Return the key set with a freshly generated key added"""
+    if any(entry["kid"] == kid for entry in keyset["keys"]):
+        raise ValueError(f"Key {kid} already exists")
+    keyset["keys"].append({"kid": kid, "alg": alg, "private_key": private_pem(generate_private_key(alg))})
+
+    if activate:
+        for entry in keyset["keys"]:
+            # Retired keys only verify: drop their private half
+            if entry["kid"] == keyset.get("active_kid") and "private_key" in entry:
+                key = serialization.load_pem_private_key(entry.pop("private_key").encode(), password=None)
+                entry["public_key"] = public_pem(key)
+        keyset["active_kid"] = kid
+    return keyset
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keyset", default=settings.JWT_KEYSET_FILE, help="Key set file (default: JWT_KEYSET_FILE)")
+    parser.add_argument("--alg", choices=sorted(ASYMMETRIC_KEY_TYPES), default="ES256")
+    parser.add_argument("--kid", default=datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H%M%S"))
+    parser.add_argument("--activate", action="store_true", help="Sign new tokens with this key")
+    args = parser.parse_args()
+    if not args.keyset:
+        parser.error("--keyset is required when JWT_KEYSET_FILE is not set")
+
+    keyset = {"active_kid": None, "keys": []}
+    if os.path.exists(args.keyset):
+        with open(args.keyset) as f:
+            keyset = json.load(f)
+    add_key(keyset, args.alg, args.kid, args.activate)
+
+    tmp_path = f"{args.keyset}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(keyset, f, indent=2)
+    os.replace(tmp_path, args.keyset)
+    print(f"Added {args.alg} key {args.kid} to {args.keyset}" + (" (active)" if args.activate else ""))
+
+if __name__ == "__main__":
+    main()
@@ -8,20 +8,110 @@ class Settings(BaseSettings):
     # Application settings
     APP_NAME: str = "AI to API Platform"
     DEBUG: bool = True
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # "text" or "json"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_HOT_PATH_SAMPLE_RATE: float = 0.01
     API_V1_STR: str = "/api/v1"
     ENVIRONMENT: str = "development"
+    WEB_CONCURRENCY: int = 1  # server worker processes, set by gunicorn.conf.py
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str | None = None  # bearer token the scraper sends to /metrics, which answers 404 while it is unset
+    PROMETHEUS_MULTIPROC_DIR: str | None = None  # where workers share metric values, set by gunicorn.conf.py
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+    PROFILING_ENABLED: bool = True  # lets admins profile requests; no request is profiled until rules are set
+    PROFILING_MAX_PROFILES: int = 100
+    PROFILING_SAMPLE_INTERVAL_SECONDS: float = 0.001
+    PROFILING_RULES_SYNC_SECONDS: float = 5.0
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_BACKEND: str = "memory"  # or "module:Class" of a ResponseCacheBackend
+    RESPONSE_CACHE_TTL_SECONDS: float = 30.0  # also how stale another worker's entries can be
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
     
     # Security settings
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-default")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    JWT_KEYSET_FILE: str | None = None  # kid-indexed key set; signs with its active key instead of SECRET_KEY
+    JWT_KEYSET_RELOAD_SECONDS: float = 5.0
+    JWT_ACCEPT_LEGACY_SECRET: bool = True  # keep verifying kid-less tokens signed with SECRET_KEY
+    JWT_JWKS_MAX_AGE_SECONDS: int = 300
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: float = 30.0
+    BCRYPT_ROUNDS: int = 12
+    # Per process: the server workers share the cores. 0 hashes inline on the event loop
+    PASSWORD_HASH_WORKERS: int = max(1, min(4, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY") or 1)))
+    PASSWORD_HASH_MAX_PENDING: int = 32
+    PASSWORD_REHASH_ON_LOGIN: bool = True
+    STATELESS_REVOCATION: bool = True  # check signed tokens against the synced revocation list, not the DB
+    REVOCATION_SYNC_INTERVAL_SECONDS: float = 1.0
+    REVOCATION_SYNC_OVERLAP_SECONDS: float = 5.0
+    REVOCATION_MAX_STALENESS_SECONDS: float = 10.0  # past this without a sync, fall back to the DB
     
     # MongoDB settings
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "api_platform"
     MONGO_USERNAME: str | None = None
     MONGO_PASSWORD: str | None = None
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 0
+    MONGODB_MAX_IDLE_TIME_MS: int | None = None
+    MONGODB_CONNECT_TIMEOUT_MS: int = 20000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGODB_SOCKET_TIMEOUT_MS: int | None = None
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int | None = None
+    MONGODB_ENSURE_INDEXES: bool = True
+    TOKEN_RETENTION_SECONDS_AFTER_EXPIRY: int = 7 * 24 * 3600
+    USAGE_RETENTION_DAYS: int = 90
+    USAGE_MINUTE_ROLLUP_RETENTION_DAYS: int = 7  # hour rollups are kept for lifetime totals and costs
+
+    # Usage write-behind settings
+    USAGE_WRITER_ENABLED: bool = True
+    USAGE_WRITER_BATCH_SIZE: int = 500
+    USAGE_WRITER_FLUSH_INTERVAL_SECONDS: float = 1.0
+    USAGE_WRITER_MAX_QUEUE_SIZE: int = 10000
+    USAGE_WRITER_FLUSH_TIMEOUT_SECONDS: float = 10.0
+
+    # Rate limiting settings
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "auto"  # "memory" (per worker), "mongo" (shared) or "auto" (mongo with several workers)
+    RATE_LIMIT_SCOPE: str = "user"  # "token", "user" or "endpoint" (user and path)
+    RATE_LIMIT_REQUESTS: int = 600
+    RATE_LIMIT_WINDOW_SECONDS: float = 60.0
+    RATE_LIMIT_MAX_KEYS: int = 100000
     
+    # API gateway settings
+    API_CACHE_MAX_SIZE: int = 10000
+    API_CACHE_TTL_SECONDS: float = 30.0  # how long another worker's edits to an API take to apply here
+    PROXY_TIMEOUT_SECONDS: float = 60.0  # read and write, per chunk; AI upstreams can be slow to start
+    PROXY_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    PROXY_POOL_TIMEOUT_SECONDS: float = 5.0  # wait for a free connection to the upstream
+    PROXY_MAX_CONNECTIONS_PER_UPSTREAM: int = 100
+    PROXY_MAX_KEEPALIVE_PER_UPSTREAM: int = 20
+    PROXY_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    PROXY_HTTP2: bool = True  # negotiated over TLS with upstreams that support it; needs httpx[http2]
+    PROXY_COALESCE_MAX_BODY_BYTES: int = 1024 * 1024  # larger request bodies are never shared; larger responses take no more joiners
+    PROXY_ALLOWED_HOSTS: list[str] = []  # when set, APIs can only be published on these hosts; ".example.com" admits subdomains
+    PROXY_ALLOW_PRIVATE_UPSTREAMS: bool = False  # let API endpoints reach loopback, private and link-local addresses
+    PROXY_DNS_CACHE_SECONDS: float = 30.0  # how long a checked upstream address is reused
+    PROXY_METRICS_MAX_UPSTREAMS: int = 50  # upstreams labelled by host in the metrics; the others count as "other"
+    PROXY_CACHE_MAX_ENTRIES: int = 10000
+    PROXY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    UPSTREAM_CONCURRENCY_INITIAL: int = 20  # per upstream; adapts between the minimum and the pool size
+    UPSTREAM_CONCURRENCY_MIN: int = 1
+    UPSTREAM_LATENCY_TOLERANCE: float = 2.0  # slower than this times the baseline latency counts as overload
+    UPSTREAM_CONCURRENCY_BACKOFF: float = 0.9
+    UPSTREAM_QUEUE_SIZE: int = 100  # calls waiting for a slot, per upstream
+    UPSTREAM_QUEUE_TIMEOUT_SECONDS: float = 5.0
+    CIRCUIT_ERROR_THRESHOLD: float = 0.5
+    CIRCUIT_MIN_CALLS: int = 20
+    CIRCUIT_WINDOW_SECONDS: float = 10.0
+    CIRCUIT_OPEN_SECONDS: float = 10.0
+    CIRCUIT_HALF_OPEN_CALLS: int = 3
+    CATALOG_SYNC_INTERVAL_SECONDS: float = 5.0  # how long another worker's edits take to show in searches here
+    CATALOG_SYNC_OVERLAP_SECONDS: float = 5.0
+
     # Stripe settings
     STRIPE_SECRET_KEY: str = "your-stripe-secret-key"
     STRIPE_WEBHOOK_SECRET: str = "your-stripe-webhook-secret"
@@ -0,0 +1,46 @@
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from fastapi import Request
+from starlette.types import Scope
+from ..models.user import User
+from ..services.token_cache import CachedToken
+
+@dataclass(slots=True)
+class AuthContext:
+    """Everything known about the caller, resolved once per request by the auth middleware"""
+    token_value: str
+    claims: dict
+    token: CachedToken
+    user: Optional[User] = None
+
+    @property
+    def user_id(self) -> str | None:
+        return self.claims.get("user_id") or self.token.user_id
+
+@dataclass(slots=True)
+class RequestContext:
+    """State shared by the middlewares and the endpoint for the lifetime of one request.
+
+    Times are ``time.perf_counter()`` readings; the response ones are filled in as
+    the response goes out, by the usage middleware.
+    """
+    started: float = field(default_factory=time.perf_counter)
+    auth: Optional[AuthContext] = None
+    status_code: Optional[int] = None
+    first_byte: Optional[float] = None  # when the first non-empty body chunk was sent
+    finished: Optional[float] = None  # when the last body chunk was sent
+    api_id: Optional[str] = None  # the published API a proxied call went to
+
+def request_context(scope: Scope) -> RequestContext:
+    """Return the request's context, creating it in the first middleware that asks"""
+    state = scope.setdefault("state", {})
+    context = state.get("context")
+    if context is None:
+        context = state["context"] = RequestContext()
+    return context
+
+def get_auth_context(request: Request) -> Optional[AuthContext]:
+    """Return the auth context stored on the request, if the request was authenticated"""
+    context = request.scope.get("state", {}).get("context")
+    return context.auth if context is not None else None
@@ -0,0 +1,188 @@
+"""Prometheus metrics, kept by ``prometheus_client``.
+
+With several server workers, gunicorn.conf.py points ``PROMETHEUS_MULTIPROC_DIR`` at
+a shared directory before any worker imports the app. Every worker then keeps its
+values in memory-mapped files there, and ``/metrics`` aggregates all of them:
+counters and histograms are summed over every worker, gauges over the live ones.
+
+Values owned by a worker's objects (cache sizes, queue depths) are read by a
+callback. ``sampled_gauge`` and ``sampled_counter`` copy them into their metric
+every ``METRICS_FLUSH_INTERVAL_SECONDS``, and just before a scrape.
+"""
+import asyncio
+import functools
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from .config import settings
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Values = Union[float, Dict[Tuple[str, ...], float]]
+
+def _items(values: Values) -> Dict[Tuple[str, ...], float]:
+    return values if isinstance(values, dict) else {(): values}
+
+def _child(metric, labels: Tuple[str, ...]):
+    return metric.labels(*labels) if labels else metric
+
+class MetricsSampler:
+    """Copies callback values into their metrics, periodically when workers share them"""
+
+    def __init__(self, multiproc_dir: Optional[str], interval: float):
+        self.multiproc_dir = multiproc_dir
+        self.interval = interval
+        self._samplers: List[Callable[[], None]] = []
+        self._worker: Optional[asyncio.Task] = None
+
+    def add(self, sampler: Callable[[], None]) -> None:
+        self._samplers.append(sampler)
+
+    def sample(self) -> None:
+        for sampler in self._samplers:
+            try:
+                sampler()
+            except Exception as e:
+                logging.error(f"Error sampling metric: {e}")
+
+    def render(self) -> bytes:
+        """Prometheus text exposition of every metric; reads the workers' files when shared"""
+        if not self.multiproc_dir:
+            return generate_latest(REGISTRY)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=self.multiproc_dir)
+        return generate_latest(registry)
+
+    def start(self) -> None:
+        # A lone worker is sampled on each scrape; shared files must stay fresh between them
+        if self.multiproc_dir and self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Leave the final counts of this worker behind once it is gone
+        self.sample()
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+metrics_sampler = MetricsSampler(settings.PROMETHEUS_MULTIPROC_DIR, settings.METRICS_FLUSH_INTERVAL_SECONDS)
+
+def sampled_gauge(
+    name: str,
+    documentation: str,
+    function: Callable[[], Values],
+    labelnames: Sequence[str] = (),
+    multiprocess_mode: str = "livesum",
+) -> Gauge:
+    """A gauge set from ``function``, which returns the value or a dict of label value tuples to values.
+
+    ``multiprocess_mode`` "livesum" adds up the live workers (queue depths), "livemax" keeps the largest.
+    """
+    gauge = Gauge(name, documentation, labelnames, multiprocess_mode=multiprocess_mode)
+    known: set = set()
+
+    def sample() -> None:
+        values = _items(function())
+        for labels in known - values.keys():
+            # Zero first: with shared files, removing the child alone would leave its last value behind
+            _child(gauge, labels).set(0)
+            gauge.remove(*labels)
+        for labels, value in values.items():
+            _child(gauge, labels).set(value)
+        known.clear()
+        known.update(values)
+
+    metrics_sampler.add(sample)
+    return gauge
+
+def sampled_counter(name: str, documentation: str, function: Callable[[], Values], labelnames: Sequence[str] = ()) -> Counter:
+    """A counter advanced to the running total ``function`` returns, like ``sampled_gauge``"""
+    counter = Counter(name, documentation, labelnames)
+    last: Dict[Tuple[str, ...], float] = {}
+
+    def sample() -> None:
+        for labels, value in _items(function()).items():
+            if value > last.get(labels, 0):
+                _child(counter, labels).inc(value - last.get(labels, 0))
+            last[labels] = value
+
+    metrics_sampler.add(sample)
+    return counter
+
+class BoundedLabel:
+    """Keeps the first ``max_values`` distinct values of a label and maps any later one to "other".
+
+    For labels taken from user input, such as upstream hosts: every value is a time series.
+    """
+
+    def __init__(self, max_values: int):
+        self.max_values = max_values
+        self._values: set = set()
+
+    def __call__(self, value: str) -> str:
+        if value in self._values:
+            return value
+        if len(self._values) < self.max_values:
+            self._values.add(value)
+            return value
+        return "other"
+
+def timed(histogram: Histogram, *labels):
+    """Decorate a coroutine function to observe its duration in ``histogram``"""
+    def decorator(func):
+        child = histogram.labels(*labels)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def db_operation(func):
+    """Time a service method in ``db_operation_duration_seconds``, labelled by class and method"""
+    parts = func.__qualname__.split(".")
+    service = parts[-2] if len(parts) > 1 else func.__module__.rsplit(".", 1)[-1]
+    return timed(DB_OPERATION_SECONDS, service, parts[-1])(func)
+
+# Request path
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to the end of the response body", ["method", "route"], buckets=DEFAULT_BUCKETS
+)
+HTTP_FIRST_BYTE_SECONDS = Histogram(
+    "http_response_first_byte_seconds", "Time to the first byte of the response body", ["method", "route"], buckets=DEFAULT_BUCKETS
+)
+MIDDLEWARE_SECONDS = Histogram(
+    "middleware_duration_seconds",
+    "Time spent in each middleware itself, excluding the layers it wraps",
+    ["middleware"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+# Dependencies
+DB_OPERATION_SECONDS = Histogram(
+    "db_operation_duration_seconds", "Duration of service database calls", ["service", "operation"], buckets=DEFAULT_BUCKETS
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt time per operation, including the wait for a pool thread",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "Logins turned away because the bcrypt pool was full")
@@ -0,0 +1,152 @@
+"""Per-request profiling: a stack sampler and a breakdown of where the request's time went.
+
+A profiled request carries a ``Profile`` in a context variable from the outermost
+middleware down to the endpoint. Every layer adds its own time to a named stage:
+the middlewares through ``HTTPMiddleware``, and routes declared with
+``ProfiledRoute`` split theirs into dependency resolution, the handler and response
+serialization.
+
+While at least one profiled request is in flight, a thread samples the event loop's
+stack every ``interval`` seconds. The event loop interleaves requests, so the stacks
+of a profile include whatever else the worker ran meanwhile. Samples that land in
+the selector are time spent waiting on I/O.
+"""
+import contextvars
+import datetime
+import functools
+import inspect
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+_current_profile: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+
+@dataclass(slots=True)
+class Profile:
+    method: str
+    path: str
+    reason: str  # the rule that selected the request: "endpoint", "user" or "sample"
+    user_id: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started_at: datetime.datetime = field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc))
+    status_code: Optional[int] = None
+    duration: float = 0.0
+    stages: Dict[str, float] = field(default_factory=dict)
+    stacks: Dict[str, int] = field(default_factory=dict)
+    # Set by the endpoint wrapper, read back by ProfiledRoute
+    handler_started: Optional[float] = None
+    handler_finished: Optional[float] = None
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+def folded(stacks: Iterable[Tuple[str, int]]) -> str:
+    """Collapsed stacks, one ``frame;frame;frame count`` line each, as read by flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks))
+
+def current_profile() -> Optional[Profile]:
+    """The profile of the request being handled, if it is profiled"""
+    return _current_profile.get()
+
+def _folded_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class StackSampler:
+    """Samples the event loop thread's stack into every attached profile"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._profiles: Tuple[Profile, ...] = ()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def attach(self, profile: Profile) -> None:
+        """Start sampling the calling thread into ``profile``"""
+        with self._lock:
+            self._profiles += (profile,)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(threading.get_ident(),), name="profiler-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def detach(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles = tuple(p for p in self._profiles if p is not profile)
+
+    def _run(self, thread_id: int) -> None:
+        # Exits once no profile is attached, so an idle worker pays nothing
+        while True:
+            # Under the lock: a detached profile is never written to again
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stack = _folded_stack(frame)
+                    for profile in self._profiles:
+                        profile.stacks[stack] = profile.stacks.get(stack, 0) + 1
+                frame = None
+            time.sleep(self.interval)
+
+def begin_profile(profile: Profile, sampler: StackSampler) -> contextvars.Token:
+    sampler.attach(profile)
+    return _current_profile.set(profile)
+
+def end_profile(profile: Profile, sampler: StackSampler, token: contextvars.Token) -> None:
+    sampler.detach(profile)
+    _current_profile.reset(token)
+
+def _timed_endpoint(endpoint):
+    if not inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return await endpoint(*args, **kwargs)
+        profile.handler_started = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            profile.handler_finished = time.perf_counter()
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """Route that reports dependency resolution, handler and serialization time to the request's profile"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request: Request):
+            profile = _current_profile.get()
+            if profile is None:
+                return await handler(request)
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                end = time.perf_counter()
+                if profile.handler_started is None:
+                    # A dependency failed before the handler ran
+                    profile.add_stage("dependencies", end - start)
+                else:
+                    profile.add_stage("dependencies", profile.handler_started - start)
+                    profile.add_stage("handler", profile.handler_finished - profile.handler_started)
+                    profile.add_stage("serialization", end - profile.handler_finished)
+        return profiled_handler
@@ -0,0 +1,17 @@
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+def _default(value: Any) -> Any:
+    # ObjectId, Decimal128 and the like: encoded as their string form
+    return str(value)
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded by orjson, for content that is already plain dicts and lists.
+
+    Returning it from an endpoint bypasses ``response_model`` validation, so only use
+    it for documents whose shape the service guarantees.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,90 @@
+"""Route class serving idempotent GET endpoints from the response cache.
+
+An endpoint opts in with ``@cache_response(...)``. Its responses are cached per
+caller, keyed by user, path and query string. On a hit the route answers before
+resolving any dependency, so neither the user nor the data is loaded from the
+database. Every response carries an ``ETag``, and a matching ``If-None-Match``
+gets a ``304``. Entries are tagged, e.g. ``tokens:{user_id}``, and the services
+invalidate the tags whose data they change.
+"""
+import hashlib
+from typing import NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+from fastapi import Request, Response
+from .config import settings
+from .context import get_auth_context
+from .profiling import ProfiledRoute
+from ..services.response_cache import RESPONSE_CACHE_REQUESTS, CachedResponse, response_cache
+
+class CachePolicy(NamedTuple):
+    tags: Tuple[str, ...]
+    ttl: Optional[float]
+
+def cache_response(*tags: str, ttl: Optional[float] = None):
+    """Cache an endpoint's responses; ``tags`` may refer to the caller as ``{user_id}``"""
+    def decorator(endpoint):
+        endpoint.__response_cache__ = CachePolicy(tags, ttl)
+        return endpoint
+    return decorator
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # Weak comparison, as If-None-Match requires
+    candidates = {value.strip().removeprefix("W/") for value in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+class CachedRoute(ProfiledRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        # Read before APIRoute.__init__, which builds the route handler
+        self.cache_policy: Optional[CachePolicy] = getattr(endpoint, "__response_cache__", None)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        policy = self.cache_policy
+        if policy is None or not settings.RESPONSE_CACHE_ENABLED:
+            return handler
+        ttl = settings.RESPONSE_CACHE_TTL_SECONDS if policy.ttl is None else policy.ttl
+        requests = {outcome: RESPONSE_CACHE_REQUESTS.labels(self.name, outcome) for outcome in ("hit", "not_modified", "miss")}
+
+        async def cached_handler(request: Request):
+            auth = get_auth_context(request)
+            if request.method != "GET" or auth is None or not auth.user_id:
+                return await handler(request)
+
+            key = f"{auth.user_id}|{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}"
+            cached = await response_cache.get(key)
+            if cached is not None:
+                if etag_matches(request, cached.etag):
+                    requests["not_modified"].inc()
+                    return _not_modified(cached.etag)
+                requests["hit"].inc()
+                return Response(
+                    cached.body,
+                    media_type=cached.media_type,
+                    headers={"ETag": cached.etag, "Cache-Control": "private, no-cache", "X-Cache": "hit"},
+                )
+
+            requests["miss"].inc()
+            response = await handler(request)
+            body = getattr(response, "body", None)
+            if response.status_code != 200 or body is None:
+                return response
+            etag = make_etag(body)
+            tags = [tag.format(user_id=auth.user_id) for tag in policy.tags]
+            await response_cache.set(key, CachedResponse(body, response.media_type, etag), tags, ttl)
+            if etag_matches(request, etag):
+                return _not_modified(etag)
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.headers["X-Cache"] = "miss"
+            return response
+        return cached_handler
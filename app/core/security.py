@@ -1,12 +1,17 @@
+import asyncio
 import datetime
-from typing import Optional
-from jose import JWTError, jwt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException, status
+from .config import settings
+from .keys import HMACKey, InvalidTokenError, KeyStore
+from .metrics import PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS, sampled_gauge
+import time
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -16,6 +21,17 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# The shared secret keeps verifying kid-less tokens once a key set takes over signing
+key_store = KeyStore(
+    path=settings.JWT_KEYSET_FILE,
+    legacy_key=(
+        HMACKey(None, SECRET_KEY.encode(), ALGORITHM or "HS256")
+        if SECRET_KEY and (not settings.JWT_KEYSET_FILE or settings.JWT_ACCEPT_LEGACY_SECRET)
+        else None
+    ),
+    reload_interval=settings.JWT_KEYSET_RELOAD_SECONDS,
+)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -24,6 +40,82 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """Runs bcrypt on a small thread pool so hashing never blocks the event loop.
+
+    bcrypt releases the GIL while it works, so threads give real parallelism. At most
+    ``max_pending`` operations are running or waiting at once: hashing for
+    registration waits for a slot, logins are turned away while the pool is full so
+    a burst of them cannot build an unbounded backlog.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pending = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self._slots is not None and self._slots.locked()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created on first use, so a forked worker never inherits another process' threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, operation: str, func, *args, admit: bool = False):
+        start = time.perf_counter()
+        if self.workers <= 0:
+            result = func(*args)
+        else:
+            loop = asyncio.get_running_loop()
+            if self._slots is None or self._loop is not loop:
+                self._slots, self._loop = asyncio.Semaphore(self.max_pending), loop
+            if admit and self._slots.locked():
+                PASSWORD_HASH_REJECTED.inc()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many concurrent logins, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+            try:
+                async with self._slots:
+                    result = await loop.run_in_executor(self._get_executor(), func, *args)
+            finally:
+                self.pending -= 1
+        PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - start)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", pwd_context.hash, password)
+
+    async def verify_for_login(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Check a login password; also returns a new hash if the stored one uses outdated parameters"""
+        return await self._run("verify", pwd_context.verify_and_update, password, hashed_password, admit=True)
+
+    def _forget_after_fork(self) -> None:
+        # The pool's threads do not survive fork; the child starts its own on first use
+        self._executor = None
+        self._slots = self._loop = None
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._slots = self._loop = None
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+os.register_at_fork(after_in_child=password_hasher._forget_after_fork)
+sampled_gauge("password_hash_pending", "bcrypt operations running or waiting for a pool thread", lambda: password_hasher.pending)
+
 def create_access_token(data: dict, expires_delta: Optional[datetime.timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -32,14 +124,12 @@ def create_access_token(data: dict, expires_delta: Optional[datetime.timedelta]
         expire = datetime.datetime.now(datetime.UTC) + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return key_store.current().encode(to_encode)
 
 def verify_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+        return key_store.current().decode(token)
+    except InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -0,0 +1,91 @@
+import logging
+from typing import Dict, Iterable, List, Optional
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from ..core.config import settings
+
+def _index(keys, name: str, **options) -> IndexModel:
+    # Ignored by MongoDB >= 4.2, which always builds without blocking the collection
+    return IndexModel(keys, name=name, background=True, **options)
+
+def index_registry() -> Dict[str, List[IndexModel]]:
+    """Indexes backing every query the services issue, by collection"""
+    return {
+        "users": [
+            _index([("email", ASCENDING)], "email_unique", unique=True),
+            _index([("id", ASCENDING)], "id"),
+        ],
+        "tokens": [
+            # Not unique: two logins in the same second produce the same JWT
+            _index([("token", ASCENDING)], "token"),
+            _index([("id", ASCENDING)], "id"),
+            _index([("user_id", ASCENDING)], "user_id"),
+            _index(
+                [("expires_at", ASCENDING)],
+                "expires_at_ttl",
+                expireAfterSeconds=settings.TOKEN_RETENTION_SECONDS_AFTER_EXPIRY
+            ),
+        ],
+        "usage": [
+            # Also the keyset order of the paginated listing and the export
+            _index([("user_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], "user_id_timestamp"),
+            _index([("api_id", ASCENDING)], "api_id", sparse=True),
+            _index(
+                [("timestamp", ASCENDING)],
+                "timestamp_ttl",
+                expireAfterSeconds=settings.USAGE_RETENTION_DAYS * 24 * 3600
+            ),
+        ],
+        "usage_rollups": [
+            _index(
+                [("user_id", ASCENDING), ("endpoint", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+                "bucket_unique",
+                unique=True
+            ),
+            _index([("user_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], "user_id_bucket"),
+            # Minute buckets only serve recent windows; hour buckets carry the lifetime costs
+            _index(
+                [("bucket", ASCENDING)],
+                "minute_bucket_ttl",
+                expireAfterSeconds=settings.USAGE_MINUTE_ROLLUP_RETENTION_DAYS * 24 * 3600,
+                partialFilterExpression={"granularity": "minute"}
+            ),
+        ],
+        "usage_totals": [
+            _index([("user_id", ASCENDING)], "user_id_unique", unique=True),
+        ],
+        "token_revocations": [
+            _index([("jti", ASCENDING)], "jti_unique", unique=True),
+            _index([("revoked_at", ASCENDING)], "revoked_at"),
+            _index([("expires_at", ASCENDING)], "expires_at_ttl", expireAfterSeconds=0),
+        ],
+        "apis": [
+            _index([("id", ASCENDING)], "id_unique", unique=True),
+            _index([("owner_id", ASCENDING), ("created_at", ASCENDING)], "owner_id_created_at"),
+            _index([("status", ASCENDING), ("created_at", ASCENDING)], "status_created_at"),
+            _index([("updated_at", ASCENDING)], "updated_at"),
+        ],
+        "api_deletions": [
+            # Only replayed by catalog syncs; a worker starting later loads the whole catalog
+            _index([("deleted_at", ASCENDING)], "deleted_at_ttl", expireAfterSeconds=24 * 3600),
+        ],
+        "request_profiles": [
+            _index([("id", ASCENDING)], "id_unique", unique=True),
+            _index([("started_at", ASCENDING)], "started_at"),
+        ],
+        "rate_limits": [
+            _index([("expires_at", ASCENDING)], "expires_at_ttl", expireAfterSeconds=0),
+        ],
+    }
+
+async def ensure_indexes(db, collections: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """Create any missing index from the registry; existing ones are left untouched"""
+    registry = index_registry()
+    created = {}
+    for name in collections or registry:
+        try:
+            created[name] = await db[name].create_indexes(registry[name])
+        except OperationFailure as e:
+            # e.g. an index that exists with other options, or duplicates blocking a unique index
+            logging.error(f"Could not ensure indexes on {name}: {e}")
+    return created
@@ -1,17 +1,35 @@
+import logging
+import os
 from typing import Optional
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from ..core.config import settings
 
 class MongoDB:
-    client: Optional[MongoClient] = None
+    client: Optional[AsyncIOMotorClient] = None
     db = None  # Remove type hint as it's causing issues with bool check
 
+    @classmethod
+    def client_options(cls) -> dict:
+        """Connection pool and timeout options passed to the driver"""
+        options = {
+            "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+            "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+            "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+            "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            "socketTimeoutMS": settings.MONGODB_SOCKET_TIMEOUT_MS,
+            "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        }
+        return {key: value for key, value in options.items() if value is not None}
+
     @classmethod
     def connect_to_mongo(cls):
         if cls.client is None:
-            cls.client = MongoClient(settings.mongodb_url)
+            # The motor client is lazy: sockets are opened from the pool on first use,
+            # on the running event loop, so this is safe to call outside of a coroutine.
+            cls.client = AsyncIOMotorClient(settings.mongodb_url, **cls.client_options())
             cls.db = cls.client[settings.MONGODB_DB_NAME]
-            print("Connected to MongoDB!")
+            logging.info("Connected to MongoDB!")
 
     @classmethod
     def close_mongo_connection(cls):
@@ -19,7 +37,13 @@ class MongoDB:
             cls.client.close()
             cls.client = None
             cls.db = None
-            print("MongoDB connection closed!")
+            logging.info("MongoDB connection closed!")
+
+    @classmethod
+    def _forget_after_fork(cls):
+        # A client must not be shared across fork: a forked worker opens its own pool
+        cls.client = None
+        cls.db = None
 
     @classmethod
     def get_db(cls):
@@ -27,5 +51,7 @@ class MongoDB:
             cls.connect_to_mongo()
         return cls.db
 
+os.register_at_fork(after_in_child=MongoDB._forget_after_fork)
+
 def get_database():
-    return MongoDB.get_db() 
\ No newline at end of file
+    return MongoDB.get_db()
@@ -2,11 +2,15 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from typing import Optional
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
 async def get_optional_user(token: Optional[str] = Depends(oauth2_scheme), request: Request = None):
     if request and (request.url.path.startswith("/docs") or request.url.path.startswith("/openapi.json")):
         return None  # Allow access to docs without authentication
+    if request and request.url.path.startswith("/api/v1/auth"):
+        return None  # Registration and login happen before a token exists
+    if request and request.url.path == "/metrics":
+        return None  # Scraped by the monitoring system, which presents METRICS_TOKEN
     if token:
         # Here you would normally verify the token and return the user
         # For now, just return a placeholder
@@ -1,23 +1,62 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from .db.mongodb import MongoDB
+from .db.indexes import ensure_indexes
+from .core.config import settings
+from .core.log import configure_logging, shutdown_logging
+from .core.security import key_store, password_hasher
+from .core.metrics import metrics_sampler
 from .api.v1.router import api_router
-from .middleware.usage_tracker import track_usage
-from .middleware.auth import verify_token_middleware
+from .api.metrics import router as metrics_router
+from .middleware.usage_tracker import UsageMiddleware
+from .middleware.auth import AuthMiddleware
+from .middleware.rate_limit import RateLimitMiddleware
+from .middleware.profiling import ProfilingMiddleware
 from .dependencies import get_optional_user
+from .services.usage_writer import usage_writer
+from .services.revocation import revocation_list
+from .services.profiling import profiler
+from .services.proxy import upstream_proxy
+from .services.catalog_index import catalog_index
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    configure_logging()
+    key_store.reload()  # Fail fast on a broken key set instead of on the first login
     MongoDB.connect_to_mongo()
+    if settings.MONGODB_ENSURE_INDEXES:
+        await ensure_indexes(MongoDB.get_db())
+    if settings.USAGE_WRITER_ENABLED:
+        usage_writer.start()
+    if settings.STATELESS_REVOCATION:
+        revocation_list.start()
+    if settings.PROFILING_ENABLED:
+        profiler.start()
+    catalog_index.start()
+    metrics_sampler.start()
     yield
-    # Shutdown
+    # Shutdown: flush buffered usage before the connection goes away
+    await profiler.stop()
+    await revocation_list.stop()
+    await catalog_index.stop()
+    await upstream_proxy.close()
+    await usage_writer.stop()
+    await metrics_sampler.stop()
     MongoDB.close_mongo_connection()
+    password_hasher.shutdown()
+    shutdown_logging()
 
 app = FastAPI(lifespan=lifespan, dependencies=[Depends(get_optional_user)])
 
-# Add middlewares in correct order
-app.middleware("http")(verify_token_middleware)  # Auth first
-app.middleware("http")(track_usage)  # Then usage tracking
+# Middlewares wrap each other: the last one added runs first. They are raw ASGI
+# classes sharing a per-request context; none of them buffers the response.
+app.add_middleware(RateLimitMiddleware)  # Innermost: needs the auth context
+app.add_middleware(AuthMiddleware)  # Resolves the auth context
+app.add_middleware(UsageMiddleware)  # Times and meters the whole response
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)  # Outermost: sees the time of every other layer
 
-app.include_router(api_router, prefix="/api/v1") 
\ No newline at end of file
+app.include_router(api_router, prefix="/api/v1")
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router) 
\ No newline at end of file
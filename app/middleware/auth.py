@@ -1,61 +1,85 @@
-from fastapi import Request, HTTPException, status
+from fastapi import status
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import Receive, Scope, Send
+from typing import Optional
 from ..services.token_service import TokenService
+from ..services.revocation import revocation_list
+from ..core.config import settings
 from ..core.security import verify_token
-from starlette.responses import JSONResponse
+from ..core.context import AuthContext, request_context
+from ..core.log import get_hot_path_logger, redact_token
+from .base import CallNext, HTTPMiddleware
 import logging
 
-async def verify_token_middleware(request: Request, call_next):
-    # Skip auth for auth endpoints
-    if request.url.path.startswith("/api/v1/auth"):
-        return await call_next(request)
+hot_logger = get_hot_path_logger(__name__)
+
+def _unauthorized(detail: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"detail": detail},
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def resolve_auth(auth_header: Optional[str]) -> AuthContext | JSONResponse:
+    """The caller's auth context, or the 401 response to send instead"""
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return _unauthorized("Not authenticated")
+
+    token_str = auth_header.split(" ")[1]
+    token_service = TokenService()
 
     try:
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Not authenticated"},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        token_str = auth_header.split(" ")[1]
-        logging.info(f"Checking token: {token_str[:10]}...")
-        
-        # First check if token exists and is active in database
-        token_service = TokenService()
-        token_doc = token_service.get_token_by_value(token_str)
-        logging.info(f"Found token doc: {token_doc.model_dump() if token_doc else None}")
-        
+        claims = verify_token(token_str)
+    except Exception as e:
+        logging.error(f"JWT verification failed: {e}")
+        return _unauthorized("Token is invalid")
+
+    # Tokens that carry a jti are checked against the synced revocation list, without a DB read
+    token_doc = None
+    if settings.STATELESS_REVOCATION and revocation_list.fresh:
+        token_doc = token_service.token_from_claims(claims)
+        if token_doc and token_doc.token_id in revocation_list:
+            return _unauthorized("Token is invalid or revoked")
+
+    if token_doc is None:
+        # Otherwise check that the token exists and is active in the database
+        token_doc = await token_service.get_cached_token(token_str)
+        hot_logger.debug(
+            "Checked token %s: %s",
+            redact_token(token_str),
+            token_doc.token_id if token_doc else "not found"
+        )
+
         if not token_doc:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Token not found"},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-            
-        if not token_doc.is_active:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Token is invalid or revoked"},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        # Then verify JWT validity
+            return _unauthorized("Token not found")
+
+        # The cache is per worker; revocations made by other workers arrive through the list
+        if not token_doc.is_active or token_doc.token_id in revocation_list:
+            return _unauthorized("Token is invalid or revoked")
+
+    return AuthContext(token_value=token_str, claims=claims, token=token_doc)
+
+class AuthMiddleware(HTTPMiddleware):
+    """Verifies the bearer token and resolves the auth context, or answers 401"""
+    name = "auth"
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send, call_next: CallNext) -> None:
+        # Skip auth for auth endpoints and the metrics scrape, which checks METRICS_TOKEN itself
+        path = scope["path"]
+        if path.startswith("/api/v1/auth") or path == "/metrics":
+            await call_next(scope, receive, send)
+            return
+
         try:
-            verify_token(token_str)
+            auth = await resolve_auth(Headers(scope=scope).get("Authorization"))
         except Exception as e:
-            logging.error(f"JWT verification failed: {e}")
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Token is invalid"},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        return await call_next(request)
-    except Exception as e:
-        logging.error(f"Auth middleware error: {e}")
-        return JSONResponse(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            content={"detail": str(e)},
-            headers={"WWW-Authenticate": "Bearer"},
-        ) 
\ No newline at end of file
+            logging.error(f"Auth middleware error: {e}")
+            auth = _unauthorized(str(e))
+        if isinstance(auth, JSONResponse):
+            await auth(scope, receive, send)
+            return
+
+        # Share the decoded claims and token with the usage tracker and dependencies
+        request_context(scope).auth = auth
+        await call_next(scope, receive, send)
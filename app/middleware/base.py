@@ -0,0 +1,55 @@
+import time
+from typing import Awaitable, Callable, Optional
+from starlette.types import ASGIApp, Receive, Scope, Send
+from ..core.metrics import MIDDLEWARE_SECONDS
+from ..core.profiling import current_profile
+
+CallNext = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+class HTTPMiddleware:
+    """A raw ASGI middleware for HTTP requests; other scopes go straight to the app.
+
+    Subclasses implement ``handle`` and pass the request on with ``call_next``, with
+    a wrapped ``send`` if they need to see or change the response. Nothing is
+    buffered: the response streams through every layer as the endpoint produces it.
+
+    With a ``name``, the time a middleware spends itself, leaving out the layers it
+    wraps, is observed in ``middleware_duration_seconds`` and added to the request's
+    profile, if it is being profiled.
+    """
+    name: Optional[str] = None
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._seconds = MIDDLEWARE_SECONDS.labels(self.name) if self.name else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._seconds is None:
+            await self.handle(scope, receive, send, self.app)
+            return
+
+        downstream = 0.0
+
+        async def call_next(scope: Scope, receive: Receive, send: Send) -> None:
+            nonlocal downstream
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                downstream += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            await self.handle(scope, receive, send, call_next)
+        finally:
+            elapsed = time.perf_counter() - start - downstream
+            self._seconds.observe(elapsed)
+            profile = current_profile()
+            if profile is not None:
+                profile.add_stage(self.name, elapsed)
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send, call_next: CallNext) -> None:
+        raise NotImplementedError
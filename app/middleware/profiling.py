@@ -0,0 +1,57 @@
+import logging
+import time
+from typing import Optional
+from fastapi import Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import Message, Receive, Scope, Send
+from ..core.context import request_context
+from ..core.profiling import Profile, begin_profile, end_profile
+from ..services.profiling import profiler
+from .base import CallNext, HTTPMiddleware
+
+class ProfilingMiddleware(HTTPMiddleware):
+    """Profiles the requests selected by the admin's rules, response streaming included"""
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send, call_next: CallNext) -> None:
+        # One attribute check unless an admin has set profiling rules
+        reason = profiler.match(Request(scope)) if profiler.active else None
+        if reason is None:
+            await call_next(scope, receive, send)
+            return
+
+        profile = Profile(method=scope["method"], path=scope["path"], reason=reason)
+        context = request_context(scope)
+        kept: Optional[bool] = None
+
+        def keep() -> bool:
+            # The auth middleware, inside this one, has resolved the caller by now
+            nonlocal kept
+            if kept is None:
+                profile.user_id = context.auth.user_id if context.auth is not None else None
+                kept = profiler.keep(reason, profile.user_id)
+            return kept
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                if keep():
+                    # Known up front; the profile is saved once the response is complete
+                    MutableHeaders(scope=message)["X-Profile-Id"] = profile.id
+            await send(message)
+
+        token = begin_profile(profile, profiler.sampler)
+        start = time.perf_counter()
+        try:
+            await call_next(scope, receive, send_with_id)
+        finally:
+            profile.duration = time.perf_counter() - start
+            end_profile(profile, profiler.sampler, token)
+            # Routing, exception handlers and the middleware plumbing itself
+            profile.add_stage("other", max(0.0, profile.duration - sum(profile.stages.values())))
+
+        if not keep():
+            return
+        profile.status_code = context.status_code
+        try:
+            await profiler.save(profile)
+        except Exception as e:
+            logging.error(f"Error saving request profile: {e}")
@@ -0,0 +1,62 @@
+from fastapi import Request, status
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import Message, Receive, Scope, Send
+import math
+from ..core.config import settings
+from ..core.context import get_auth_context
+from ..services.rate_limiter import RateLimitResult, rate_limit_backend
+from .base import CallNext, HTTPMiddleware
+
+def rate_limit_key(request: Request) -> str:
+    """Who a request is counted against, per RATE_LIMIT_SCOPE"""
+    auth = get_auth_context(request)
+    if auth is None:
+        # Unauthenticated calls (login, registration) are limited per client address
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+    if settings.RATE_LIMIT_SCOPE == "token":
+        return f"token:{auth.token.token_id}"
+    if settings.RATE_LIMIT_SCOPE == "endpoint":
+        return f"user:{auth.user_id}:{request.method}:{request.url.path}"
+    return f"user:{auth.user_id}"
+
+def rate_limit_headers(result: RateLimitResult) -> dict:
+    headers = {
+        "RateLimit-Limit": str(result.limit),
+        "RateLimit-Remaining": str(result.remaining),
+        "RateLimit-Reset": str(math.ceil(result.reset_after)),
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(math.ceil(result.retry_after))
+    return headers
+
+class RateLimitMiddleware(HTTPMiddleware):
+    """Counts the request against its caller's limit; answers 429 once it is used up"""
+    name = "rate_limit"
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send, call_next: CallNext) -> None:
+        if not settings.RATE_LIMIT_ENABLED:
+            await call_next(scope, receive, send)
+            return
+
+        result = await rate_limit_backend.hit(
+            rate_limit_key(Request(scope)),
+            settings.RATE_LIMIT_REQUESTS,
+            settings.RATE_LIMIT_WINDOW_SECONDS
+        )
+        headers = rate_limit_headers(result)
+        if not result.allowed:
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={"detail": "Rate limit exceeded"},
+                headers=headers,
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await call_next(scope, receive, send_with_headers)
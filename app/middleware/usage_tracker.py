@@ -1,62 +1,93 @@
 from fastapi import Request
+from starlette.types import Message, Receive, Scope, Send
 import time
+import datetime
 import logging
-from ..db.mongodb import MongoDB
-from ..models.usage import APIUsage
+from ..models.usage import UsageRecord
 from ..services.token_service import TokenService
 from ..services.usage_service import UsageService
-from ..core.security import verify_token
-
-async def track_usage(request: Request, call_next):
-    # Start timing
-    start_time = time.time()
-    
-    # Initialize variables
-    token_str = None
-    token_id = None
-    user_id = None
-    
-    # Get token from authorization header
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Bearer "):
-        token_str = auth_header.split(" ")[1]
-        try:
-            # Get user_id from token payload
-            payload = verify_token(token_str)
-            user_id = payload.get("user_id")
-            
-            # Get token details
-            token_service = TokenService()
-            token_doc = token_service.get_token_by_value(token_str)
-            if token_doc:
-                token_id = token_doc.id
-                token_service.update_last_used(token_str)
-        except Exception as e:
-            logging.error(f"Error processing token: {e}")
-            pass
-    
-    # Process request
-    response = await call_next(request)
-    
-    # Calculate response time
-    response_time = (time.time() - start_time) * 1000
-    
-    if user_id and token_str:
-        # Create and store usage record
+from ..services.usage_writer import usage_writer
+from ..core.context import RequestContext, request_context
+from ..core.metrics import HTTP_FIRST_BYTE_SECONDS, HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+from .base import CallNext, HTTPMiddleware
+
+def _route_template(request: Request) -> str:
+    """The matched route's path with its parameters put back, e.g. ``/api/v1/tokens/{token_id}``"""
+    if request.scope.get("route") is None:
+        return "unmatched"
+    # The route in the scope carries the path without its router prefixes
+    path = request.url.path
+    for name, value in request.scope.get("path_params", {}).items():
+        head, sep, tail = path.rpartition(f"/{value}")
+        if sep:
+            path = f"{head}/{{{name}}}{tail}"
+    return path
+
+class UsageMiddleware(HTTPMiddleware):
+    """Times the response as it streams out, to its first byte and to its end, and meters it"""
+    name = "usage"
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send, call_next: CallNext) -> None:
+        context = request_context(scope)
+
+        async def timed_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                context.status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                if context.first_byte is None and message.get("body"):
+                    context.first_byte = time.perf_counter()
+                if not message.get("more_body", False):
+                    context.finished = time.perf_counter()
+            await send(message)
+
         try:
-            usage = APIUsage(
-                user_id=user_id,
-                endpoint=str(request.url.path),
-                method=request.method,
-                status_code=response.status_code,
-                response_time=response_time,
-                token=token_str,
-                token_id=token_id
-            )
-            
-            usage_service = UsageService()
-            usage_service.create_usage(usage)
-        except Exception as e:
-            logging.error(f"Error tracking usage: {e}")
-    
-    return response 
\ No newline at end of file
+            await call_next(scope, receive, timed_send)
+        finally:
+            if context.finished is None:
+                # The app failed, or the client went away, before the end of the body
+                context.finished = time.perf_counter()
+            await self.record(Request(scope), context)
+
+    async def record(self, request: Request, context: RequestContext) -> None:
+        # A request that failed without a response gets a 500 from the server error handler
+        status_code = context.status_code or 500
+        elapsed = context.finished - context.started
+
+        # Label by route template, not raw path, to keep the number of series bounded
+        route_path = _route_template(request)
+        HTTP_REQUESTS.labels(request.method, route_path, status_code).inc()
+        HTTP_REQUEST_SECONDS.labels(request.method, route_path).observe(elapsed)
+        HTTP_FIRST_BYTE_SECONDS.labels(request.method, route_path).observe(
+            (context.first_byte or context.finished) - context.started
+        )
+
+        # The auth middleware runs inside this one and leaves the verified token in the context
+        auth = context.auth
+        if auth and auth.user_id:
+            # Create and store usage record
+            try:
+                # Built on every request from trusted values: the unvalidated record
+                usage = UsageRecord(
+                    user_id=auth.user_id,
+                    endpoint=str(request.url.path),
+                    method=request.method,
+                    status_code=status_code,
+                    response_time=elapsed * 1000,
+                    token=auth.token_value,
+                    token_id=auth.token.token_id,
+                    # Stamp the record now, it may be written to the database later
+                    timestamp=datetime.datetime.now(datetime.timezone.utc),
+                    api_id=context.api_id,
+                    route=route_path
+                )
+
+                if usage_writer.running:
+                    # Batched by the background writer, off the response path
+                    usage_writer.submit(usage)
+                else:
+                    token_service = TokenService()
+                    await token_service.update_last_used(auth.token_value)
+                    usage_service = UsageService()
+                    await usage_service.create_usage(usage)
+            except Exception as e:
+                logging.error(f"Error tracking usage: {e}")
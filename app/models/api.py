@@ -0,0 +1,23 @@
+from pydantic import BaseModel, ConfigDict, Field
+import datetime
+
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+class API(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str | None = None
+    name: str
+    description: str = ""
+    endpoint: str  # base URL of the upstream; calls are forwarded below it
+    method: str = "POST"
+    version: str = "1.0"
+    owner_id: str
+    pricing_type: str = "free"  # "free", "pay-per-call" or "subscription"
+    price: float = 0.0
+    status: str = "active"  # "active" or "disabled"; only active APIs can be called
+    coalesce: bool = False  # opt-in: identical calls in flight share one upstream request
+    cache_ttl_seconds: float = 0.0  # how long identical calls are answered from the cache; 0 disables it
+    created_at: datetime.datetime = Field(default_factory=_utc_now)
+    updated_at: datetime.datetime = Field(default_factory=_utc_now)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 import datetime
 
 class Token(BaseModel):
@@ -8,7 +8,8 @@ class Token(BaseModel):
     user_id: str
     token: str
     is_active: bool = True
-    created_at: datetime.datetime = datetime.datetime.now(datetime.timezone.utc)
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc))
     expires_at: datetime.datetime
     last_used: datetime.datetime | None = None
-    description: str = "Login token" 
\ No newline at end of file
+    description: str = "Login token"
+
@@ -1,6 +1,10 @@
-from pydantic import BaseModel, ConfigDict
+from dataclasses import dataclass, field
+from pydantic import BaseModel, ConfigDict, Field
 import datetime
 
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
 class APIUsage(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     
@@ -12,4 +16,65 @@ class APIUsage(BaseModel):
     method: str = "GET"
     status_code: int = 200
     response_time: float
-    timestamp: datetime.datetime = datetime.datetime.now(datetime.timezone.utc) 
\ No newline at end of file
+    timestamp: datetime.datetime = Field(default_factory=_utc_now)
+    api_id: str | None = None  # set on calls proxied to a published API
+    route: str | None = None  # matched route template, e.g. ``/api/v1/tokens/{token_id}``
+
+    def to_document(self) -> dict:
+        return self.model_dump()
+
+@dataclass(slots=True)
+class UsageRecord:
+    """Unvalidated usage record for the hot paths: one per request, and bulk reads.
+
+    Same fields and document shape as ``APIUsage``, built about five times faster.
+    Only build it from values the application produced itself or read back from the
+    usage collection.
+    """
+    user_id: str
+    token: str
+    endpoint: str
+    response_time: float
+    token_id: str | None = None
+    method: str = "GET"
+    status_code: int = 200
+    timestamp: datetime.datetime = field(default_factory=_utc_now)
+    id: str | None = None
+    api_id: str | None = None
+    route: str | None = None
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "UsageRecord":
+        return cls(
+            doc["user_id"],
+            doc["token"],
+            doc["endpoint"],
+            doc["response_time"],
+            doc.get("token_id"),
+            doc.get("method", "GET"),
+            doc.get("status_code", 200),
+            doc["timestamp"],
+            doc.get("id"),
+            doc.get("api_id"),
+            doc.get("route"),
+        )
+
+    def to_document(self) -> dict:
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "token": self.token,
+            "token_id": self.token_id,
+            "endpoint": self.endpoint,
+            "method": self.method,
+            "status_code": self.status_code,
+            "response_time": self.response_time,
+            "timestamp": self.timestamp,
+            "api_id": self.api_id,
+            "route": self.route,
+        }
+
+    def to_model(self) -> APIUsage:
+        return APIUsage(**self.to_document())
+
+AnyUsage = APIUsage | UsageRecord
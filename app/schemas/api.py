@@ -0,0 +1,42 @@
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl
+from typing import Literal, Optional
+import datetime
+
+PricingType = Literal["free", "pay-per-call", "subscription"]
+APIStatus = Literal["active", "disabled"]
+HTTPMethod = Literal["GET", "POST", "PUT", "PATCH", "DELETE"]
+
+class APIBase(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    name: str
+    description: str = ""
+    endpoint: HttpUrl
+    method: HTTPMethod = "POST"
+    version: str = "1.0"
+    pricing_type: PricingType = "free"
+    price: float = Field(0.0, ge=0)
+    coalesce: bool = False
+    cache_ttl_seconds: float = Field(0.0, ge=0, le=86400)
+
+class APICreate(APIBase):
+    pass
+
+class APIUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    endpoint: Optional[HttpUrl] = None
+    method: Optional[HTTPMethod] = None
+    version: Optional[str] = None
+    pricing_type: Optional[PricingType] = None
+    price: Optional[float] = Field(None, ge=0)
+    status: Optional[APIStatus] = None
+    coalesce: Optional[bool] = None
+    cache_ttl_seconds: Optional[float] = Field(None, ge=0, le=86400)
+
+class APIResponse(APIBase):
+    id: str
+    owner_id: str
+    status: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
@@ -0,0 +1,26 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, List, Optional
+import datetime
+
+class ProfilingRules(BaseModel):
+    """Which requests to profile; a request matching any rule is profiled"""
+    model_config = ConfigDict(from_attributes=True)
+
+    endpoints: List[str] = []  # exact paths or route templates, e.g. /api/v1/tokens/{token_id}
+    user_ids: List[str] = []
+    sample_rate: float = Field(0.0, ge=0.0, le=1.0)
+    expires_at: datetime.datetime | None = None  # rules stop applying after this time
+
+class ProfileSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    method: str
+    path: str
+    reason: str
+    user_id: Optional[str] = None
+    started_at: datetime.datetime
+    status_code: Optional[int] = None
+    duration_ms: float
+    stages_ms: Dict[str, float]
+    samples: int
@@ -0,0 +1,100 @@
+import datetime
+from typing import List, Optional
+import httpx
+from bson.objectid import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from ..db.mongodb import MongoDB
+from ..models.api import API
+from ..schemas.api import APICreate, APIUpdate
+from ..core.cache import TTLCache
+from ..core.config import settings
+from ..core.metrics import db_operation, sampled_gauge
+from .catalog_index import catalog_index
+from .coalescing import proxy_cache
+from .egress import egress_policy
+
+# Published APIs looked up on every proxied call; updates and deletions made through
+# another worker reach this one when the entry expires
+api_cache = TTLCache(maxsize=settings.API_CACHE_MAX_SIZE, ttl=settings.API_CACHE_TTL_SECONDS)
+
+async def check_endpoint(endpoint: str) -> None:
+    """Refuse endpoints the proxy would not call: the proxy checks again on every connection"""
+    try:
+        await egress_policy.check_endpoint(endpoint)
+    except httpx.ConnectError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+class APIService:
+    def __init__(self):
+        self.db = MongoDB.get_db()
+        self.collection = self.db.apis
+
+    @db_operation
+    async def create_api(self, api_data: APICreate, owner_id: str) -> API:
+        """Publish a new API owned by ``owner_id``"""
+        await check_endpoint(str(api_data.endpoint))
+        api = API(id=str(ObjectId()), owner_id=owner_id, **api_data.model_dump(mode="json"))
+        await self.collection.insert_one(api.model_dump())
+        catalog_index.add(api)
+        return api
+
+    @db_operation
+    async def get_api(self, api_id: str) -> API | None:
+        doc = await self.collection.find_one({"id": api_id}, {"_id": 0})
+        return API(**doc) if doc else None
+
+    async def get_cached_api(self, api_id: str) -> API | None:
+        """The API from this worker's cache, loading it on a miss"""
+        api = api_cache.get(api_id)
+        if api is None:
+            api = await self.get_api(api_id)
+            if api is not None:
+                api_cache.set(api_id, api)
+        return api
+
+    @db_operation
+    async def list_apis(self, owner_id: Optional[str] = None, status: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[API]:
+        query = {}
+        if owner_id is not None:
+            query["owner_id"] = owner_id
+        if status is not None:
+            query["status"] = status
+        docs = await self.collection.find(query, {"_id": 0}).sort("created_at", 1).skip(skip).limit(limit).to_list(length=None)
+        return [API(**doc) for doc in docs]
+
+    @db_operation
+    async def update_api(self, api_id: str, changes: APIUpdate) -> API | None:
+        # Every stored field is required: a null leaves it unchanged
+        update = changes.model_dump(mode="json", exclude_none=True)
+        if "endpoint" in update:
+            await check_endpoint(update["endpoint"])
+        update["updated_at"] = datetime.datetime.now(datetime.timezone.utc)
+        doc = await self.collection.find_one_and_update(
+            {"id": api_id},
+            {"$set": update},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        api_cache.pop(api_id)
+        await proxy_cache.invalidate(f"api:{api_id}")
+        if not doc:
+            return None
+        api = API(**doc)
+        catalog_index.add(api)
+        return api
+
+    @db_operation
+    async def delete_api(self, api_id: str) -> bool:
+        result = await self.collection.delete_one({"id": api_id})
+        api_cache.pop(api_id)
+        await proxy_cache.invalidate(f"api:{api_id}")
+        catalog_index.remove(api_id)
+        if result.deleted_count:
+            # Change log the other workers' catalog indexes replay
+            await self.db.api_deletions.insert_one(
+                {"id": api_id, "deleted_at": datetime.datetime.now(datetime.timezone.utc)}
+            )
+        return result.deleted_count > 0
+
+sampled_gauge("api_cache_entries", "Published APIs cached by the worker", lambda: len(api_cache))
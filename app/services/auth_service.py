@@ -1,51 +1,64 @@
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 import datetime
 
 from ..core.security import (
-    verify_password,
-    get_password_hash,
+    password_hasher,
     create_access_token,
     verify_token,
     oauth2_scheme,
 )
+from ..core.config import settings
+from ..core.metrics import db_operation
 from ..models.user import User
+from ..core.context import get_auth_context
 from ..schemas.user import UserCreate, UserResponse, TokenData
 from ..db.mongodb import get_database
 from ..models.token import Token
 from ..services.token_service import TokenService
+from ..services.response_cache import response_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
 async def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),
     db = Depends(get_database)
 ) -> User:
     """Get current authenticated user from token"""
     auth_service = AuthService(db)
-    return await auth_service.get_current_user(token)
+    auth = get_auth_context(request)
+    if auth is None or auth.token_value != token:
+        return await auth_service.get_current_user(token)
+
+    # The middleware already verified the token; only the user is left to load, once
+    if auth.user is None:
+        auth.user = await auth_service.get_user_from_claims(auth.claims)
+    return auth.user
 
 class AuthService:
-    def __init__(self, db: MongoClient):
+    def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         self.users_collection = self.db.users
 
+    @db_operation
     async def create_user(self, user_data: UserCreate, is_admin: bool = False) -> UserResponse:
         # Check if user exists
-        if self.users_collection.find_one({"email": user_data.email}):
+        if await self.users_collection.find_one({"email": user_data.email}):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
 
-        # Create new user
+        # Create new user, generating its ID before inserting like tokens do
         user = User(
+            id=str(ObjectId()),
             email=user_data.email,
             username=user_data.username,
-            password_hash=get_password_hash(user_data.password),
+            password_hash=await password_hasher.hash(user_data.password),
             is_admin=is_admin
         )
         
@@ -53,8 +66,8 @@ class AuthService:
         if await self.users_collection.count_documents({}) == 0:
             user.is_admin = True
 
-        result = await self.users_collection.insert_one(user.model_dump())
-        user.id = str(result.inserted_id)
+        await self.users_collection.insert_one(user.model_dump())
+        await response_cache.invalidate("users")
         return UserResponse(**user.model_dump())
 
     async def create_admin_user(self, user_data: UserCreate) -> UserResponse:
@@ -66,37 +79,55 @@ class AuthService:
             )
         return await self.create_user(user_data, is_admin=True)
 
+    @db_operation
     async def authenticate_user(self, email: str, password: str) -> Optional[User]:
-        user_dict = self.users_collection.find_one({"email": email})
+        user_dict = await self.users_collection.find_one({"email": email})
         if not user_dict:
             return None
         
         user = User(**user_dict)
-        if not verify_password(password, user.password_hash):
+        verified, new_hash = await password_hasher.verify_for_login(password, user.password_hash)
+        if not verified:
             return None
+
+        # Transparently upgrade hashes made with outdated cost parameters
+        if new_hash and settings.PASSWORD_REHASH_ON_LOGIN:
+            await self.users_collection.update_one(
+                {"email": email},
+                {"$set": {"password_hash": new_hash}}
+            )
+            user.password_hash = new_hash
         
         return user
 
     async def get_current_user(self, token: str = Depends(oauth2_scheme)) -> User:
+        payload = verify_token(token)
+        return await self.get_user_from_claims(payload)
+
+    @db_operation
+    async def get_user_from_claims(self, payload: dict) -> User:
+        """Load the user named by already-verified token claims"""
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        payload = verify_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
 
-        user_dict = self.users_collection.find_one({"email": email})
+        user_dict = await self.users_collection.find_one({"email": email})
         if user_dict is None:
             raise credentials_exception
 
         return User(**user_dict)
 
-    def create_user_token(self, user: User) -> str:
-        token_data = {"sub": user.email, "user_id": str(user.id)}
+    @db_operation
+    async def create_user_token(self, user: User) -> str:
+        # The token ID travels in the JWT as its jti, so revocation checks need no lookup
+        token_id = str(ObjectId())
+        token_data = {"sub": user.email, "user_id": str(user.id), "jti": token_id}
         expires_delta = datetime.timedelta(minutes=30)
         expire = datetime.datetime.now(datetime.timezone.utc) + expires_delta
         
@@ -106,11 +137,12 @@ class AuthService:
         # Create token using token service
         token_service = TokenService()
         token = Token(
+            id=token_id,
             user_id=str(user.id),
             token=access_token,
             expires_at=expire,
             description="Login token"
         )
-        token_service.create_token(token)
+        await token_service.create_token(token)
         
         return access_token 
\ No newline at end of file
@@ -0,0 +1,520 @@
+"""In-memory search index over the catalog of published APIs.
+
+Each API gets a slot, numbered in creation order. Pricing types, statuses, price
+buckets and the terms found in many APIs get a bitmap: a Python int with bit
+``slot`` set for each API they cover. A search over those is a handful of
+big-integer ANDs, its facet counts are popcounts of them, and the page is read
+off the highest set bits: the cost grows with the terms in the query, not with
+the number of APIs that match it. A term found in at most
+``SPARSE_MAX_POSTINGS`` APIs keeps a set of slots instead, a bitmap being mostly
+zeros; a search with such a term checks its few APIs one by one.
+
+Ranking: a term found in an API's name scores ``NAME_WEIGHT`` times its inverse
+document frequency, one found only in its description ``DESCRIPTION_WEIGHT``
+times; an API must contain every term. Ties go to the newest API.
+
+Deleted APIs leave their slot unused, so that slot order stays creation order.
+Once the free slots outnumber the APIs, ``sync`` renumbers the APIs densely, and
+the bitmaps stop growing with churn.
+
+Every worker holds the whole catalog. APIService applies its own writes right
+away, and ``sync`` replays the ones made by other workers: documents updated since
+the last sync, and the ``api_deletions`` change log. Like the revocation list, it
+reads a few seconds of ``overlap`` behind the last change seen.
+"""
+import asyncio
+import bisect
+import datetime
+import itertools
+import logging
+import math
+import re
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from ..core.config import settings
+from ..core.metrics import Histogram, sampled_gauge
+from ..db.mongodb import MongoDB
+from ..models.api import API
+
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_QUERY_TERMS = 8  # ranked groups double with each term
+SPARSE_MAX_POSTINGS = 512  # above, a term gets bitmaps; back to a set below half of it
+COMPACT_MIN_FREE_SLOTS = 1024  # slots freed by deletions before a sync may renumber the rest
+
+# Price buckets: 0 holds the free APIs, then PRICE_BUCKETS_PER_DECADE per decade of
+# PRICE_DECADES, the first and last also taking the prices below and above
+PRICE_BUCKETS_PER_DECADE = 50
+PRICE_DECADES = (-6, 6)
+PRICE_BUCKETS = 1 + (PRICE_DECADES[1] - PRICE_DECADES[0]) * PRICE_BUCKETS_PER_DECADE
+
+TOKEN = re.compile(r"[^\W_]+")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.casefold())
+
+def price_bucket(price: float) -> int:
+    if price <= 0:
+        return 0
+    if price == math.inf:
+        return PRICE_BUCKETS - 1
+    position = math.floor((math.log10(price) - PRICE_DECADES[0]) * PRICE_BUCKETS_PER_DECADE)
+    return min(PRICE_BUCKETS - 1, max(1, 1 + position))
+
+def _utc(value: datetime.datetime) -> datetime.datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=datetime.timezone.utc)
+
+def _with(bits: int, slot: int) -> int:
+    return bits | (1 << slot)
+
+def _without(bits: int, slot: int) -> int:
+    return bits & ~(1 << slot)
+
+def _highest(bits: int, count: int) -> List[int]:
+    """Up to ``count`` set bits of ``bits``, highest first"""
+    slots = []
+    while bits and len(slots) < count:
+        slot = bits.bit_length() - 1
+        slots.append(slot)
+        bits ^= 1 << slot
+    return slots
+
+def _set_bits(bits: int) -> List[int]:
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    return [index * 8 + bit for index, byte in enumerate(data) if byte for bit in range(8) if byte >> bit & 1]
+
+class CatalogEntry:
+    """What the index keeps of an API: its search result and the keys it is filed under"""
+    __slots__ = ("id", "name", "description", "owner_id", "pricing_type", "price", "status", "name_terms", "description_terms")
+
+    def __init__(self, api: API):
+        self.id = api.id
+        self.name = api.name
+        self.description = api.description
+        self.owner_id = api.owner_id
+        self.pricing_type = api.pricing_type
+        self.price = api.price
+        self.status = api.status
+        # Interned: one copy of each term for the whole catalog
+        name_terms = set(map(sys.intern, tokenize(api.name)))
+        self.name_terms = tuple(name_terms)
+        # Disjoint from the name terms, so each term of an API falls in one ranking tier
+        self.description_terms = tuple(set(map(sys.intern, tokenize(api.description))) - name_terms)
+
+    def has(self, term: str) -> bool:
+        return term in self.name_terms or term in self.description_terms
+
+    def result(self, score: Optional[float]) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "owner_id": self.owner_id,
+            "pricing_type": self.pricing_type,
+            "price": self.price,
+            "status": self.status,
+            "score": score,
+        }
+
+class CatalogIndex:
+    def __init__(self, sync_interval: float, overlap: float):
+        self.sync_interval = sync_interval
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self._lock = asyncio.Lock()
+        self._stopping: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._slots: Dict[str, int] = {}
+        self._entries: Dict[int, CatalogEntry] = {}
+        self._next_slot = 0
+        self._all = 0
+        self._df: Dict[str, int] = {}  # APIs containing each term
+        self._sparse: Dict[str, Set[int]] = {}
+        self._dense: Dict[str, List[int]] = {}  # [name bitmap, description-only bitmap]
+        self._pricing_types: Dict[str, int] = {}
+        self._statuses: Dict[str, int] = {}
+        # Fenwick tree over the price buckets: position p holds the APIs of the buckets (p - lowbit(p), p]
+        self._price_tree: List[int] = [0] * (PRICE_BUCKETS + 1)
+        self._bucket_prices: Dict[int, List[Tuple[float, int]]] = {}  # sorted (price, slot) of each bucket
+        self._high_water: Optional[datetime.datetime] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._high_water is not None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def add(self, api: API) -> None:
+        """Index ``api``, replacing the version of it indexed before"""
+        slot = self._slots.get(api.id)
+        if slot is None:
+            slot = self._slots[api.id] = self._next_slot
+            self._next_slot += 1
+        else:
+            self._unfile(slot, self._entries[slot])
+        entry = self._entries[slot] = CatalogEntry(api)
+        self._file(slot, entry)
+
+    def remove(self, api_id: str) -> None:
+        slot = self._slots.pop(api_id, None)
+        if slot is not None:
+            self._unfile(slot, self._entries.pop(slot))
+
+    def load(self, apis: Iterable[API]) -> None:
+        """Replace the index with ``apis``, oldest first"""
+        self.clear()
+        self._build(CatalogEntry(api) for api in apis)
+
+    def compact(self) -> None:
+        """Renumber the APIs into consecutive slots, in the same order"""
+        entries = [self._entries[slot] for slot in sorted(self._entries)]
+        high_water = self._high_water
+        self.clear()
+        self._high_water = high_water
+        self._build(entries)
+
+    def _build(self, entries: Iterable[CatalogEntry]) -> None:
+        """File ``entries`` into an empty index, oldest first; builds every bitmap in one pass"""
+        postings: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        pricing_types: Dict[str, List[int]] = defaultdict(list)
+        statuses: Dict[str, List[int]] = defaultdict(list)
+        buckets: Dict[int, List[Tuple[float, int]]] = defaultdict(list)
+        for slot, entry in enumerate(entries):
+            self._entries[slot] = entry
+            self._slots[entry.id] = slot
+            for term in entry.name_terms:
+                postings[term][0].append(slot)
+            for term in entry.description_terms:
+                postings[term][1].append(slot)
+            pricing_types[entry.pricing_type].append(slot)
+            statuses[entry.status].append(slot)
+            buckets[price_bucket(entry.price)].append((entry.price, slot))
+        self._next_slot = len(self._entries)
+
+        self._all = self._bitmap(self._entries)
+        for term, (names, descriptions) in postings.items():
+            self._df[term] = len(names) + len(descriptions)
+            if self._df[term] > SPARSE_MAX_POSTINGS:
+                self._dense[term] = [self._bitmap(names), self._bitmap(descriptions)]
+            else:
+                self._sparse[term] = set(names) | set(descriptions)
+        self._pricing_types = {value: self._bitmap(slots) for value, slots in pricing_types.items()}
+        self._statuses = {value: self._bitmap(slots) for value, slots in statuses.items()}
+        for bucket, prices in buckets.items():
+            self._bucket_prices[bucket] = sorted(prices)
+            self._price_tree[bucket + 1] = self._bitmap(slot for _, slot in prices)
+        for position in range(1, PRICE_BUCKETS + 1):
+            parent = position + (position & -position)
+            if parent <= PRICE_BUCKETS:
+                self._price_tree[parent] |= self._price_tree[position]
+
+    def search(
+        self,
+        query: str = "",
+        pricing_type: Optional[str] = None,
+        status: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = "relevance",
+        skip: int = 0,
+        limit: int = 20,
+        status_facet: bool = True,
+    ) -> dict:
+        """A page of the APIs matching every filter, with the total and the facet counts.
+
+        The counts of each facet leave out that facet's own filter, so they tell how
+        many results picking another value would give. ``status_facet`` False leaves
+        out the status counts, for callers who may not learn about disabled APIs.
+        """
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        low, high = min_price or 0.0, math.inf if max_price is None else max_price
+        ranked = bool(terms) and sort == "relevance"
+        if any(term not in self._df for term in terms):
+            result = self._search_slots([], pricing_type, status, status_facet, low, high, ranked, skip, limit)
+        elif any(term in self._sparse for term in terms):
+            result = self._search_slots(terms, pricing_type, status, status_facet, low, high, ranked, skip, limit)
+        else:
+            priced = min_price is not None or max_price is not None
+            result = self._search_bitmaps(terms, pricing_type, status, status_facet, priced, low, high, ranked, skip, limit)
+        CATALOG_SEARCH_SECONDS.observe(time.perf_counter() - started)
+        return result
+
+    async def sync(self) -> int:
+        """Load the catalog, or replay the changes since the last sync; returns how many were read"""
+        db = MongoDB.get_db()
+        async with self._lock:
+            if self._high_water is None:
+                # _id order is creation order, and indexed: no in-memory sort of the whole catalog
+                docs = await db.apis.find({}, {"_id": 0}).sort("_id", 1).to_list(length=None)
+                deletions = []
+                # Written by APIService, no need to validate them again
+                self.load(API.model_construct(**doc) for doc in docs)
+            else:
+                since = self._high_water - self.overlap
+                docs = await db.apis.find({"updated_at": {"$gte": since}}, {"_id": 0}).to_list(length=None)
+                # Read after the documents: an API deleted in between is still removed
+                deletions = await db.api_deletions.find({"deleted_at": {"$gte": since}}, {"_id": 0}).to_list(length=None)
+                for doc in docs:
+                    self.add(API(**doc))
+                for deletion in deletions:
+                    self.remove(deletion["id"])
+                if self._next_slot - len(self._entries) > max(len(self._entries), COMPACT_MIN_FREE_SLOTS):
+                    self.compact()
+
+            changed = [_utc(doc["updated_at"]) for doc in docs] + [_utc(deletion["deleted_at"]) for deletion in deletions]
+            if changed and (self._high_water is None or max(changed) > self._high_water):
+                self._high_water = max(changed)
+            elif self._high_water is None:
+                self._high_water = datetime.datetime.now(datetime.timezone.utc)
+            return len(changed)
+
+    async def ensure_loaded(self) -> None:
+        """Load the catalog if no sync has yet"""
+        if not self.loaded:
+            await self.sync()
+
+    def start(self) -> None:
+        """Start syncing in the background on the running event loop"""
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._stopping.set()
+        await self._worker
+        self._worker = None
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self.sync()
+            except Exception as e:
+                logging.error(f"Error syncing the API catalog index: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _idf(self, term: str) -> float:
+        return math.log(1 + len(self._entries) / self._df[term])
+
+    def _search_bitmaps(self, terms, pricing_type, status, status_facet, priced, low, high, ranked, skip, limit) -> dict:
+        """Search with bitmaps only: every term of the query is a common one"""
+        matched = self._all
+        for term in terms:
+            name_bits, description_bits = self._dense[term]
+            matched &= name_bits | description_bits
+        if priced:
+            matched &= self._price_range(low, high)
+
+        # -1 has every bit set: no filter
+        pricing_bits = -1 if pricing_type is None else self._pricing_types.get(pricing_type, 0)
+        status_bits = -1 if status is None else self._statuses.get(status, 0)
+        facets = {"pricing_type": self._counts(matched & status_bits, self._pricing_types)}
+        if status_facet:
+            facets["status"] = self._counts(matched & pricing_bits, self._statuses)
+        results = matched & pricing_bits & status_bits
+
+        wanted = skip + limit
+        if not ranked:
+            page = [(slot, None) for slot in _highest(results, wanted)]
+        else:
+            # Each term splits the results in two tiers, name and description matches;
+            # every combination of tiers is a group of equal scores, read best first
+            groups = [(0.0, results)]
+            for term in terms:
+                idf = self._idf(term)
+                tiers = list(zip((NAME_WEIGHT * idf, DESCRIPTION_WEIGHT * idf), self._dense[term]))
+                groups = [(score + weight, bits & tier) for score, bits in groups for weight, tier in tiers if bits & tier]
+            groups.sort(key=lambda group: group[0], reverse=True)
+            page = []
+            for score, bits in groups:
+                page.extend((slot, round(score, 4)) for slot in _highest(bits, wanted - len(page)))
+                if len(page) >= wanted:
+                    break
+        return {
+            "total": results.bit_count(),
+            "items": [self._entries[slot].result(score) for slot, score in page[skip:]],
+            "facets": facets,
+        }
+
+    def _search_slots(self, terms, pricing_type, status, status_facet, low, high, ranked, skip, limit) -> dict:
+        """Search by checking the APIs of the rarest term one by one"""
+        pricing_counts = dict.fromkeys(self._pricing_types, 0)
+        status_counts = dict.fromkeys(self._statuses, 0)
+        weights = [(term, NAME_WEIGHT * self._idf(term), DESCRIPTION_WEIGHT * self._idf(term)) for term in terms if ranked]
+        hits = []
+        if terms:
+            rarest, *others = sorted((self._sparse[term] for term in terms if term in self._sparse), key=len)
+            dense = [term for term in terms if term in self._dense]
+            for slot in rarest:
+                if others and any(slot not in slots for slots in others):
+                    continue
+                entry = self._entries[slot]
+                if not low <= entry.price <= high or (dense and not all(entry.has(term) for term in dense)):
+                    continue
+                pricing_ok = pricing_type is None or entry.pricing_type == pricing_type
+                status_ok = status is None or entry.status == status
+                if status_ok:
+                    pricing_counts[entry.pricing_type] += 1
+                if pricing_ok:
+                    status_counts[entry.status] += 1
+                if pricing_ok and status_ok:
+                    score = 0.0
+                    for term, name, description in weights:
+                        score += name if term in entry.name_terms else description
+                    hits.append((score, slot))
+
+        # Best score first, then newest, as the bitmap search reads them
+        hits.sort(reverse=True)
+        facets = {"pricing_type": pricing_counts}
+        if status_facet:
+            facets["status"] = status_counts
+        return {
+            "total": len(hits),
+            "items": [self._entries[slot].result(round(score, 4) if ranked else None) for score, slot in hits[skip:skip + limit]],
+            "facets": facets,
+        }
+
+    def _price_range(self, low: float, high: float) -> int:
+        """Bitmap of the APIs priced between ``low`` and ``high`` included"""
+        if low > high:
+            return 0
+        low_bucket, high_bucket = price_bucket(low), price_bucket(high)
+        bits = self._bucket_range(low_bucket, low, high)
+        if high_bucket > low_bucket:
+            bits |= self._bucket_range(high_bucket, low, high)
+        if high_bucket > low_bucket + 1:
+            bits |= self._priced_up_to(high_bucket - 1) & ~self._priced_up_to(low_bucket)
+        return bits
+
+    def _bucket_range(self, bucket: int, low: float, high: float) -> int:
+        """The APIs of a bucket at an end of the price range that are within it"""
+        prices = self._bucket_prices.get(bucket)
+        if not prices:
+            return 0
+        start = bisect.bisect_left(prices, (low, -1))
+        end = bisect.bisect_right(prices, (high, math.inf))
+        if end - start <= len(prices) // 2:
+            return self._bitmap(slot for _, slot in prices[start:end])
+        # Mostly in: cheaper to take the rest out of the whole bucket
+        whole = self._priced_up_to(bucket) & ~self._priced_up_to(bucket - 1)
+        if end - start == len(prices):
+            return whole
+        return whole & ~self._bitmap(slot for _, slot in itertools.chain(prices[:start], prices[end:]))
+
+    def _priced_up_to(self, bucket: int) -> int:
+        """Bitmap of the APIs in the price buckets up to ``bucket`` included"""
+        bits, position = 0, bucket + 1
+        while position > 0:
+            bits |= self._price_tree[position]
+            position -= position & -position
+        return bits
+
+    def _bitmap(self, slots: Iterable[int]) -> int:
+        data = bytearray((self._next_slot + 7) // 8)
+        for slot in slots:
+            data[slot >> 3] |= 1 << (slot & 7)
+        return int.from_bytes(data, "little")
+
+    @staticmethod
+    def _counts(bits: int, facet: Dict[str, int]) -> Dict[str, int]:
+        return {value: (bits & value_bits).bit_count() for value, value_bits in facet.items()}
+
+    def _file(self, slot: int, entry: CatalogEntry) -> None:
+        self._all = _with(self._all, slot)
+        for tier, terms in enumerate((entry.name_terms, entry.description_terms)):
+            for term in terms:
+                self._post(term, tier, slot)
+        self._pricing_types[entry.pricing_type] = _with(self._pricing_types.get(entry.pricing_type, 0), slot)
+        self._statuses[entry.status] = _with(self._statuses.get(entry.status, 0), slot)
+
+        bucket = price_bucket(entry.price)
+        bisect.insort(self._bucket_prices.setdefault(bucket, []), (entry.price, slot))
+        position = bucket + 1
+        while position <= PRICE_BUCKETS:
+            self._price_tree[position] = _with(self._price_tree[position], slot)
+            position += position & -position
+
+    def _unfile(self, slot: int, entry: CatalogEntry) -> None:
+        self._all = _without(self._all, slot)
+        for tier, terms in enumerate((entry.name_terms, entry.description_terms)):
+            for term in terms:
+                self._unpost(term, tier, slot)
+        self._drop(self._pricing_types, entry.pricing_type, slot)
+        self._drop(self._statuses, entry.status, slot)
+
+        bucket = price_bucket(entry.price)
+        prices = self._bucket_prices[bucket]
+        del prices[bisect.bisect_left(prices, (entry.price, slot))]
+        if not prices:
+            del self._bucket_prices[bucket]
+        position = bucket + 1
+        while position <= PRICE_BUCKETS:
+            self._price_tree[position] = _without(self._price_tree[position], slot)
+            position += position & -position
+
+    def _post(self, term: str, tier: int, slot: int) -> None:
+        self._df[term] = self._df.get(term, 0) + 1
+        bitmaps = self._dense.get(term)
+        if bitmaps is not None:
+            bitmaps[tier] = _with(bitmaps[tier], slot)
+            return
+        slots = self._sparse.setdefault(term, set())
+        slots.add(slot)
+        if len(slots) > SPARSE_MAX_POSTINGS:
+            del self._sparse[term]
+            names = [slot for slot in slots if term in self._entries[slot].name_terms]
+            self._dense[term] = [self._bitmap(names), self._bitmap(slots.difference(names))]
+
+    def _unpost(self, term: str, tier: int, slot: int) -> None:
+        df = self._df[term] - 1
+        if not df:
+            del self._df[term]
+            self._sparse.pop(term, None)
+            self._dense.pop(term, None)
+            return
+        self._df[term] = df
+        bitmaps = self._dense.get(term)
+        if bitmaps is None:
+            self._sparse[term].discard(slot)
+            return
+        bitmaps[tier] = _without(bitmaps[tier], slot)
+        if df <= SPARSE_MAX_POSTINGS // 2:
+            del self._dense[term]
+            self._sparse[term] = set(_set_bits(bitmaps[0] | bitmaps[1]))
+
+    @staticmethod
+    def _drop(bitmaps: dict, key, slot: int) -> None:
+        """Clear ``slot`` from a bitmap, deleting it once empty"""
+        bits = _without(bitmaps[key], slot)
+        if bits:
+            bitmaps[key] = bits
+        else:
+            del bitmaps[key]
+
+CATALOG_SEARCH_SECONDS = Histogram(
+    "catalog_search_duration_seconds",
+    "Time to search the in-memory API catalog index",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025),
+)
+
+catalog_index = CatalogIndex(
+    sync_interval=settings.CATALOG_SYNC_INTERVAL_SECONDS,
+    overlap=settings.CATALOG_SYNC_OVERLAP_SECONDS,
+)
+
+sampled_gauge("catalog_index_apis", "APIs in the worker's catalog index", lambda: len(catalog_index), multiprocess_mode="livemax")
@@ -0,0 +1,186 @@
+"""Sharing one upstream response between identical proxied calls.
+
+Calls to the same API with the same method, path, query string, body and
+response-affecting headers are identical; JSON bodies are compared after
+normalization, so key order and whitespace do not matter. While one is in flight,
+the identical calls that arrive join it instead of sending their own upstream
+request (singleflight): the upstream body is read once into a ``SharedResponse``
+and every caller streams it from there, from the first chunk, at its own pace.
+APIs that opt in also keep complete ``200`` responses in a cache for
+``cache_ttl_seconds``.
+
+Responses meant for one caller (``Set-Cookie``, ``Cache-Control: private`` or
+``no-store``, ``Vary`` on a header the key leaves out) are neither shared nor
+cached: the callers that joined them send their own request.
+"""
+import asyncio
+import hashlib
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import orjson
+from fastapi import HTTPException
+from ..core.config import settings
+from ..core.metrics import Counter, sampled_gauge
+from .response_cache import MemoryResponseCacheBackend
+
+# Forwarded request headers the upstream's answer may depend on
+KEY_HEADERS = frozenset({b"accept", b"accept-encoding", b"accept-language", b"content-type", b"cookie"})
+# Header names that look like they carry the caller's own upstream credentials
+CREDENTIAL_MARKERS = (b"key", b"token", b"auth", b"secret", b"session", b"credential")
+
+def normalize_body(body: bytes, content_type: str) -> bytes:
+    if "json" in content_type:
+        try:
+            return orjson.dumps(orjson.loads(body), option=orjson.OPT_SORT_KEYS)
+        except orjson.JSONDecodeError:
+            pass
+    return body
+
+def _key_header(name: bytes) -> bool:
+    return name in KEY_HEADERS or any(marker in name for marker in CREDENTIAL_MARKERS)
+
+def request_key(
+    api_id: str,
+    method: str,
+    path: str,
+    query_string: bytes,
+    body: bytes,
+    headers: Iterable[Tuple[bytes, bytes]],
+) -> str:
+    """``headers`` are the forwarded ones, names lowercased; credentials only enter the key hashed"""
+    headers = sorted((name, value) for name, value in headers if _key_header(name))
+    content_type = next((value for name, value in headers if name == b"content-type"), b"").decode("latin-1")
+    digest = hashlib.blake2b(normalize_body(body, content_type), digest_size=16)
+    for name, value in headers:
+        digest.update(b"\n" + name + b":" + value)
+    return f"{api_id}|{method}|{path}?{query_string.decode('latin-1')}|{digest.hexdigest()}"
+
+def shareable_response(headers: Iterable[Tuple[bytes, bytes]]) -> bool:
+    """Whether an upstream response may go to other callers than the one it was sent for"""
+    for name, value in headers:
+        if name == b"set-cookie":
+            return False
+        if name == b"cache-control":
+            directives = {directive.split(b"=", 1)[0].strip().lower() for directive in value.split(b",")}
+            if directives & {b"private", b"no-store"}:
+                return False
+        if name == b"vary":
+            if not {field.strip().lower() for field in value.split(b",")} <= KEY_HEADERS:
+                return False
+    return True
+
+class SharedResponse:
+    """An upstream response read once and streamed to any number of callers.
+
+    Chunks are kept until every caller that joined has read them, so a caller
+    joining late still gets the whole body. Past ``max_bytes`` the response takes
+    no more callers, and chunks are dropped once all of its callers are past them.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.status_code: Optional[int] = None
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.error: Optional[HTTPException] = None
+        self.finished = False
+        self.complete = False  # the upstream sent the whole body
+        self.private = False  # the response is for the caller that made it only
+        self.started = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._dropped = 0  # chunks dropped from the front of ``chunks``
+        self._readers: Dict[int, int] = {}  # reader to the next chunk it reads, counted from the first
+        self._next_reader = 0
+
+    def start(self, status_code: int, headers: List[Tuple[bytes, bytes]]) -> None:
+        self.status_code, self.headers = status_code, headers
+        self.private = not shareable_response(headers)
+        self.started.set()
+
+    def fail(self, error: HTTPException) -> None:
+        """The upstream could not be called; every caller gets ``error``"""
+        self.error = error
+        self.finished = True
+        self.started.set()
+
+    def append(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        self._trim()
+        self._notify()
+
+    def finish(self, complete: bool) -> None:
+        self.finished, self.complete = True, complete
+        self._notify()
+
+    @property
+    def shareable(self) -> bool:
+        """Whether more callers may join, and the whole body is still there to cache"""
+        return not self.private and self.size <= self.max_bytes
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+    def join(self) -> int:
+        """Register a caller, which then reads the body from its first chunk with ``stream``"""
+        reader = self._next_reader
+        self._next_reader += 1
+        self._readers[reader] = 0
+        return reader
+
+    def leave(self, reader: int) -> None:
+        self._readers.pop(reader, None)
+        self._trim()
+
+    async def wait_started(self) -> None:
+        """Wait for the upstream's status and headers; raises the upstream error, if any"""
+        await self.started.wait()
+        if self.error is not None:
+            raise self.error
+
+    async def stream(self, reader: int) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                changed = self._changed
+                position = self._readers[reader]
+                if position < self._dropped + len(self.chunks):
+                    chunk = self.chunks[position - self._dropped]
+                    self._readers[reader] = position + 1
+                    self._trim()
+                    yield chunk
+                elif self.finished:
+                    return
+                else:
+                    await changed.wait()
+        finally:
+            self.leave(reader)
+
+    def _trim(self) -> None:
+        # Only once over the limit: until then a late caller may still join from the start
+        if self.size <= self.max_bytes:
+            return
+        read = min(self._readers.values(), default=self._dropped + len(self.chunks)) - self._dropped
+        if read > 0:
+            del self.chunks[:read]
+            self._dropped += read
+
+    def _notify(self) -> None:
+        # Wake the current waiters; later ones wait on a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+PROXY_UPSTREAM_CALLS_SAVED = Counter(
+    "proxy_upstream_calls_saved_total",
+    "Proxied calls answered without an upstream request of their own: coalesced (joined an identical call in flight) or cache",
+    ["upstream", "reason"],
+)
+
+# Entries are tagged "api:{api_id}", dropped when the API changes
+proxy_cache = MemoryResponseCacheBackend(
+    max_entries=settings.PROXY_CACHE_MAX_ENTRIES,
+    max_bytes=settings.PROXY_CACHE_MAX_BYTES,
+)
+
+sampled_gauge("proxy_cache_entries", "Upstream responses cached by the worker", lambda: len(proxy_cache))
+sampled_gauge("proxy_cache_bytes", "Body bytes of the upstream responses cached by the worker", lambda: proxy_cache.size)
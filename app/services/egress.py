@@ -0,0 +1,108 @@
+"""Keeps proxied calls away from the gateway's own network.
+
+An API's endpoint is chosen by whoever publishes it. Unchecked, a call to it could
+reach the cloud metadata service, the database or anything else listening on a
+loopback, private or link-local address. Endpoints are checked when an API is
+published or updated and, since DNS answers can change afterwards, again on every
+upstream request: ``EgressTransport`` resolves the host itself, checks every
+address and connects to the checked one.
+"""
+import asyncio
+import ipaddress
+import socket
+from typing import Awaitable, Callable, List, Optional, Sequence
+import httpx
+from ..core.cache import TTLCache
+from ..core.config import settings
+
+Resolver = Callable[[str, int], Awaitable[List[str]]]
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+class UpstreamNotAllowed(httpx.ConnectError):
+    """The upstream host is not allowed, or resolves to an address the gateway must not call"""
+
+def address_allowed(address: str) -> bool:
+    ip = ipaddress.ip_address(address)
+    return ip.is_global and not ip.is_multicast
+
+async def system_resolver(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+class EgressPolicy:
+    """Which upstream hosts and addresses proxied calls may go to"""
+
+    def __init__(
+        self,
+        allowed_hosts: Sequence[str],
+        allow_private: bool,
+        cache_ttl: float,
+        resolver: Resolver = system_resolver,
+    ):
+        # ".example.com" admits example.com's subdomains
+        self.allowed_hosts = tuple(host.lower() for host in allowed_hosts)
+        self.allow_private = allow_private
+        self.resolver = resolver
+        self._addresses = TTLCache(maxsize=1024, ttl=cache_ttl)
+
+    def host_allowed(self, host: str) -> bool:
+        if not self.allowed_hosts:
+            return True
+        host = host.lower().rstrip(".")
+        return any(host == entry or (entry.startswith(".") and host.endswith(entry)) for entry in self.allowed_hosts)
+
+    async def check(self, host: str, port: int) -> Optional[str]:
+        """The address to connect to for ``host``, or None when any address will do.
+
+        Raises ``UpstreamNotAllowed``, or ``httpx.ConnectError`` when the host does not resolve.
+        """
+        if not self.host_allowed(host):
+            raise UpstreamNotAllowed(f"Upstream host {host} is not in PROXY_ALLOWED_HOSTS")
+        if self.allow_private:
+            return None
+        address = self._addresses.get((host, port))
+        if address is None:
+            try:
+                addresses = await self.resolver(host, port)
+            except OSError as e:
+                raise httpx.ConnectError(f"Upstream host {host} does not resolve: {e}")
+            # All of them: a name could pair a public address with a private one
+            blocked = [address for address in addresses if not address_allowed(address)]
+            if blocked:
+                raise UpstreamNotAllowed(f"Upstream host {host} resolves to {blocked[0]}, which is not a public address")
+            if not addresses:
+                raise httpx.ConnectError(f"Upstream host {host} does not resolve")
+            address = addresses[0]
+            self._addresses.set((host, port), address)
+        return address
+
+    async def check_endpoint(self, endpoint: str) -> None:
+        """Raise unless ``endpoint``, an API's base URL, may be proxied to"""
+        url = httpx.URL(endpoint)
+        await self.check(url.host, url.port or DEFAULT_PORTS.get(url.scheme, 80))
+
+    def clear(self) -> None:
+        self._addresses.clear()
+
+class EgressTransport(httpx.AsyncHTTPTransport):
+    """Connects only to the addresses ``policy`` allows, pinned for the request"""
+
+    def __init__(self, policy: EgressPolicy, **kwargs):
+        super().__init__(**kwargs)
+        self.policy = policy
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        address = await self.policy.check(url.host, url.port or DEFAULT_PORTS.get(url.scheme, 80))
+        if address is not None and address != url.host:
+            # Host header and certificate check keep the name; TLS sends it as SNI
+            request.url = url.copy_with(host=address)
+            request.extensions = {**request.extensions, "sni_hostname": url.host}
+        return await super().handle_async_request(request)
+
+egress_policy = EgressPolicy(
+    allowed_hosts=settings.PROXY_ALLOWED_HOSTS,
+    allow_private=settings.PROXY_ALLOW_PRIVATE_UPSTREAMS,
+    cache_ttl=settings.PROXY_DNS_CACHE_SECONDS,
+)
@@ -0,0 +1,166 @@
+import asyncio
+import datetime
+import logging
+import random
+import re
+from typing import List, Optional, Pattern
+import jwt
+from fastapi import Request
+from pymongo import DESCENDING
+from starlette.routing import compile_path
+from ..core.config import settings
+from ..core.profiling import Profile, StackSampler
+from ..db.mongodb import MongoDB
+from ..schemas.profiling import ProfilingRules
+
+RULES_ID = "rules"
+
+def _endpoint_pattern(endpoint: str) -> Pattern:
+    # compile_path turns /tokens/{token_id} into a regex; plain paths match themselves
+    return compile_path(endpoint)[0] if "{" in endpoint else re.compile(re.escape(endpoint) + "$")
+
+def _claimed_user_id(request: Request) -> Optional[str]:
+    """The ``user_id`` claim of the request's bearer token, unverified"""
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    try:
+        claims = jwt.decode(authorization[7:], options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        return None
+    user_id = claims.get("user_id")
+    return user_id if isinstance(user_id, str) else None
+
+class Profiler:
+    """Decides which requests to profile and keeps the most recent profiles.
+
+    Rules are set through the admin API and stored in the ``profiling_rules``
+    collection; every worker reloads them every ``sync_interval`` seconds. Profiles
+    go to the ``request_profiles`` collection, trimmed to the newest
+    ``max_profiles``, so any worker can serve them.
+    """
+
+    def __init__(self, max_profiles: int, sample_interval: float, sync_interval: float):
+        self.max_profiles = max_profiles
+        self.sync_interval = sync_interval
+        self.sampler = StackSampler(sample_interval)
+        self.rules = ProfilingRules()
+        self.active = False
+        self._endpoints: List[Pattern] = []
+        self._user_ids = frozenset()
+        self._stopping: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def apply(self, rules: ProfilingRules) -> None:
+        self.rules = rules
+        self._endpoints = [_endpoint_pattern(endpoint) for endpoint in rules.endpoints]
+        self._user_ids = frozenset(rules.user_ids)
+        self.active = bool(self._endpoints or self._user_ids or rules.sample_rate)
+
+    def reset(self) -> None:
+        self.apply(ProfilingRules())
+
+    def match(self, request: Request) -> Optional[str]:
+        """The reason to profile ``request``, or None to leave it alone.
+
+        "user" is provisional: this runs before the auth middleware has verified the
+        token, so only its claim selects the request and ``keep`` confirms the caller.
+        """
+        if not self.active:
+            return None
+        expires_at = self.rules.expires_at
+        if expires_at is not None:
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+            if expires_at <= datetime.datetime.now(datetime.timezone.utc):
+                return None
+
+        if any(pattern.match(request.url.path) for pattern in self._endpoints):
+            return "endpoint"
+        if self.rules.sample_rate and random.random() < self.rules.sample_rate:
+            return "sample"
+        if self._user_ids and _claimed_user_id(request) in self._user_ids:
+            return "user"
+        return None
+
+    def keep(self, reason: str, user_id: Optional[str]) -> bool:
+        """Whether the profile of a request selected for ``reason``, made by ``user_id``, is saved"""
+        return reason != "user" or user_id in self._user_ids
+
+    async def set_rules(self, rules: ProfilingRules) -> None:
+        await MongoDB.get_db().profiling_rules.replace_one(
+            {"_id": RULES_ID}, {"_id": RULES_ID, **rules.model_dump()}, upsert=True
+        )
+        self.apply(rules)
+
+    async def sync(self) -> None:
+        doc = await MongoDB.get_db().profiling_rules.find_one({"_id": RULES_ID}, {"_id": 0})
+        self.apply(ProfilingRules(**doc) if doc else ProfilingRules())
+
+    async def save(self, profile: Profile) -> None:
+        """Store a finished profile, dropping the oldest ones beyond ``max_profiles``"""
+        collection = MongoDB.get_db().request_profiles
+        await collection.insert_one({
+            "id": profile.id,
+            "method": profile.method,
+            "path": profile.path,
+            "reason": profile.reason,
+            "user_id": profile.user_id,
+            "started_at": profile.started_at,
+            "status_code": profile.status_code,
+            "duration_ms": profile.duration * 1000,
+            "stages_ms": {name: seconds * 1000 for name, seconds in profile.stages.items()},
+            "samples": sum(profile.stacks.values()),
+            # Pairs rather than a document: frame names contain dots
+            "stacks": [[stack, count] for stack, count in profile.stacks.items()],
+        })
+        stale = await collection.find({}, {"_id": 1}).sort("started_at", DESCENDING).skip(self.max_profiles).to_list(length=None)
+        if stale:
+            await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in stale]}})
+
+    async def list_profiles(self) -> List[dict]:
+        return await MongoDB.get_db().request_profiles.find(
+            {}, {"_id": 0, "stacks": 0}
+        ).sort("started_at", DESCENDING).to_list(length=None)
+
+    async def get_profile(self, profile_id: str) -> Optional[dict]:
+        return await MongoDB.get_db().request_profiles.find_one({"id": profile_id}, {"_id": 0})
+
+    async def clear_profiles(self) -> int:
+        result = await MongoDB.get_db().request_profiles.delete_many({})
+        return result.deleted_count
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self) -> None:
+        """Reload the rules in the background on the running event loop"""
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._stopping.set()
+        await self._worker
+        self._worker = None
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self.sync()
+            except Exception as e:
+                logging.error(f"Error syncing profiling rules: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+
+profiler = Profiler(
+    max_profiles=settings.PROFILING_MAX_PROFILES,
+    sample_interval=settings.PROFILING_SAMPLE_INTERVAL_SECONDS,
+    sync_interval=settings.PROFILING_RULES_SYNC_SECONDS,
+)
@@ -0,0 +1,332 @@
+"""Forwards consumer calls to the upstreams of published APIs.
+
+Each upstream origin gets its own pooled ``httpx.AsyncClient``, so the connection
+limits and keep-alive pool apply per upstream and one slow upstream cannot take
+the connections of the others. Request and response bodies stream through
+without being buffered: the upstream receives the consumer's body as it arrives,
+and the consumer receives the upstream's body chunk by chunk. Calls that may be
+shared (see ``coalescing``) buffer their body, up to ``PROXY_COALESCE_MAX_BODY_BYTES``,
+to be compared; their responses still stream, and past that size stop keeping
+their chunks for callers that have not joined yet.
+"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import httpx
+from fastapi import HTTPException, Request, status
+from starlette.responses import Response, StreamingResponse
+from ..core.config import settings
+from ..core.metrics import DEFAULT_BUCKETS, Counter, Histogram, sampled_gauge
+from ..models.api import API
+from .coalescing import PROXY_UPSTREAM_CALLS_SAVED, SharedResponse, proxy_cache, request_key
+from .response_cache import CachedResponse
+from .egress import EgressTransport, UpstreamNotAllowed, egress_policy
+from .upstream_guard import UpstreamCall, UpstreamGuard, upstream_guard, upstream_label
+
+# Meaningful for one connection only, RFC 9110 section 7.6.1
+HOP_BY_HOP_HEADERS = frozenset({
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"proxy-connection", b"te", b"trailer", b"transfer-encoding", b"upgrade",
+})
+# The platform's bearer token is for us, not for the upstream
+REQUEST_EXCLUDED_HEADERS = HOP_BY_HOP_HEADERS | {b"host", b"authorization"}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def forwarded_request_headers(request: Request) -> List[Tuple[bytes, bytes]]:
+    # ASGI servers hand over header names lowercased
+    headers = [(name, value) for name, value in request.headers.raw if name not in REQUEST_EXCLUDED_HEADERS]
+    if request.client:
+        headers.append((b"x-forwarded-for", request.client.host.encode("latin-1")))
+    return headers
+
+def forwarded_response_headers(response: httpx.Response) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower(), value) for name, value in response.headers.raw if name.lower() not in HOP_BY_HOP_HEADERS]
+
+def _has_body(request: Request) -> bool:
+    headers = request.headers
+    return "transfer-encoding" in headers or headers.get("content-length", "0") != "0"
+
+def _shareable(api: API, request: Request) -> bool:
+    """Whether the call may be coalesced or cached: the body must be small enough to hash"""
+    if not (api.coalesce or api.cache_ttl_seconds):
+        return False
+    if "transfer-encoding" in request.headers:
+        return False
+    return int(request.headers.get("content-length", "0")) <= settings.PROXY_COALESCE_MAX_BODY_BYTES
+
+def _with_header(headers, name: bytes, value: bytes) -> List[Tuple[bytes, bytes]]:
+    return [*headers, (name, value)]
+
+def api_upstream(api: API) -> str:
+    """The upstream an API's calls go to, as named in the metrics: its host and port"""
+    return httpx.URL(api.endpoint).netloc.decode("ascii")
+
+class UpstreamResponse(StreamingResponse):
+    """Calls ``on_close`` once the response is over: sent, abandoned by the consumer or never started"""
+
+    def __init__(self, content, status_code: int, headers: List[Tuple[bytes, bytes]], on_close):
+        super().__init__(content, status_code=status_code)
+        # Raw and still encoded: every header but the hop-by-hop ones, repeated ones included
+        self.raw_headers = headers
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+class UpstreamProxy:
+    """Pooled HTTP clients, one per upstream origin, shared by every proxied call of the worker"""
+
+    def __init__(
+        self,
+        timeout: float,
+        connect_timeout: float,
+        pool_timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        guard: UpstreamGuard,
+        http2: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        if http2 and not _http2_available():
+            logging.warning("PROXY_HTTP2 needs the h2 package (pip install 'httpx[http2]'); proxying over HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.guard = guard
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout, pool=pool_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # For tests: replaces the network, and the egress checks, for every upstream
+        self.transport = transport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._flights: Dict[str, SharedResponse] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def client_for(self, url: httpx.URL) -> httpx.AsyncClient:
+        origin = f"{url.scheme}://{url.netloc.decode('ascii')}"
+        client = self._clients.get(origin)
+        if client is None:
+            client = self._clients[origin] = httpx.AsyncClient(
+                timeout=self.timeout,
+                # Connection limits and HTTP/2 are the transport's
+                transport=self.transport or EgressTransport(egress_policy, http2=self.http2, limits=self.limits),
+                follow_redirects=False,
+            )
+        return client
+
+    @staticmethod
+    def upstream_url(api: API, path: str, query_string: bytes) -> httpx.URL:
+        base = api.endpoint.rstrip("/")
+        return httpx.URL(f"{base}/{path}" if path else base, query=query_string)
+
+    async def forward(self, api: API, path: str, request: Request) -> Response:
+        """Send the request to the API's upstream and stream its response back"""
+        if _shareable(api, request):
+            return await self._forward_shared(api, path, request)
+        return await self._forward_streaming(api, path, request)
+
+    async def _forward_streaming(self, api: API, path: str, request: Request) -> Response:
+        """A call of its own, streaming both ways"""
+        url = self.upstream_url(api, path, request.scope.get("query_string", b""))
+        upstream_name = url.netloc.decode("ascii")
+        client = self.client_for(url)
+        upstream_request = client.build_request(
+            request.method,
+            url,
+            headers=forwarded_request_headers(request),
+            content=request.stream() if _has_body(request) else None,
+        )
+        upstream, call = await self._send(client, upstream_request, upstream_name)
+        failed = upstream.status_code >= 500
+
+        async def body() -> AsyncIterator[bytes]:
+            nonlocal failed
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            except httpx.HTTPError as e:
+                failed = True
+                PROXY_UPSTREAM_ERRORS.labels(upstream_label(upstream_name), "body").inc()
+                logging.error(f"Error streaming from upstream {upstream_name}: {e}")
+
+        async def close() -> None:
+            # Even if the consumer went away: the connection returns to the pool, the slot to the limit
+            await upstream.aclose()
+            call.finish(failed)
+
+        return UpstreamResponse(body(), upstream.status_code, forwarded_response_headers(upstream), close)
+
+    async def _forward_shared(self, api: API, path: str, request: Request) -> Response:
+        """Answer from the cache, join an identical call in flight, or lead a new one"""
+        query_string = request.scope.get("query_string", b"")
+        body = await request.body()
+        headers = forwarded_request_headers(request)
+        key = request_key(api.id, request.method, path, query_string, body, headers)
+        url = self.upstream_url(api, path, query_string)
+        upstream_name = url.netloc.decode("ascii")
+
+        if api.cache_ttl_seconds:
+            cached = await proxy_cache.get(key)
+            if cached is not None:
+                PROXY_UPSTREAM_CALLS_SAVED.labels(upstream_label(upstream_name), "cache").inc()
+                response = Response(cached.body, status_code=200)
+                response.raw_headers = _with_header(cached.headers, b"x-gateway-cache", b"hit")
+                return response
+
+        flight = self._flights.get(key) if api.coalesce else None
+        if flight is not None and flight.shareable:
+            PROXY_UPSTREAM_CALLS_SAVED.labels(upstream_label(upstream_name), "coalesced").inc()
+            outcome = b"coalesced"
+        else:
+            client = self.client_for(url)
+            upstream_request = client.build_request(request.method, url, headers=headers, content=body)
+            flight = SharedResponse(max_bytes=settings.PROXY_COALESCE_MAX_BODY_BYTES)
+            if api.coalesce:
+                self._flights[key] = flight
+            # In its own task: callers going away must not cancel the call for the others
+            task = asyncio.create_task(self._fill(flight, key, client, upstream_request, upstream_name, api))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            outcome = b"miss"
+
+        reader = flight.join()
+        try:
+            await flight.wait_started()
+        except BaseException:
+            flight.leave(reader)
+            raise
+        if outcome == b"coalesced" and flight.private:
+            # The response turned out to be for the caller that made it: make our own
+            flight.leave(reader)
+            return await self._forward_streaming(api, path, request)
+        response = StreamingResponse(flight.stream(reader), status_code=flight.status_code)
+        response.raw_headers = _with_header(flight.headers, b"x-gateway-cache", outcome)
+        return response
+
+    async def _fill(
+        self,
+        flight: SharedResponse,
+        key: str,
+        client: httpx.AsyncClient,
+        upstream_request: httpx.Request,
+        upstream_name: str,
+        api: API,
+    ) -> None:
+        """Read the upstream response into ``flight``, then cache it if the API asks to and it may be shared"""
+        try:
+            try:
+                upstream, call = await self._send(client, upstream_request, upstream_name)
+            except HTTPException as e:
+                flight.fail(e)
+                return
+            flight.start(upstream.status_code, forwarded_response_headers(upstream))
+            complete = False
+            try:
+                async for chunk in upstream.aiter_raw():
+                    flight.append(chunk)
+                complete = True
+            except httpx.HTTPError as e:
+                PROXY_UPSTREAM_ERRORS.labels(upstream_label(upstream_name), "body").inc()
+                logging.error(f"Error streaming from upstream {upstream_name}: {e}")
+            finally:
+                await upstream.aclose()
+                call.finish(not complete or upstream.status_code >= 500)
+                flight.finish(complete)
+        finally:
+            if not flight.finished:
+                # Cancelled, e.g. on shutdown
+                flight.fail(HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Upstream call cancelled"))
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        if api.cache_ttl_seconds and flight.complete and flight.shareable and flight.status_code == 200:
+            await proxy_cache.set(
+                key,
+                CachedResponse(flight.body, "", "", tuple(flight.headers)),
+                [f"api:{api.id}"],
+                api.cache_ttl_seconds,
+            )
+
+    async def _send(
+        self, client: httpx.AsyncClient, upstream_request: httpx.Request, upstream_name: str
+    ) -> Tuple[httpx.Response, UpstreamCall]:
+        """Send the request, streaming, within the upstream's concurrency limit.
+
+        Transport failures become the gateway's 502, 503 or 504. The caller must
+        finish the returned call once the response body is done with.
+        """
+        call = await self.guard.acquire(upstream_name)
+        start = time.perf_counter()
+        try:
+            upstream = await client.send(upstream_request, stream=True)
+        except httpx.PoolTimeout:
+            call.finish(failed=True)
+            PROXY_UPSTREAM_ERRORS.labels(upstream_label(upstream_name), "pool_timeout").inc()
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Upstream is busy")
+        except UpstreamNotAllowed as e:
+            call.finish(failed=True)
+            PROXY_UPSTREAM_ERRORS.labels(upstream_label(upstream_name), "blocked").inc()
+            logging.warning(f"Refused to call upstream {upstream_name}: {e}")
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Upstream address not allowed")
+        except httpx.TimeoutException:
+            call.finish(failed=True)
+            PROXY_UPSTREAM_ERRORS.labels(upstream_label(upstream_name), "timeout").inc()
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Upstream timed out")
+        except httpx.HTTPError as e:
+            call.finish(failed=True)
+            PROXY_UPSTREAM_ERRORS.labels(upstream_label(upstream_name), "unavailable").inc()
+            logging.error(f"Error calling upstream {upstream_name}: {e}")
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Upstream unavailable")
+        except BaseException:
+            call.finish(failed=True)
+            raise
+        call.responded()
+        PROXY_UPSTREAM_SECONDS.labels(upstream_label(upstream_name)).observe(time.perf_counter() - start)
+        return upstream, call
+
+    async def close(self) -> None:
+        tasks, self._tasks = self._tasks, set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+PROXY_UPSTREAM_SECONDS = Histogram(
+    "proxy_upstream_duration_seconds", "Time to the upstream's response headers, by upstream host", ["upstream"], buckets=DEFAULT_BUCKETS
+)
+PROXY_UPSTREAM_ERRORS = Counter(
+    "proxy_upstream_errors_total",
+    "Proxied calls that failed: pool_timeout, timeout, unavailable, blocked (non-public address) or body (failed mid-stream)",
+    ["upstream", "reason"],
+)
+
+upstream_proxy = UpstreamProxy(
+    timeout=settings.PROXY_TIMEOUT_SECONDS,
+    connect_timeout=settings.PROXY_CONNECT_TIMEOUT_SECONDS,
+    pool_timeout=settings.PROXY_POOL_TIMEOUT_SECONDS,
+    max_connections=settings.PROXY_MAX_CONNECTIONS_PER_UPSTREAM,
+    max_keepalive_connections=settings.PROXY_MAX_KEEPALIVE_PER_UPSTREAM,
+    keepalive_expiry=settings.PROXY_KEEPALIVE_EXPIRY_SECONDS,
+    guard=upstream_guard,
+    http2=settings.PROXY_HTTP2,
+)
+
+sampled_gauge("proxy_upstream_pools", "Upstream origins with a connection pool in the worker", lambda: len(upstream_proxy))
@@ -0,0 +1,151 @@
+import datetime
+import logging
+from abc import ABC, abstractmethod
+import math
+import time
+from typing import NamedTuple
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from ..core.cache import TTLCache
+from ..core.config import settings
+from ..core.metrics import Counter
+from ..db.mongodb import MongoDB
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the limit is fully replenished
+    reset_after: float
+    # Seconds to wait before retrying, when not allowed
+    retry_after: float
+
+class RateLimitBackend(ABC):
+    """Stores rate limit state; ``hit`` counts one request against ``key``"""
+
+    @abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> RateLimitResult:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """GCRA (token bucket) state for this worker: one float per key, O(1) per request.
+
+    No lock is needed: ``hit`` never awaits, so it runs atomically on the event loop.
+    """
+
+    def __init__(self, maxsize: int, timer=time.monotonic):
+        self.timer = timer
+        # An idle key whose bucket is full again carries no state, so entries only
+        # need to live for one window; the LRU bound caps memory under key floods.
+        self._tats = TTLCache(maxsize=maxsize, ttl=math.inf, timer=timer)
+
+    async def hit(self, key: str, limit: int, window: float) -> RateLimitResult:
+        return self.hit_nowait(key, limit, window)
+
+    def hit_nowait(self, key: str, limit: int, window: float) -> RateLimitResult:
+        now = self.timer()
+        interval = window / limit
+        tat = max(self._tats.get(key, now), now)
+        new_tat = tat + interval
+        allow_at = new_tat - window
+        if now < allow_at:
+            return RateLimitResult(False, limit, 0, tat - now, allow_at - now)
+
+        self._tats.set(key, new_tat, ttl=new_tat - now)
+        remaining = int((window - (new_tat - now)) / interval + 1e-9)
+        return RateLimitResult(True, limit, remaining, new_tat - now, 0.0)
+
+    def clear(self) -> None:
+        self._tats.clear()
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """Sliding-window counter shared by every worker through the ``rate_limits`` collection.
+
+    Each request increments the counter of the current fixed window; the previous
+    window's count, weighted by how much of it still overlaps the sliding window,
+    approximates the rest. A closed window never changes again, so its count is
+    cached in-process and a request costs a single round-trip.
+
+    When MongoDB fails, requests are not turned into errors: they are counted by
+    this worker's own GCRA limiter until it is back.
+    """
+
+    def __init__(self, maxsize: int, timer=time.time):
+        self.timer = timer
+        self._closed_windows = TTLCache(maxsize=maxsize, ttl=math.inf, timer=timer)
+        self.fallback = MemoryRateLimitBackend(maxsize=maxsize)
+
+    @property
+    def collection(self):
+        return MongoDB.get_db().rate_limits
+
+    async def hit(self, key: str, limit: int, window: float) -> RateLimitResult:
+        try:
+            return await self._hit(key, limit, window)
+        except PyMongoError as e:
+            RATE_LIMIT_BACKEND_ERRORS.inc()
+            logging.error(f"Rate limit backend unavailable, limiting in-process: {e}")
+            return self.fallback.hit_nowait(key, limit, window)
+
+    async def _hit(self, key: str, limit: int, window: float) -> RateLimitResult:
+        now = self.timer()
+        current = int(now // window)
+        elapsed = now - current * window
+
+        doc = await self.collection.find_one_and_update(
+            {"_id": f"{key}:{current}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {
+                    "expires_at": datetime.datetime.fromtimestamp((current + 2) * window, datetime.timezone.utc)
+                },
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        count = doc["count"]
+
+        previous_key = f"{key}:{current - 1}"
+        previous = self._closed_windows.get(previous_key)
+        if previous is None:
+            previous_doc = await self.collection.find_one({"_id": previous_key})
+            previous = previous_doc["count"] if previous_doc else 0
+            self._closed_windows.set(previous_key, previous, ttl=2 * window - elapsed)
+
+        weight = 1 - elapsed / window
+        estimated = previous * weight + count
+        reset_after = window - elapsed
+        if estimated <= limit:
+            return RateLimitResult(True, limit, int(limit - estimated), reset_after, 0.0)
+
+        if count >= limit or not previous:
+            retry_after = reset_after
+        else:
+            # Wait until the previous window's weight has decayed enough
+            retry_after = max(0.0, (1 - (limit - count) / previous) * window - elapsed)
+        return RateLimitResult(False, limit, 0, reset_after, retry_after)
+
+    def clear(self) -> None:
+        self._closed_windows.clear()
+        self.fallback.clear()
+
+def create_backend(name: str) -> RateLimitBackend:
+    if name == "auto":
+        # Per-process counters would multiply the limit by the number of workers
+        name = "mongo" if settings.WEB_CONCURRENCY > 1 else "memory"
+    if name == "memory":
+        return MemoryRateLimitBackend(maxsize=settings.RATE_LIMIT_MAX_KEYS)
+    if name == "mongo":
+        return MongoRateLimitBackend(maxsize=settings.RATE_LIMIT_MAX_KEYS)
+    raise ValueError(f"Unknown rate limit backend: {name}")
+
+RATE_LIMIT_BACKEND_ERRORS = Counter(
+    "rate_limit_backend_errors_total",
+    "Rate limited requests counted in-process because the shared backend failed",
+)
+
+rate_limit_backend = create_backend(settings.RATE_LIMIT_BACKEND)
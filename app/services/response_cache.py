@@ -0,0 +1,129 @@
+import importlib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+from ..core.config import settings
+from ..core.metrics import Counter, sampled_gauge
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    etag: str
+    headers: Tuple[Tuple[bytes, bytes], ...] = ()  # the whole raw header list, for proxied responses
+
+class ResponseCacheBackend(ABC):
+    """Stores rendered responses by key; every entry carries tags to invalidate it by"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, response: CachedResponse, tags: Iterable[str], ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def invalidate(self, *tags: str) -> int:
+        """Drop every entry carrying any of ``tags``; returns how many were dropped"""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+class _Entry(NamedTuple):
+    expires: float
+    response: CachedResponse
+    tags: tuple
+
+class MemoryResponseCacheBackend(ResponseCacheBackend):
+    """LRU of responses held by this worker, capped by entry count and by body bytes.
+
+    Invalidation only reaches this worker's entries: a change made through another
+    worker shows up here once the entry's TTL runs out. No lock is needed, no
+    method awaits between reading and updating the LRU.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, timer=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timer = timer
+        self.size = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._keys_by_tag: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= self.timer():
+            self._remove(key, "expired")
+            return None
+        self._entries.move_to_end(key)
+        return entry.response
+
+    async def set(self, key: str, response: CachedResponse, tags: Iterable[str], ttl: float) -> None:
+        if key in self._entries:
+            self._remove(key, "replaced")
+        if ttl <= 0 or len(response.body) > self.max_bytes:
+            return
+        entry = _Entry(self.timer() + ttl, response, tuple(tags))
+        self._entries[key] = entry
+        self.size += len(response.body)
+        for tag in entry.tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)), "evicted")
+
+    async def invalidate(self, *tags: str) -> int:
+        dropped = 0
+        for tag in tags:
+            for key in self._keys_by_tag.pop(tag, ()):
+                if key in self._entries:
+                    self._remove(key, "invalidated")
+                    dropped += 1
+        return dropped
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_tag.clear()
+        self.size = 0
+
+    def _remove(self, key: str, reason: str) -> None:
+        entry = self._entries.pop(key)
+        self.size -= len(entry.response.body)
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+        RESPONSE_CACHE_REMOVED.labels(reason).inc()
+
+def create_backend(name: str) -> ResponseCacheBackend:
+    if name == "memory":
+        return MemoryResponseCacheBackend(
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+        )
+    if ":" in name:
+        # A custom backend, e.g. "myapp.cache:RedisResponseCacheBackend", built without arguments
+        module, _, attribute = name.partition(":")
+        return getattr(importlib.import_module(module), attribute)()
+    raise ValueError(f"Unknown response cache backend: {name}")
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "Cacheable requests by outcome: hit, not_modified (304 from the cache), miss",
+    ["route", "outcome"],
+)
+RESPONSE_CACHE_REMOVED = Counter("response_cache_removed_total", "Cached responses dropped, by reason", ["reason"])
+
+response_cache = create_backend(settings.RESPONSE_CACHE_BACKEND)
+
+if isinstance(response_cache, MemoryResponseCacheBackend):
+    sampled_gauge("response_cache_entries", "Responses cached by the worker", lambda: len(response_cache))
+    sampled_gauge("response_cache_bytes", "Body bytes of the responses cached by the worker", lambda: response_cache.size)
@@ -0,0 +1,141 @@
+import asyncio
+import datetime
+import heapq
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from ..core.config import settings
+from ..core.metrics import sampled_gauge
+from ..db.mongodb import MongoDB
+
+def _epoch(value: datetime.datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+class RevocationList:
+    """Revoked token ids (``jti``) of tokens that have not expired yet.
+
+    Lets the auth middleware check a signed token with a set lookup instead of
+    reading the token document. Revocations are appended to the
+    ``token_revocations`` change log and every worker replays new entries every
+    ``sync_interval`` seconds, so a revocation made elsewhere is enforced within
+    that delay. An entry is dropped once its token expires: the signature check
+    rejects the token from then on anyway.
+
+    Entries are read with an ``overlap`` of a few seconds behind the last one seen.
+    This tolerates clock skew between workers and writes that commit out of order;
+    replaying an entry twice is harmless. Until a sync has succeeded within
+    ``max_staleness`` seconds, ``fresh`` is False and callers should check the
+    database instead.
+    """
+
+    def __init__(self, sync_interval: float, overlap: float, max_staleness: float):
+        self.sync_interval = sync_interval
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.max_staleness = max_staleness
+        self._revoked: Dict[str, float] = {}
+        self._expiries: List[Tuple[float, str]] = []
+        self._high_water: Optional[datetime.datetime] = None
+        self._last_sync: Optional[float] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    @property
+    def fresh(self) -> bool:
+        return self._last_sync is not None and time.monotonic() - self._last_sync <= self.max_staleness
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def add(self, jti: str, expires_at: datetime.datetime) -> None:
+        expires = _epoch(expires_at)
+        if expires <= time.time() or self._revoked.get(jti) == expires:
+            return
+        self._revoked[jti] = expires
+        heapq.heappush(self._expiries, (expires, jti))
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """Forget revocations of tokens that have expired"""
+        now = time.time() if now is None else now
+        while self._expiries and self._expiries[0][0] <= now:
+            expires, jti = heapq.heappop(self._expiries)
+            if self._revoked.get(jti) == expires:
+                del self._revoked[jti]
+
+    def clear(self) -> None:
+        self._revoked.clear()
+        self._expiries.clear()
+        self._high_water = self._last_sync = None
+
+    async def revoke(self, jti: str, user_id: str, expires_at: datetime.datetime) -> None:
+        """Append a revocation to the change log and apply it to this worker right away"""
+        revoked_at = datetime.datetime.now(datetime.timezone.utc)
+        await MongoDB.get_db().token_revocations.update_one(
+            {"jti": jti},
+            {"$set": {"user_id": user_id, "expires_at": expires_at, "revoked_at": revoked_at}},
+            upsert=True
+        )
+        self.add(jti, expires_at)
+
+    async def sync(self) -> int:
+        """Replay the change log entries added since the last sync; returns how many were read"""
+        if self._high_water is None:
+            query = {"expires_at": {"$gt": datetime.datetime.now(datetime.timezone.utc)}}
+        else:
+            query = {"revoked_at": {"$gte": self._high_water - self.overlap}}
+        projection = {"_id": 0, "jti": 1, "expires_at": 1, "revoked_at": 1}
+        entries = await MongoDB.get_db().token_revocations.find(query, projection).to_list(length=None)
+
+        for entry in entries:
+            self.add(entry["jti"], entry["expires_at"])
+            revoked_at = entry["revoked_at"]
+            if revoked_at.tzinfo is None:
+                revoked_at = revoked_at.replace(tzinfo=datetime.timezone.utc)
+            if self._high_water is None or revoked_at > self._high_water:
+                self._high_water = revoked_at
+        if self._high_water is None:
+            self._high_water = datetime.datetime.now(datetime.timezone.utc)
+        self.prune()
+        self._last_sync = time.monotonic()
+        return len(entries)
+
+    def start(self) -> None:
+        """Start syncing in the background on the running event loop"""
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._stopping.set()
+        await self._worker
+        self._worker = None
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self.sync()
+            except Exception as e:
+                logging.error(f"Error syncing token revocations: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+
+revocation_list = RevocationList(
+    sync_interval=settings.REVOCATION_SYNC_INTERVAL_SECONDS,
+    overlap=settings.REVOCATION_SYNC_OVERLAP_SECONDS,
+    max_staleness=settings.REVOCATION_MAX_STALENESS_SECONDS,
+)
+
+sampled_gauge("revoked_tokens", "Unexpired revoked tokens known to the worker", lambda: len(revocation_list), multiprocess_mode="livemax")
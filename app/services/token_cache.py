@@ -0,0 +1,64 @@
+import datetime
+import hashlib
+from typing import NamedTuple
+from ..core.cache import TTLCache
+from ..core.config import settings
+from ..core.metrics import sampled_gauge
+
+class CachedToken(NamedTuple):
+    """The subset of a token document the middlewares need on every request"""
+    token_id: str | None
+    user_id: str
+    is_active: bool
+    expires_at: datetime.datetime
+
+def hash_token(token_value: str) -> str:
+    """Cache key for a token, so raw bearer tokens are never held as keys"""
+    return hashlib.sha256(token_value.encode()).hexdigest()
+
+class TokenCache:
+    """Validated tokens shared by the auth and usage middlewares of this worker"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._keys_by_id: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, token_value: str) -> CachedToken | None:
+        return self._cache.get(hash_token(token_value))
+
+    def set(self, token_value: str, token: CachedToken) -> None:
+        expires_at = token.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+        # Never keep a token cached past its own expiry
+        remaining = (expires_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        key = hash_token(token_value)
+        self._cache.set(key, token, ttl=remaining)
+        if token.token_id and key in self._cache:
+            if len(self._keys_by_id) >= 2 * self._cache.maxsize:
+                self._prune_ids()
+            self._keys_by_id[token.token_id] = key
+
+    def invalidate(self, token_id: str) -> None:
+        key = self._keys_by_id.pop(token_id, None)
+        if key is not None:
+            self._cache.pop(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._keys_by_id.clear()
+
+    def _prune_ids(self) -> None:
+        self._keys_by_id = {
+            token_id: key for token_id, key in self._keys_by_id.items() if key in self._cache
+        }
+
+token_cache = TokenCache(
+    maxsize=settings.TOKEN_CACHE_MAX_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS,
+)
+
+sampled_gauge("token_cache_entries", "Validated tokens cached by the worker", lambda: len(token_cache))
@@ -1,79 +1,164 @@
 import datetime
-from typing import List
+from typing import Dict, List
 from ..db.mongodb import MongoDB
 from ..models.token import Token
+from ..core.log import get_hot_path_logger
+from ..core.metrics import db_operation
+from .token_cache import CachedToken, token_cache
+from .revocation import revocation_list
+from .response_cache import response_cache
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 import logging
 
+hot_logger = get_hot_path_logger(__name__)
+
+# Token documents are written from Token.model_dump(), so reads can skip the model
+TOKEN_PROJECTION = {"_id": 0, **dict.fromkeys(Token.model_fields, 1)}
+TOKEN_DEFAULTS = {
+    name: field.default
+    for name, field in Token.model_fields.items()
+    if not field.is_required() and field.default_factory is None
+}
+
 class TokenService:
     def __init__(self):
         self.db = MongoDB.get_db()
         self.collection = self.db.tokens
 
-    def create_token(self, token: Token) -> Token:
+    @db_operation
+    async def create_token(self, token: Token) -> Token:
         """Create a new token"""
-        # Generate ID before inserting
-        token.id = str(ObjectId())
-        result = self.collection.insert_one(token.model_dump())
+        # Generate ID before inserting, unless it was already signed into the JWT as its jti
+        if token.id is None:
+            token.id = str(ObjectId())
+        result = await self.collection.insert_one(token.model_dump())
+        await response_cache.invalidate(f"tokens:{token.user_id}")
         return token
 
-    def get_user_tokens(self, user_id: str) -> List[Token]:
-        return [Token(**token) for token in self.collection.find({"user_id": user_id})]
+    @db_operation
+    async def get_user_tokens(self, user_id: str) -> List[Token]:
+        tokens = await self.collection.find({"user_id": user_id}).to_list(length=None)
+        return [Token(**token) for token in tokens]
+
+    @db_operation
+    async def get_user_token_documents(self, user_id: str) -> List[dict]:
+        """A user's tokens as plain documents with the Token fields, ready to encode as JSON"""
+        tokens = await self.collection.find({"user_id": user_id}, TOKEN_PROJECTION).to_list(length=None)
+        # Fields added to the model after a document was written take their default
+        return [{**TOKEN_DEFAULTS, **token} for token in tokens]
 
-    def get_token(self, token_id: str) -> Token | None:
+    @db_operation
+    async def get_token(self, token_id: str) -> Token | None:
         """Get token by its ID"""
         try:
-            token_data = self.collection.find_one({"id": token_id})
-            logging.info(f"Getting token by ID {token_id}, found: {token_data}")
+            token_data = await self.collection.find_one({"id": token_id})
+            hot_logger.debug("Getting token by ID %s, found: %s", token_id, token_data is not None)
             return Token(**token_data) if token_data else None
         except Exception as e:
             logging.error(f"Error getting token: {e}")
             return None
 
-    def deactivate_token(self, token_id: str) -> bool:
-        """Deactivate a token"""
-        try:
-            logging.info(f"Deactivating token {token_id}")
-            result = self.collection.update_one(
-                {"id": token_id},  # Use the stored ID field
-                {"$set": {"is_active": False}}
-            )
-            logging.info(f"Deactivation result: {result.modified_count}")
-            
-            # Verify the update
-            token = self.get_token(token_id)
-            logging.info(f"Token after deactivation: {token.model_dump() if token else None}")
-            
-            return result.modified_count > 0
-        except Exception as e:
-            logging.error(f"Error deactivating token: {e}")
+    @db_operation
+    async def deactivate_token(self, token_id: str) -> bool:
+        """Deactivate a token and publish its revocation to every worker.
+
+        The revocation is logged first: once it is, stateless checks reject the token
+        even if the deactivation fails. Failures propagate, nothing is left half done
+        behind a False.
+        """
+        token = await self.collection.find_one(
+            {"id": token_id},  # Use the stored ID field
+            projection={"user_id": 1, "is_active": 1, "expires_at": 1}
+        )
+        if token is None or not token.get("is_active", True):
             return False
+        await revocation_list.revoke(token_id, token["user_id"], token["expires_at"])
+        previous = await self.collection.find_one_and_update(
+            {"id": token_id},
+            {"$set": {"is_active": False}},
+            projection={"is_active": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        token_cache.invalidate(token_id)
+        await response_cache.invalidate(f"tokens:{token['user_id']}")
+        deactivated = previous is not None and previous.get("is_active", True)
+        logging.info("Deactivated token %s: %s", token_id, deactivated)
+        return deactivated
 
-    def get_token_by_value(self, token_value: str) -> Token | None:
+    @db_operation
+    async def get_token_by_value(self, token_value: str) -> Token | None:
         """Get token by its value"""
         try:
-            token_data = self.collection.find_one({"token": token_value})
+            token_data = await self.collection.find_one({"token": token_value})
             if not token_data:
                 return None
             
-            # Ensure ID is set
-            if "_id" in token_data:
+            # Ensure ID is set; a stored ID is kept since the JWT carries it as its jti
+            if "_id" in token_data and not token_data.get("id"):
                 token_data["id"] = str(token_data["_id"])
                 # Update the stored document with the id field
-                self.collection.update_one(
+                await self.collection.update_one(
                     {"_id": token_data["_id"]},
                     {"$set": {"id": token_data["id"]}}
                 )
                 
-            logging.info(f"Found token data: {token_data}")
+            hot_logger.debug("Found token %s for user %s", token_data.get("id"), token_data.get("user_id"))
             return Token(**token_data) if token_data else None
         except Exception as e:
             logging.error(f"Error getting token by value: {e}")
             return None
 
-    def update_last_used(self, token: str) -> bool:
-        result = self.collection.update_one(
+    async def get_cached_token(self, token_value: str) -> CachedToken | None:
+        """Get the validation fields of a token, from the in-process cache when possible"""
+        cached = token_cache.get(token_value)
+        if cached is not None:
+            return cached
+
+        token = await self.get_token_by_value(token_value)
+        if not token:
+            return None
+
+        cached = CachedToken(
+            token_id=token.id,
+            user_id=token.user_id,
+            is_active=token.is_active,
+            expires_at=token.expires_at,
+        )
+        token_cache.set(token_value, cached)
+        return cached
+
+    @staticmethod
+    def token_from_claims(claims: dict) -> CachedToken | None:
+        """The validation fields of a verified JWT that names its token ID, without a lookup"""
+        if not claims.get("jti") or not claims.get("user_id") or "exp" not in claims:
+            return None
+        return CachedToken(
+            token_id=claims["jti"],
+            user_id=claims["user_id"],
+            is_active=True,
+            expires_at=datetime.datetime.fromtimestamp(claims["exp"], datetime.timezone.utc),
+        )
+
+    @db_operation
+    async def update_last_used(self, token: str) -> bool:
+        result = await self.collection.update_one(
             {"token": token},
             {"$set": {"last_used": datetime.datetime.now(datetime.timezone.utc)}}
         )
-        return result.modified_count > 0 
\ No newline at end of file
+        return result.modified_count > 0
+
+    @db_operation
+    async def update_last_used_many(self, last_used: Dict[str, datetime.datetime]) -> int:
+        """Bump last_used for several tokens, each to its own time, in a single bulk write"""
+        if not last_used:
+            return 0
+        # Only move last_used forward; spelled as a filter since $max chokes on a null field in mongomock
+        result = await self.collection.bulk_write([
+            UpdateOne(
+                {"token": token, "$or": [{"last_used": None}, {"last_used": {"$lt": used_at}}]},
+                {"$set": {"last_used": used_at}}
+            )
+            for token, used_at in last_used.items()
+        ], ordered=False)
+        return result.modified_count
@@ -0,0 +1,344 @@
+"""Per-upstream protection for proxied calls: adaptive concurrency limits and circuit breakers.
+
+Every upstream gets a concurrency limit that adapts to it (AIMD). A call that
+comes back within ``latency_tolerance`` times the upstream's baseline latency
+raises the limit by about one per limit's worth of calls. A slower call, a 5xx or
+a transport failure cuts it by ``backoff``, at most once per round trip. Calls
+over the limit wait in a bounded FIFO queue, each until its deadline, and are
+turned away with a 503 when the queue is full or the deadline passes.
+
+A circuit breaker watches the share of failed calls over the last
+``window_seconds``. Past ``error_threshold``, with at least ``min_calls`` calls
+seen, it opens and calls fail fast for ``open_seconds``, the queued ones
+included. Then up to ``half_open_calls`` probe calls go through: one failure
+opens the circuit again, and the circuit closes once that many probes have
+succeeded.
+
+All of it is per worker, like the connection pools it sits in front of.
+"""
+import asyncio
+import math
+import operator
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from ..core.config import settings
+from ..core.metrics import BoundedLabel, Counter, sampled_gauge
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+def _overloaded(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        error_threshold: float,
+        min_calls: int,
+        window_seconds: float,
+        open_seconds: float,
+        half_open_calls: int,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.timer = timer
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()  # (time, failed) over the window
+        self._failures = 0
+        self._probes = 0  # probe calls let through while half-open
+        self._probe_successes = 0
+
+    def allow(self) -> None:
+        """Let a call through, or raise the 503 of an open circuit"""
+        if self.state == OPEN:
+            if self.remaining() > 0:
+                raise self.rejection()
+            self.state, self._probes, self._probe_successes = HALF_OPEN, 0, 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                raise _overloaded("Upstream circuit is half-open", self.open_seconds)
+            self._probes += 1
+
+    def remaining(self) -> float:
+        """Seconds until an open circuit lets probe calls through"""
+        return self.opened_at + self.open_seconds - self.timer()
+
+    def rejection(self) -> HTTPException:
+        return _overloaded("Upstream circuit is open", self.remaining())
+
+    def cancel(self) -> None:
+        """A call let through by allow() was not made after all"""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record(self, failed: bool) -> None:
+        now = self.timer()
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open(now)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+            return
+        if self.state == OPEN:
+            return  # a call let through before the circuit opened
+
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+            self._failures -= self._outcomes.popleft()[1]
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.error_threshold:
+            self._open(now)
+
+    @property
+    def error_rate(self) -> float:
+        return self._failures / len(self._outcomes) if self._outcomes else 0.0
+
+    def _open(self, now: float) -> None:
+        self.state, self.opened_at = OPEN, now
+        self._outcomes.clear()
+        self._failures = 0
+
+class AdaptiveConcurrencyLimit:
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float,
+        backoff: float,
+        max_queue: int,
+        queue_timeout: float,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timer = timer
+        self.in_flight = 0
+        self.baseline: Optional[float] = None  # tracks the lowest recent latency
+        self._last_decrease = -math.inf
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting in the queue up to ``queue_timeout`` if none is free"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            UPSTREAM_REJECTED.labels(upstream_label(self.name), "queue_full").inc()
+            raise _overloaded("Upstream is overloaded", self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # The slot is handed over by release(), already counted in in_flight
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # Granted just as the wait ended: give the slot to the next caller
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                UPSTREAM_REJECTED.labels(upstream_label(self.name), "queue_timeout").inc()
+                raise _overloaded("Upstream is overloaded", self.queue_timeout)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def reject_waiters(self, error: HTTPException) -> None:
+        """Fail every call waiting in the queue with ``error``"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(error)
+
+    def record(self, latency: Optional[float], failed: bool) -> None:
+        """Adapt the limit to a finished call; ``latency`` is to the response headers"""
+        if latency is not None and not failed:
+            # Drops to a faster sample at once, drifts up 1% of the way to slower ones
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * 0.01
+        slow = latency is not None and self.baseline is not None and latency > self.baseline * self.latency_tolerance
+        if failed or slow:
+            now = self.timer()
+            # Once per round trip: the calls of one slow or failing burst count as one signal
+            if now - self._last_decrease >= (latency or self.baseline or 0.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight + 1 >= self.limit / 2:
+            # Only grow a limit that is being used; +1 per limit's worth of calls
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+class UpstreamCall:
+    """One proxied call holding a slot of its upstream; finish() exactly once"""
+    __slots__ = ("state", "started", "latency", "finished")
+
+    def __init__(self, state: "UpstreamState"):
+        self.state = state
+        self.started = time.perf_counter()
+        self.latency: Optional[float] = None
+        self.finished = False
+
+    def responded(self) -> None:
+        self.latency = time.perf_counter() - self.started
+
+    def finish(self, failed: bool) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        limiter, breaker = self.state.limiter, self.state.breaker
+        breaker.record(failed)
+        if breaker.state == OPEN and limiter.queued:
+            # The calls waiting for a slot fail fast too
+            UPSTREAM_REJECTED.labels(upstream_label(limiter.name), "circuit_open").inc(limiter.queued)
+            limiter.reject_waiters(breaker.rejection())
+        limiter.release()
+        limiter.record(self.latency, failed)
+
+class UpstreamState:
+    def __init__(self, limiter: AdaptiveConcurrencyLimit, breaker: CircuitBreaker):
+        self.limiter = limiter
+        self.breaker = breaker
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "queued": self.limiter.queued,
+            "baseline_latency_ms": self.limiter.baseline * 1000 if self.limiter.baseline is not None else None,
+            "circuit_state": self.breaker.state,
+            "error_rate": self.breaker.error_rate,
+        }
+
+class UpstreamGuard:
+    """Concurrency limit and circuit breaker of every upstream, created on first use"""
+
+    def __init__(self, limit_options: dict, breaker_options: dict, timer: Callable[[], float] = time.monotonic):
+        self.limit_options = limit_options
+        self.breaker_options = breaker_options
+        self.timer = timer
+        self._states: Dict[str, UpstreamState] = {}
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def state(self, upstream: str) -> UpstreamState:
+        state = self._states.get(upstream)
+        if state is None:
+            state = self._states[upstream] = UpstreamState(
+                AdaptiveConcurrencyLimit(upstream, timer=self.timer, **self.limit_options),
+                CircuitBreaker(timer=self.timer, **self.breaker_options),
+            )
+        return state
+
+    async def acquire(self, upstream: str) -> UpstreamCall:
+        """A slot for a call to ``upstream``; raises a 503 when the circuit is open or the queue is full"""
+        state = self.state(upstream)
+        try:
+            state.breaker.allow()
+        except HTTPException:
+            UPSTREAM_REJECTED.labels(upstream_label(upstream), "circuit_open").inc()
+            raise
+        try:
+            await state.limiter.acquire()
+        except BaseException:
+            state.breaker.cancel()
+            raise
+        if state.breaker.state == OPEN:
+            # Opened while the call waited for a slot
+            state.limiter.release()
+            UPSTREAM_REJECTED.labels(upstream_label(upstream), "circuit_open").inc()
+            raise state.breaker.rejection()
+        return UpstreamCall(state)
+
+    def snapshot(self, upstream: str) -> Optional[dict]:
+        state = self._states.get(upstream)
+        return state.snapshot() if state is not None else None
+
+    def clear(self) -> None:
+        self._states.clear()
+
+    def _gauge(self, value: Callable[[UpstreamState], float], combine: Callable[[float, float], float] = operator.add) -> dict:
+        values: dict = {}
+        for upstream, state in self._states.items():
+            key = (upstream_label(upstream),)
+            values[key] = combine(values[key], value(state)) if key in values else value(state)
+        return values
+
+# Upstream hosts come from the APIs users publish: bound the series they add
+upstream_label = BoundedLabel(settings.PROXY_METRICS_MAX_UPSTREAMS)
+
+UPSTREAM_REJECTED = Counter(
+    "upstream_rejected_total",
+    "Proxied calls turned away before reaching the upstream: circuit_open, queue_full or queue_timeout",
+    ["upstream", "reason"],
+)
+
+upstream_guard = UpstreamGuard(
+    limit_options=dict(
+        initial=settings.UPSTREAM_CONCURRENCY_INITIAL,
+        min_limit=settings.UPSTREAM_CONCURRENCY_MIN,
+        # More would only wait for a connection of the pool
+        max_limit=settings.PROXY_MAX_CONNECTIONS_PER_UPSTREAM,
+        latency_tolerance=settings.UPSTREAM_LATENCY_TOLERANCE,
+        backoff=settings.UPSTREAM_CONCURRENCY_BACKOFF,
+        max_queue=settings.UPSTREAM_QUEUE_SIZE,
+        queue_timeout=settings.UPSTREAM_QUEUE_TIMEOUT_SECONDS,
+    ),
+    breaker_options=dict(
+        error_threshold=settings.CIRCUIT_ERROR_THRESHOLD,
+        min_calls=settings.CIRCUIT_MIN_CALLS,
+        window_seconds=settings.CIRCUIT_WINDOW_SECONDS,
+        open_seconds=settings.CIRCUIT_OPEN_SECONDS,
+        half_open_calls=settings.CIRCUIT_HALF_OPEN_CALLS,
+    ),
+)
+
+sampled_gauge("upstream_concurrency_limit", "Adaptive concurrency limit of each upstream",
+              lambda: upstream_guard._gauge(lambda state: int(state.limiter.limit)), ["upstream"])
+sampled_gauge("upstream_in_flight", "Proxied calls in flight to each upstream",
+              lambda: upstream_guard._gauge(lambda state: state.limiter.in_flight), ["upstream"])
+sampled_gauge("upstream_queued", "Proxied calls waiting for a slot of each upstream",
+              lambda: upstream_guard._gauge(lambda state: state.limiter.queued), ["upstream"])
+sampled_gauge("upstream_circuit_state", "Circuit of each upstream: 0 closed, 1 half-open, 2 open",
+              lambda: upstream_guard._gauge(lambda state: CIRCUIT_STATE_VALUES[state.breaker.state], max), ["upstream"],
+              multiprocess_mode="livemax")
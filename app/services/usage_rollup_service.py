@@ -0,0 +1,208 @@
+import asyncio
+import datetime
+from typing import Dict, Iterable, List
+from pymongo import UpdateOne
+from ..core.config import settings
+from ..db.mongodb import MongoDB
+from ..db.indexes import ensure_indexes
+from ..models.usage import AnyUsage
+from .response_cache import response_cache
+
+GRANULARITIES = ("minute", "hour")
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+def truncate(timestamp: datetime.datetime, granularity: str) -> datetime.datetime:
+    """Start of the minute or hour bucket a timestamp falls into, in UTC"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    timestamp = timestamp.astimezone(datetime.timezone.utc).replace(second=0, microsecond=0)
+    if granularity == "hour":
+        timestamp = timestamp.replace(minute=0)
+    return timestamp
+
+def status_class(status_code: int) -> str:
+    return f"{min(max(status_code // 100, 1), 5)}xx"
+
+def granularity_for(start_date: datetime.datetime, end_date: datetime.datetime) -> str:
+    """Minute buckets for short recent windows, hour buckets beyond a day or once minute buckets expired"""
+    if end_date - start_date > datetime.timedelta(days=1):
+        return "hour"
+    retained = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=settings.USAGE_MINUTE_ROLLUP_RETENTION_DAYS)
+    return "minute" if truncate(start_date, "minute") >= retained else "hour"
+
+class UsageRollupService:
+    """Per-user, per-endpoint usage counters bucketed by minute and by hour.
+
+    Endpoints are route templates, like the request metrics: raw paths carry IDs and
+    proxied paths, and would make a bucket of their own for each one.
+
+    Buckets are updated incrementally as usage records are written, so statistics
+    and costs never have to scan the raw ``usage`` collection. A running total per
+    user is kept alongside in ``usage_totals`` for reports across all users.
+    """
+
+    def __init__(self):
+        self.db = MongoDB.get_db()
+        self.collection = self.db.usage_rollups
+
+    async def record(self, usages: Iterable[AnyUsage]) -> int:
+        """Fold a batch of usage records into their rollup buckets"""
+        buckets: Dict[tuple, dict] = {}
+        totals: Dict[str, dict] = {}
+        for usage in usages:
+            total = totals.setdefault(usage.user_id, {"count": 0, "latency_sum": 0.0})
+            total["count"] += 1
+            total["latency_sum"] += usage.response_time
+            for granularity in GRANULARITIES:
+                key = (usage.user_id, usage.route or usage.endpoint, granularity, truncate(usage.timestamp, granularity))
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = {
+                        "count": 0,
+                        "statuses": dict.fromkeys(STATUS_CLASSES, 0),
+                        "latency_sum": 0.0,
+                        "latency_min": usage.response_time,
+                        "latency_max": usage.response_time,
+                    }
+                bucket["count"] += 1
+                bucket["statuses"][status_class(usage.status_code)] += 1
+                bucket["latency_sum"] += usage.response_time
+                bucket["latency_min"] = min(bucket["latency_min"], usage.response_time)
+                bucket["latency_max"] = max(bucket["latency_max"], usage.response_time)
+
+        if not buckets:
+            return 0
+        # One unordered bulk write per collection: a round trip each, run side by side
+        await asyncio.gather(
+            self.collection.bulk_write([
+                UpdateOne(
+                    {"user_id": user_id, "endpoint": endpoint, "granularity": granularity, "bucket": bucket_start},
+                    {
+                        "$inc": {
+                            "count": bucket["count"],
+                            "latency_sum": bucket["latency_sum"],
+                            **{f"statuses.{name}": n for name, n in bucket["statuses"].items() if n},
+                        },
+                        "$min": {"latency_min": bucket["latency_min"]},
+                        "$max": {"latency_max": bucket["latency_max"]},
+                    },
+                    upsert=True
+                )
+                for (user_id, endpoint, granularity, bucket_start), bucket in buckets.items()
+            ], ordered=False),
+            self.db.usage_totals.bulk_write([
+                UpdateOne({"user_id": user_id}, {"$inc": total}, upsert=True)
+                for user_id, total in totals.items()
+            ], ordered=False),
+        )
+        # Cached usage stats and costs are left to expire: every metered request ends up
+        # here, and dropping them per batch would leave little for the cache to serve
+        return len(buckets)
+
+    async def get_endpoint_summary(
+        self,
+        user_id: str,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime
+    ) -> List[Dict]:
+        """Per-endpoint totals for a user over a period, read from the rollup buckets"""
+        granularity = granularity_for(start_date, end_date)
+        pipeline = [
+            {"$match": {
+                "user_id": user_id,
+                "granularity": granularity,
+                "bucket": {"$gte": truncate(start_date, granularity), "$lte": end_date}
+            }},
+            {"$group": {
+                "_id": "$endpoint",
+                "total_calls": {"$sum": "$count"},
+                "latency_sum": {"$sum": "$latency_sum"},
+                "min_response_time": {"$min": "$latency_min"},
+                "max_response_time": {"$max": "$latency_max"},
+                **{f"status_{name}": {"$sum": f"$statuses.{name}"} for name in STATUS_CLASSES},
+            }},
+            {"$sort": {"_id": 1}}
+        ]
+
+        summary = []
+        for row in await self.collection.aggregate(pipeline).to_list(length=None):
+            latency_sum = row.pop("latency_sum")
+            summary.append({
+                "endpoint": row.pop("_id"),
+                "total_calls": row["total_calls"],
+                "avg_response_time": latency_sum / row["total_calls"] if row["total_calls"] else 0.0,
+                "min_response_time": row["min_response_time"],
+                "max_response_time": row["max_response_time"],
+                "status_counts": {name: row[f"status_{name}"] for name in STATUS_CLASSES},
+            })
+        return summary
+
+    async def backfill(self) -> None:
+        """Build the missing rollup buckets and user totals from the raw usage collection, server-side.
+
+        Existing buckets and totals are kept as they are: raw usage past
+        USAGE_RETENTION_DAYS has expired, so rebuilding them from the records left
+        would lower lifetime totals and costs. The command can be re-run safely.
+        """
+        # $merge matches on the bucket and user fields and requires their unique indexes
+        await ensure_indexes(self.db, ["usage_rollups", "usage_totals"])
+        for granularity in GRANULARITIES:
+            pipeline = [
+                {"$group": {
+                    "_id": {
+                        "user_id": "$user_id",
+                        # Records written before routes were stored fall back to their path
+                        "endpoint": {"$ifNull": ["$route", "$endpoint"]},
+                        "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": granularity}},
+                    },
+                    "count": {"$sum": 1},
+                    "latency_sum": {"$sum": "$response_time"},
+                    "latency_min": {"$min": "$response_time"},
+                    "latency_max": {"$max": "$response_time"},
+                    **{
+                        f"status_{name}": {"$sum": {"$cond": [
+                            {"$and": [
+                                {"$gte": ["$status_code", (i + 1) * 100]},
+                                {"$lt": ["$status_code", (i + 2) * 100]},
+                            ]}, 1, 0
+                        ]}}
+                        for i, name in enumerate(STATUS_CLASSES)
+                    },
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "user_id": "$_id.user_id",
+                    "endpoint": "$_id.endpoint",
+                    "granularity": {"$literal": granularity},
+                    "bucket": "$_id.bucket",
+                    "count": 1,
+                    "latency_sum": 1,
+                    "latency_min": 1,
+                    "latency_max": 1,
+                    "statuses": {name: f"$status_{name}" for name in STATUS_CLASSES},
+                }},
+                {"$merge": {
+                    "into": "usage_rollups",
+                    "on": ["user_id", "endpoint", "granularity", "bucket"],
+                    "whenMatched": "keepExisting",
+                    "whenNotMatched": "insert",
+                }}
+            ]
+            await self.db.usage.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+        await self.db.usage.aggregate([
+            {"$group": {
+                "_id": "$user_id",
+                "count": {"$sum": 1},
+                "latency_sum": {"$sum": "$response_time"},
+            }},
+            {"$project": {"_id": 0, "user_id": "$_id", "count": 1, "latency_sum": 1}},
+            {"$merge": {
+                "into": "usage_totals",
+                "on": "user_id",
+                "whenMatched": "keepExisting",
+                "whenNotMatched": "insert",
+            }}
+        ], allowDiskUse=True).to_list(length=None)
+        # Usage stats and the admin cost listing are computed from the rollups
+        await response_cache.invalidate("usage")
@@ -1,26 +1,80 @@
+import base64
 import datetime
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status
 from ..db.mongodb import MongoDB
-from ..models.usage import APIUsage
+from ..models.usage import AnyUsage, UsageRecord
+from ..core.metrics import db_operation
+from .usage_rollup_service import UsageRollupService
 import logging
-from pymongo.database import Database
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
+
+PRICE_PER_CALL = 0.01
+
+# Fields of a usage record returned by listings and exports; the raw bearer token stays in the DB
+USAGE_EXPORT_FIELDS = ("timestamp", "endpoint", "method", "status_code", "response_time", "token_id")
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque keyset cursor pointing just after a usage document"""
+    raw = f"{doc['timestamp'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, ObjectId]:
+    try:
+        timestamp, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except (ValueError, InvalidId):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
 
 class UsageService:
     def __init__(self):
         self.db = MongoDB.get_db()
         self.collection = self.db.usage
 
-    def create_usage(self, usage: APIUsage) -> APIUsage:
+    @db_operation
+    async def create_usage(self, usage: AnyUsage) -> AnyUsage:
         """Create a new usage record"""
         try:
-            result = self.collection.insert_one(usage.model_dump())
+            result = await self.collection.insert_one(usage.to_document())
             usage.id = str(result.inserted_id)
+            await UsageRollupService().record([usage])
             return usage
         except Exception as e:
             logging.error(f"Error creating usage record: {e}")
             raise
 
-    def get_user_usage(self, user_id: str, start_date: datetime.datetime = None, end_date: datetime.datetime = None) -> List[APIUsage]:
+    @db_operation
+    async def create_usages(self, usages: List[AnyUsage]) -> int:
+        """Insert a batch of usage records in one round-trip"""
+        inserted = await self.insert_usages(usages)
+        await UsageRollupService().record(inserted)
+        return len(inserted)
+
+    @db_operation
+    async def insert_usages(self, usages: List[AnyUsage]) -> List[AnyUsage]:
+        """Insert a batch of usage records, without rolling them up; returns the ones stored"""
+        if not usages:
+            return []
+        try:
+            await self.collection.insert_many(
+                [usage.to_document() for usage in usages],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # Unordered: every record but the failed ones was written
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            logging.error(f"Error inserting {len(failed)} of {len(usages)} usage records: {e}")
+            return [usage for index, usage in enumerate(usages) if index not in failed]
+        return usages
+
+    @db_operation
+    async def get_user_usage(self, user_id: str, start_date: datetime.datetime = None, end_date: datetime.datetime = None) -> List[UsageRecord]:
         """Get usage statistics for a specific user"""
         try:
             query = {"user_id": user_id}
@@ -30,26 +84,97 @@ class UsageService:
                     "$lte": end_date
                 }
             
-            return [APIUsage(**usage) for usage in self.collection.find(query)]
+            usages = await self.collection.find(query).to_list(length=None)
+            # Read back as written: skip validating every record
+            return [UsageRecord.from_document(usage) for usage in usages]
         except Exception as e:
             logging.error(f"Error getting user usage: {e}")
             return []
 
-    def calculate_user_costs(self, user_id: str, price_per_call: float = 0.01) -> Dict:
+    @db_operation
+    async def get_usage_summary(self, user_id: str, start_date: datetime.datetime, end_date: datetime.datetime) -> List[Dict]:
+        """Get per-endpoint usage statistics for a user from the rollups"""
+        return await UsageRollupService().get_endpoint_summary(user_id, start_date, end_date)
+
+    def _period_query(self, user_id: str, start_date: datetime.datetime, end_date: datetime.datetime) -> dict:
+        return {"user_id": user_id, "timestamp": {"$gte": start_date, "$lte": end_date}}
+
+    @db_operation
+    async def get_user_usage_page(
+        self,
+        user_id: str,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of raw usage records, keyset-paginated on (timestamp, _id)"""
+        query = self._period_query(user_id, start_date, end_date)
+        if cursor:
+            timestamp, object_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$gt": object_id}}
+            ]
+
+        projection = dict.fromkeys(USAGE_EXPORT_FIELDS, 1)
+        docs = await (
+            self.collection.find(query, projection)
+            .sort([("timestamp", 1), ("_id", 1)])
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+        next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        items = []
+        for doc in docs[:limit]:
+            doc["id"] = str(doc.pop("_id"))
+            items.append(doc)
+        return items, next_cursor
+
+    async def iter_user_usage(
+        self,
+        user_id: str,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[Dict]]:
+        """Stream raw usage records in batches without holding the whole result set"""
+        projection = {"_id": 0, **dict.fromkeys(USAGE_EXPORT_FIELDS, 1)}
+        cursor = (
+            self.collection.find(self._period_query(user_id, start_date, end_date), projection)
+            .sort([("timestamp", 1), ("_id", 1)])
+            .batch_size(batch_size)
+        )
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @db_operation
+    async def calculate_user_costs(self, user_id: str, price_per_call: float = PRICE_PER_CALL) -> Dict:
         """Calculate costs for a user based on their API usage"""
         pipeline = [
-            {"$match": {"user_id": user_id}},
+            {"$match": {"user_id": user_id, "granularity": "hour"}},
             {"$group": {
                 "_id": "$endpoint",
-                "total_calls": {"$sum": 1},
-                "avg_response_time": {"$avg": "$response_time"},
-                "total_cost": {"$sum": price_per_call}
+                "total_calls": {"$sum": "$count"},
+                "latency_sum": {"$sum": "$latency_sum"}
             }}
         ]
         
-        return list(self.collection.aggregate(pipeline))
+        costs = await self.db.usage_rollups.aggregate(pipeline).to_list(length=None)
+        for cost in costs:
+            latency_sum = cost.pop("latency_sum")
+            cost["avg_response_time"] = latency_sum / cost["total_calls"] if cost["total_calls"] else 0.0
+            cost["total_cost"] = cost["total_calls"] * price_per_call
+        return costs
 
-    def get_api_metrics(self, api_id: str) -> Dict:
+    @db_operation
+    async def get_api_metrics(self, api_id: str) -> Dict:
         """Get metrics for a specific API"""
         pipeline = [
             {"$match": {"api_id": api_id}},
@@ -63,23 +188,47 @@ class UsageService:
             }}
         ]
         
-        return next(self.collection.aggregate(pipeline), None) 
+        result = await self.collection.aggregate(pipeline).to_list(length=1)
+        return result[0] if result else None
 
-async def get_user_usage_cost(user_id: str, db: Database) -> float:
+@db_operation
+async def get_user_usage_cost(user_id: str, db: AsyncIOMotorDatabase) -> float:
     """Get the total cost for a user's API usage"""
     try:
-        pipeline = [
-            {"$match": {"user_id": user_id}},
-            {"$group": {
-                "_id": None,
-                "total_cost": {"$sum": 0.01}  # $0.01 per API call
-            }}
-        ]
-        
-        result = await db.usage.aggregate(pipeline).to_list(length=1)
-        if result:
-            return result[0]["total_cost"]
+        totals = await db.usage_totals.find_one({"user_id": user_id})
+        if totals:
+            return totals["count"] * PRICE_PER_CALL
         return 0.0
     except Exception as e:
         logging.error(f"Error calculating user cost: {e}")
-        return 0.0 
\ No newline at end of file
+        return 0.0
+
+@db_operation
+async def get_users_costs(
+    db: AsyncIOMotorDatabase,
+    skip: int = 0,
+    limit: int = 100,
+    descending: bool = True
+) -> List[Dict]:
+    """Get every user's total cost in a single aggregation, sorted by cost and paginated"""
+    pipeline = [
+        # One indexed lookup into the per-user running totals, instead of a query per user
+        {"$lookup": {
+            "from": "usage_totals",
+            "localField": "id",
+            "foreignField": "user_id",
+            "as": "totals"
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$id",
+            "email": 1,
+            "username": 1,
+            "total_calls": {"$sum": "$totals.count"}
+        }},
+        {"$addFields": {"total_cost": {"$multiply": ["$total_calls", PRICE_PER_CALL]}}},
+        {"$sort": {"total_cost": -1 if descending else 1, "user_id": 1}},
+        {"$skip": skip},
+        {"$limit": limit}
+    ]
+    return await db.users.aggregate(pipeline).to_list(length=limit) 
\ No newline at end of file
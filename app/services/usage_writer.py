@@ -0,0 +1,142 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional
+from ..core.config import settings
+from ..core.metrics import sampled_counter, sampled_gauge
+from ..models.usage import AnyUsage
+from .token_service import TokenService
+from .usage_rollup_service import UsageRollupService
+from .usage_service import UsageService
+
+_STOP = object()
+
+class UsageWriter:
+    """Write-behind pipeline for usage records.
+
+    ``track_usage`` only enqueues a record; a background worker drains the queue and
+    writes batches with ``insert_many``, then one bulk ``last_used`` update setting
+    each token seen in the batch to its latest call. When the queue is full (Mongo too slow to keep
+    up) new records are dropped and counted rather than slowing down responses.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        max_queue_size: int,
+        flush_timeout: float,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.flush_timeout = flush_timeout
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    def start(self) -> None:
+        """Start the background worker on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop the worker"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+
+    def submit(self, usage: AnyUsage) -> bool:
+        """Queue a usage record without waiting; returns False if it was dropped"""
+        try:
+            self._queue.put_nowait(usage)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.queued += 1
+        return True
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[AnyUsage]) -> None:
+        try:
+            stored = await asyncio.wait_for(UsageService().insert_usages(batch), self.flush_timeout)
+        except Exception as e:
+            self.dropped += len(batch)
+            logging.error(f"Error flushing {len(batch)} usage records: {e}")
+            return
+        self.flushed += len(stored)
+        self.dropped += len(batch) - len(stored)
+        # The records are stored by now: a failure past this point loses none of them
+        try:
+            await asyncio.wait_for(self.record_batch(stored), self.flush_timeout)
+        except Exception as e:
+            logging.error(f"Error recording the rollups and last_used of {len(stored)} usage records: {e}")
+
+    async def record_batch(self, stored: List[AnyUsage]) -> None:
+        """Fold stored usage records into the rollups and their tokens' last_used times"""
+        await UsageRollupService().record(stored)
+        last_used: Dict[str, datetime.datetime] = {}
+        for usage in stored:
+            if usage.token not in last_used or usage.timestamp > last_used[usage.token]:
+                last_used[usage.token] = usage.timestamp
+        await TokenService().update_last_used_many(last_used)
+
+usage_writer = UsageWriter(
+    batch_size=settings.USAGE_WRITER_BATCH_SIZE,
+    flush_interval=settings.USAGE_WRITER_FLUSH_INTERVAL_SECONDS,
+    max_queue_size=settings.USAGE_WRITER_MAX_QUEUE_SIZE,
+    flush_timeout=settings.USAGE_WRITER_FLUSH_TIMEOUT_SECONDS,
+)
+
+sampled_gauge("usage_writer_pending", "Usage records waiting to be written", lambda: usage_writer.stats()["pending"])
+sampled_counter(
+    "usage_writer_records_total",
+    "Usage records by what happened to them",
+    lambda: {(outcome,): usage_writer.stats()[outcome] for outcome in ("queued", "flushed", "dropped")},
+    ["outcome"],
+)
@@ -0,0 +1,146 @@
+"""Benchmark: search latency of the in-memory API catalog index.
+
+Indexes a synthetic catalog of ``--apis`` APIs, with names and descriptions drawn
+from a Zipf-distributed vocabulary, a mix of pricing types and log-uniform prices.
+Then times a mix of searches: browsing the newest, text queries with common and
+rare terms, and pricing type and price range filters. Each one is also answered by
+a full scan of the catalog in Python, which is what a ``$regex`` query without a
+usable index does on the database, minus the I/O, as the baseline.
+
+Usage:
+    python -m benchmarks.bench_catalog_search --apis 100000 --queries 200
+"""
+import argparse
+import math
+import random
+import re
+import time
+
+from app.models.api import API
+from app.services.catalog_index import CatalogIndex
+from benchmarks.harness import percentile
+
+TOPICS = ["text", "image", "audio", "video", "code", "speech", "translation", "summary", "vision", "chat"]
+PRICING = [("free", 0.4), ("pay-per-call", 0.45), ("subscription", 0.15)]
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    syllables = ["ka", "lo", "mi", "re", "su", "ta", "ve", "xo", "zen", "qua", "bri", "dol"]
+    words = set(TOPICS)
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda word: (word not in TOPICS, word))
+
+
+def synthetic_catalog(count: int, rng: random.Random) -> list:
+    words = vocabulary(5000, rng)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    apis = []
+    for i in range(count):
+        pricing_type = rng.choices([name for name, _ in PRICING], [share for _, share in PRICING])[0]
+        price = 0.0 if pricing_type == "free" else round(10 ** rng.uniform(-4, 2), 4)
+        apis.append(API(
+            id=f"api{i}",
+            name=" ".join(rng.choices(words, weights, k=rng.randint(2, 4))).title(),
+            description=" ".join(rng.choices(words, weights, k=rng.randint(8, 30))),
+            endpoint="http://upstream.test/v1",
+            owner_id=f"owner{i % 1000}",
+            pricing_type=pricing_type,
+            price=price,
+            status="active" if rng.random() < 0.95 else "disabled",
+        ))
+    return apis, words
+
+
+def scan(apis: list, query: str = "", pricing_type=None, status="active", min_price=None, max_price=None, limit=20) -> dict:
+    """The search as a full scan: every term matched as a whole word, in the name or description"""
+    patterns = [re.compile(rf"\b{re.escape(term)}\b", re.IGNORECASE) for term in query.split()]
+    low, high = min_price or 0.0, math.inf if max_price is None else max_price
+    hits = [
+        api for api in apis
+        if (status is None or api.status == status)
+        and (pricing_type is None or api.pricing_type == pricing_type)
+        and low <= api.price <= high
+        and all(pattern.search(api.name) or pattern.search(api.description) for pattern in patterns)
+    ]
+    facets = {}
+    for api in hits:
+        facets[api.pricing_type] = facets.get(api.pricing_type, 0) + 1
+    return {"total": len(hits), "items": hits[-limit:][::-1], "facets": facets}
+
+
+def query_mix(words: list, rng: random.Random) -> dict:
+    rare = words[len(words) // 2:]
+    return {
+        "browse newest": lambda: dict(sort="newest"),
+        "common term": lambda: dict(query=rng.choice(TOPICS)),
+        "rare term": lambda: dict(query=rng.choice(rare)),
+        "two terms": lambda: dict(query=f"{rng.choice(TOPICS)} {rng.choice(words[:200])}"),
+        "three terms": lambda: dict(query=" ".join(rng.choice(words[:100]) for _ in range(3))),
+        "term + facet + price": lambda: dict(
+            query=rng.choice(TOPICS), pricing_type="pay-per-call", min_price=0.001, max_price=round(10 ** rng.uniform(-2, 1), 3)
+        ),
+        "price range only": lambda: dict(min_price=round(10 ** rng.uniform(-3, 0), 4), max_price=round(10 ** rng.uniform(0, 2), 2)),
+    }
+
+
+def timed(call, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apis", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200, help="searches per query type")
+    parser.add_argument("--scan-queries", type=int, default=5, help="full scans per query type, they are slow")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    apis, words = synthetic_catalog(args.apis, rng)
+    index = CatalogIndex(sync_interval=60.0, overlap=5.0)
+    started = time.perf_counter()
+    for api in apis[:10_000]:
+        index.add(api)
+    added = time.perf_counter() - started
+    started = time.perf_counter()
+    index.load(apis)
+    build = time.perf_counter() - started
+    print(f"{args.apis:,} APIs loaded in {build:.2f} s ({build / args.apis * 1e6:.1f} us each, {added / 10_000 * 1e6:.1f} us added one by one)")
+
+    update_times = []
+    for position in rng.sample(range(len(apis)), 1000):
+        api = apis[position] = apis[position].model_copy(update={"price": apis[position].price * 2, "name": apis[position].name + " Pro"})
+        update_times.extend(timed(lambda: index.add(api), 1))
+    print(f"update: p50 {percentile(update_times, 50) * 1e6:.1f} us, p99 {percentile(update_times, 99) * 1e6:.1f} us\n")
+
+    print(f"{'query':>22} {'matches':>9} {'p50 us':>9} {'p99 us':>9} {'scan p50 ms':>12} {'speedup':>8}")
+    for name, make in query_mix(words, rng).items():
+        params = [make() for _ in range(args.queries)]
+        totals = []
+        samples = []
+        for kwargs in params:
+            kwargs.setdefault("status", "active")
+            started = time.perf_counter()
+            totals.append(index.search(**kwargs)["total"])
+            samples.append(time.perf_counter() - started)
+        scans = []
+        for kwargs in params[:args.scan_queries]:
+            started = time.perf_counter()
+            result = scan(apis, **{key: value for key, value in kwargs.items() if key != "sort"})
+            scans.append(time.perf_counter() - started)
+            assert result["total"] == index.search(**kwargs)["total"], (name, kwargs)
+        p50 = percentile(samples, 50)
+        print(
+            f"{name:>22} {sorted(totals)[len(totals) // 2]:9,} {p50 * 1e6:9.1f} {percentile(samples, 99) * 1e6:9.1f}"
+            f" {percentile(scans, 50) * 1e3:12.1f} {percentile(scans, 50) / p50:7,.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
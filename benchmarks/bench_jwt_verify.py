@@ -0,0 +1,60 @@
+"""Micro-benchmark: JWT verify throughput per signing algorithm.
+
+For each algorithm a token is verified with the cached verifier of a loaded key set
+(``KeySet.decode``) and, for comparison, with the key material re-parsed from PEM on
+every call, which is what handing PEM strings to ``jwt.decode`` amounts to.
+
+Usage:
+    python -m benchmarks.bench_jwt_verify --iterations 5000
+"""
+import argparse
+import datetime
+import timeit
+
+from app.commands.generate_signing_key import generate_private_key, private_pem, public_pem
+from app.core.keys import KeySet, load_key
+
+ALGORITHMS = ("HS256", "RS256", "ES256", "EdDSA")
+
+
+def key_entries(alg: str):
+    """Signing entry and the verify-only entry a gateway would hold"""
+    if alg == "HS256":
+        entry = {"kid": alg, "alg": alg, "secret": "benchmark-secret"}
+        return entry, entry
+    key = generate_private_key(alg)
+    return (
+        {"kid": alg, "alg": alg, "private_key": private_pem(key)},
+        {"kid": alg, "alg": alg, "public_key": public_pem(key)},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    claims = {
+        "sub": "bench@example.com",
+        "user_id": "0" * 24,
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1),
+    }
+    print(f"{'alg':>6} {'cached verify/s':>16} {'re-parsed verify/s':>19} {'sign/s':>9} {'token bytes':>12}")
+    for alg in ALGORITHMS:
+        signing_entry, verify_entry = key_entries(alg)
+        keyset = KeySet([load_key(signing_entry)], active_kid=alg)
+        verifier = KeySet([load_key(verify_entry)])
+        token = keyset.encode(claims)
+
+        def reparsed():
+            KeySet([load_key(verify_entry)]).decode(token)
+
+        rates = []
+        for func in (lambda: verifier.decode(token), reparsed, lambda: keyset.encode(claims)):
+            seconds = min(timeit.repeat(func, number=args.iterations, repeat=3))
+            rates.append(args.iterations / seconds)
+        print(f"{alg:>6} {rates[0]:16,.0f} {rates[1]:19,.0f} {rates[2]:9,.0f} {len(token):12}")
+
+
+if __name__ == "__main__":
+    main()
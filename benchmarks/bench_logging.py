@@ -0,0 +1,73 @@
+"""Benchmark: requests/sec with logging on, inline handlers vs. the queued, sampled setup.
+
+Drives ``GET /api/v1/tokens/`` on the real app (mongomock-backed) with logging
+written to /dev/null in two configurations:
+
+* inline: everything at DEBUG, formatted and written on the event loop, as every
+  per-request message used to be;
+* queued: ``configure_logging()`` at INFO, hot-path messages sampled, formatting
+  and I/O done by the listener thread.
+
+Usage:
+    python -m benchmarks.bench_logging --requests 2000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from app.core import log
+from app.core.config import settings
+from app.services.usage_writer import usage_writer
+from benchmarks.harness import app_client, create_user, use_mock_database
+
+
+def configure_inline(devnull):
+    root = logging.getLogger()
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.handlers = [handler]
+    root.setLevel(logging.DEBUG)
+    log._hot_path_sampler.rate = 1.0
+
+
+def configure_queued(devnull):
+    log.shutdown_logging()
+    settings.LOG_LEVEL = "INFO"
+    log._hot_path_sampler.rate = settings.LOG_HOT_PATH_SAMPLE_RATE
+    log.configure_logging()
+    # Point the listener's output at /dev/null as well
+    log._listener.handlers[0].setStream(devnull)
+
+
+async def measure(requests: int) -> float:
+    db = await use_mock_database("bench_logging")
+    headers = (await create_user(db))["headers"]
+
+    usage_writer.start()
+    async with app_client() as client:
+        await client.get("/api/v1/tokens/", headers=headers)
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/api/v1/tokens/", headers=headers)
+        elapsed = time.perf_counter() - start
+    await usage_writer.stop()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        for name, configure in (("inline", configure_inline), ("queued", configure_queued)):
+            configure(devnull)
+            rps = asyncio.run(measure(args.requests))
+            print(f"{name:>7}: {rps:8.1f} req/s")
+        log.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
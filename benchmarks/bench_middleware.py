@@ -0,0 +1,193 @@
+"""Benchmark: cost of the middleware stack, and streamed response timing through it.
+
+Drives ASGI apps directly, without sockets or an HTTP client, so the numbers are
+the server side alone. Each request records the time to its first body chunk
+(time-to-first-byte) and to the end of the body. Measured apps:
+
+* synthetic: a trivial app behind three pass-through middlewares, registered with
+  ``app.middleware("http")`` (Starlette's ``BaseHTTPMiddleware``) or as raw ASGI
+  classes, and with none, which isolates the cost of each style;
+* real: ``app.main:app``, lifespan included, against mongomock, on the token
+  listing and the streamed NDJSON usage export.
+
+Usage:
+    python -m benchmarks.bench_middleware --duration 5 --concurrency 20
+"""
+import argparse
+import asyncio
+import datetime
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from benchmarks.harness import create_user, percentile, use_mock_database
+
+LAYERS = 3
+STREAM_CHUNKS = 5
+STREAM_INTERVAL = 0.02
+
+
+class PassThrough:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+
+async def pass_through(request, call_next):
+    return await call_next(request)
+
+
+def synthetic_app(style: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain():
+        return {"status": "OK"}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(STREAM_CHUNKS):
+                yield f'{{"chunk": {i}}}\n'
+                await asyncio.sleep(STREAM_INTERVAL)
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    for _ in range(LAYERS):
+        if style == "base_http":
+            app.middleware("http")(pass_through)
+        elif style == "asgi":
+            app.add_middleware(PassThrough)
+    return app
+
+
+async def request(app, path: str, headers: dict) -> tuple:
+    """Send one GET through the ASGI app; returns (seconds to first body byte, seconds to the end)"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")] + [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+        "state": {},
+    }
+    status, first_byte, done = None, None, asyncio.Event()
+    sent_body = False
+    started = time.perf_counter()
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Like a server: the client only goes away once the response is complete
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, first_byte
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if first_byte is None and message.get("body"):
+                first_byte = time.perf_counter()
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"GET {path} returned {status}")
+    finished = time.perf_counter()
+    return (first_byte or finished) - started, finished - started
+
+
+async def requests_per_second(app, path: str, headers: dict, concurrency: int, duration: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + duration
+
+    async def loop():
+        nonlocal count
+        while time.perf_counter() < deadline:
+            await request(app, path, headers)
+            count += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return count / (time.perf_counter() - started)
+
+
+async def stream_timings(app, path: str, headers: dict, requests: int) -> tuple:
+    """Median time-to-first-byte and total time of sequential requests, in ms"""
+    timings = [await request(app, path, headers) for _ in range(requests)]
+    return (
+        percentile([first for first, _ in timings], 50) * 1000,
+        percentile([total for _, total in timings], 50) * 1000,
+    )
+
+
+async def run_synthetic(args):
+    print(f"{LAYERS} pass-through middlewares; stream of {STREAM_CHUNKS} chunks {STREAM_INTERVAL * 1000:.0f} ms apart")
+    print(f"{'style':>10} {'req/s':>9} {'stream ttfb ms':>15} {'stream total ms':>16}")
+    for style in ("none", "base_http", "asgi"):
+        app = synthetic_app(style)
+        rps = await requests_per_second(app, "/plain", {}, args.concurrency, args.duration)
+        ttfb, total = await stream_timings(app, "/stream", {}, args.stream_requests)
+        print(f"{style:>10} {rps:9,.0f} {ttfb:15.2f} {total:16.2f}")
+
+
+async def run_real(args):
+    from app.main import app
+    from app.models.usage import APIUsage
+    from app.services.usage_service import UsageService
+
+    db = await use_mock_database("bench_middleware")
+    user = await create_user(db)
+    token = await db.tokens.find_one({"token": user["token"]})
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await UsageService().create_usages([
+        APIUsage(
+            user_id=token["user_id"],
+            token=user["token"],
+            endpoint=f"/api/v1/example/{i % 10}",
+            response_time=10.0,
+            timestamp=now - datetime.timedelta(seconds=i),
+        )
+        for i in range(args.usage_records)
+    ])
+
+    async with app.router.lifespan_context(app):
+        # The export first: the token listing adds usage records of its own
+        ttfb, total = await stream_timings(app, "/api/v1/usage/export", user["headers"], args.stream_requests)
+        rps = await requests_per_second(app, "/api/v1/tokens/", user["headers"], args.concurrency, args.duration)
+    print(
+        f"app.main: {rps:,.0f} req/s on /api/v1/tokens/; "
+        f"export of {args.usage_records:,} records: ttfb {ttfb:.2f} ms, total {total:.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=("synthetic", "real", "both"), default="both")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream-requests", type=int, default=20)
+    parser.add_argument("--usage-records", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.target in ("synthetic", "both"):
+        asyncio.run(run_synthetic(args))
+    if args.target in ("real", "both"):
+        asyncio.run(run_real(args))
+
+
+if __name__ == "__main__":
+    main()
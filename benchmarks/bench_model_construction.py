@@ -0,0 +1,68 @@
+"""Micro-benchmark: cost of building usage records in bulk.
+
+Compares the validated ``APIUsage`` model with the ``UsageRecord`` slots record
+the usage tracker builds on every request and ``get_user_usage`` builds for every
+document read, then the cost of turning each back into a document for insertion
+by the usage writer.
+
+Usage:
+    python -m benchmarks.bench_model_construction --count 1000000
+"""
+import argparse
+import datetime
+import time
+
+from bson import ObjectId
+
+from app.models.usage import APIUsage, UsageRecord
+
+
+def usage_documents(count: int) -> list:
+    now = datetime.datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "id": None,
+            "user_id": "0" * 24,
+            "token": "eyJhbGciOiJIUzI1NiJ9." + "x" * 180,
+            "token_id": "1" * 24,
+            "endpoint": f"/api/v1/example/{i % 10}",
+            "method": "GET",
+            "status_code": 200,
+            "response_time": 12.5 + i % 50,
+            "timestamp": now - datetime.timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def timed(func, items) -> float:
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=200000)
+    args = parser.parse_args()
+
+    docs = usage_documents(args.count)
+    models = [APIUsage(**doc) for doc in docs]
+    records = [UsageRecord.from_document(doc) for doc in docs]
+    cases = (
+        ("build", timed(lambda doc: APIUsage(**doc), docs), timed(UsageRecord.from_document, docs)),
+        ("to_document", timed(APIUsage.to_document, models), timed(UsageRecord.to_document, records)),
+    )
+
+    print(f"{'operation':>12} {'APIUsage us':>12} {'UsageRecord us':>15} {'records/s':>12} {'speedup':>8}")
+    for operation, model_seconds, record_seconds in cases:
+        print(
+            f"{operation:>12} {model_seconds / args.count * 1e6:12.2f} {record_seconds / args.count * 1e6:15.2f} "
+            f"{args.count / record_seconds:12,.0f} {model_seconds / record_seconds:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Concurrency benchmark: blocking pymongo calls vs. awaitable calls on the event loop.
+
+Each simulated request does what ``verify_token_middleware`` does on the hot path: a
+``find_one`` on ``tokens`` by value. The database is a mongomock stand-in with an
+artificial round-trip latency, either blocking (``time.sleep``, like the old
+``pymongo.MongoClient``) or awaitable (``asyncio.sleep``, like motor).
+
+Usage:
+    python -m benchmarks.bench_mongo_concurrency --requests 500 --concurrency 50 --latency-ms 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import mongomock
+
+
+class BlockingCollection:
+    """Stand-in for a pymongo collection: every round-trip blocks the thread"""
+    def __init__(self, collection, latency: float):
+        self.collection = collection
+        self.latency = latency
+
+    def find_one(self, query):
+        time.sleep(self.latency)
+        return self.collection.find_one(query)
+
+
+class AsyncCollection:
+    """Stand-in for a motor collection: every round-trip yields to the event loop"""
+    def __init__(self, collection, latency: float):
+        self.collection = collection
+        self.latency = latency
+
+    async def find_one(self, query):
+        await asyncio.sleep(self.latency)
+        return self.collection.find_one(query)
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(collection, requests: int, concurrency: int, token_values) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def handle(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            query = {"token": token_values[i % len(token_values)]}
+            result = collection.find_one(query)
+            if asyncio.iscoroutine(result):
+                result = await result
+            # Hand control back to the loop like a real handler would
+            await asyncio.sleep(0)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    tokens = mongomock.MongoClient().db.tokens
+    token_values = [f"token-{i}" for i in range(100)]
+    tokens.insert_many([{"token": value, "is_active": True} for value in token_values])
+    latency = args.latency_ms / 1000
+
+    for name, collection in (
+        ("blocking", BlockingCollection(tokens, latency)),
+        ("async", AsyncCollection(tokens, latency)),
+    ):
+        stats = asyncio.run(run(collection, args.requests, args.concurrency, token_values))
+        print(f"{name:>8}: {stats['rps']:8.1f} req/s  p50={stats['p50']:8.2f}ms  p99={stats['p99']:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
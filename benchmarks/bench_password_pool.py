@@ -0,0 +1,73 @@
+"""Load benchmark: API latency while logins hammer bcrypt, inline vs. on the worker pool.
+
+Runs ``--logins`` concurrent login loops next to one loop of authenticated
+``GET /api/v1/tokens/`` calls for ``--seconds``, and reports the API latency
+percentiles. With hashing inline (PASSWORD_HASH_WORKERS=0) every login freezes the
+event loop for the duration of a bcrypt round; with the pool the API calls keep
+flowing.
+
+Usage:
+    python -m benchmarks.bench_password_pool --logins 8 --seconds 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.core.security import password_hasher
+from benchmarks.harness import app_client, create_user, percentile, use_mock_database
+
+
+async def run_mode(workers: int, logins: int, seconds: float) -> dict:
+    password_hasher.shutdown()
+    password_hasher.workers = workers
+    db = await use_mock_database("bench_password_pool")
+    user = await create_user(db)
+    deadline = time.perf_counter() + seconds
+    api_latencies, login_statuses = [], []
+
+    async with app_client() as client:
+        async def login_loop():
+            while time.perf_counter() < deadline:
+                response = await client.post(
+                    "/api/v1/auth/login",
+                    data={"username": user["email"], "password": user["password"]}
+                )
+                login_statuses.append(response.status_code)
+
+        async def api_loop():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get("/api/v1/tokens/", headers=user["headers"])
+                api_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        await asyncio.gather(api_loop(), *(login_loop() for _ in range(logins)))
+
+    password_hasher.shutdown()
+    return {
+        "api_calls": len(api_latencies),
+        "p50": statistics.median(api_latencies),
+        "p99": percentile(api_latencies, 99),
+        "logins": login_statuses.count(200),
+        "rejected": login_statuses.count(503),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=password_hasher.workers)
+    args = parser.parse_args()
+
+    for name, workers in (("inline", 0), ("pool", max(1, args.workers))):
+        stats = asyncio.run(run_mode(workers, args.logins, args.seconds))
+        print(
+            f"{name:>6}: api p50={stats['p50']:8.2f}ms p99={stats['p99']:8.2f}ms "
+            f"({stats['api_calls']} calls)  logins ok={stats['logins']} rejected={stats['rejected']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
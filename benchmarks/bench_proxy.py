@@ -0,0 +1,305 @@
+"""Benchmark: throughput and latency of calls proxied to a published API.
+
+A stub upstream runs under uvicorn in a child process: ``POST /v1/echo`` answers
+a small JSON document after ``--upstream-delay`` seconds, and ``POST /v1/stream``
+sends ``STREAM_CHUNKS`` chunks ``STREAM_INTERVAL`` apart, like a token stream.
+The app, driven in-process over ASGI against mongomock, forwards to it over real
+sockets through the pooled clients. Calling the stub directly with one pooled
+httpx client gives the baseline, so the difference is the gateway's overhead.
+
+Every client sends the same payload, so concurrent calls are coalesced into one
+upstream request; ``--distinct`` gives each call its own payload instead.
+
+``--faults`` then exercises the per-upstream guard against a second stub API with
+coalescing off. ``POST /v1/error`` always answers 500, so its circuit opens and
+calls fail fast. ``POST /v1/overloaded`` serves ``OVERLOADED_CAPACITY`` calls at
+a time, so its latency grows with the calls it is sent; the adaptive limit should
+settle near that capacity rather than piling every client onto the stub.
+
+Usage:
+    python -m benchmarks.bench_proxy --duration 5 --concurrency 20
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import socket
+import time
+
+import httpx
+
+from benchmarks.harness import create_user, percentile, use_mock_database
+
+STREAM_CHUNKS = 10
+STREAM_INTERVAL = 0.01
+OVERLOADED_CAPACITY = 8
+OVERLOADED_SERVICE_TIME = 0.02
+PAYLOAD = b'{"prompt": "Summarize the following text in one sentence.", "max_tokens": 64}'
+_counter = itertools.count()
+
+
+def payload(distinct: bool) -> bytes:
+    if distinct:
+        return b'{"prompt": "Summarize text %d in one sentence.", "max_tokens": 64}' % next(_counter)
+    return PAYLOAD
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_stub(port: int, delay: float):
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    stats = {"error": 0, "overloaded": 0, "in_flight": 0, "peak_in_flight": 0}
+    capacity = asyncio.Semaphore(OVERLOADED_CAPACITY)
+
+    async def echo(request):
+        body = await request.body()
+        if delay:
+            await asyncio.sleep(delay)
+        return JSONResponse({"received": len(body), "completion": "A short summary."})
+
+    async def stream(request):
+        await request.body()
+
+        async def chunks():
+            for i in range(STREAM_CHUNKS):
+                yield f'data: {{"token": {i}}}\n\n'
+                await asyncio.sleep(STREAM_INTERVAL)
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    async def error(request):
+        await request.body()
+        stats["error"] += 1
+        return JSONResponse({"detail": "upstream failure"}, status_code=500)
+
+    async def overloaded(request):
+        await request.body()
+        stats["overloaded"] += 1
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            async with capacity:
+                await asyncio.sleep(OVERLOADED_SERVICE_TIME)
+        finally:
+            stats["in_flight"] -= 1
+        return JSONResponse({"completion": "A short summary."})
+
+    async def get_stats(request):
+        return JSONResponse(stats)
+
+    app = Starlette(routes=[
+        Route("/v1/echo", echo, methods=["POST"]),
+        Route("/v1/stream", stream, methods=["POST"]),
+        Route("/v1/error", error, methods=["POST"]),
+        Route("/v1/overloaded", overloaded, methods=["POST"]),
+        Route("/v1/stats", get_stats),
+    ])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+async def wait_for_stub(url: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.post(f"{url}/v1/echo", content=b"")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("The stub upstream did not start")
+
+
+async def asgi_post(app, path: str, headers: dict, body: bytes) -> tuple:
+    """POST through the ASGI app; returns (seconds to first body byte, seconds to the end)"""
+    status, first_byte, total = await asgi_call(app, path, headers, body)
+    if status != 200:
+        raise RuntimeError(f"POST {path} returned {status}")
+    return first_byte, total
+
+
+async def asgi_call(app, path: str, headers: dict, body: bytes) -> tuple:
+    """POST through the ASGI app; returns (status, seconds to first body byte, seconds to the end)"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        + [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+        "state": {},
+    }
+    status, first_byte, done = None, None, asyncio.Event()
+    sent_body = False
+    started = time.perf_counter()
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, first_byte
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if first_byte is None and message.get("body"):
+                first_byte = time.perf_counter()
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    finished = time.perf_counter()
+    return status, (first_byte or finished) - started, finished - started
+
+
+async def direct_post(client: httpx.AsyncClient, url: str, headers: dict, body: bytes) -> tuple:
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", url, content=body, headers=headers) as response:
+        async for chunk in response.aiter_raw():
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter()
+    finished = time.perf_counter()
+    return (first_byte or finished) - started, finished - started
+
+
+async def load(call, concurrency: int, duration: float) -> tuple:
+    """Requests per second and latencies of ``concurrency`` clients calling back to back"""
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def loop():
+        while time.perf_counter() < deadline:
+            latencies.append((await call())[1])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return len(latencies) / (time.perf_counter() - started), latencies
+
+
+def report(name: str, rps: float, latencies: list, stream: list):
+    print(
+        f"{name:>8} {rps:9,.0f} {percentile(latencies, 50) * 1000:9.2f} {percentile(latencies, 99) * 1000:9.2f}"
+        f" {percentile([first for first, _ in stream], 50) * 1000:12.2f} {percentile([total for _, total in stream], 50) * 1000:13.2f}"
+    )
+
+
+async def run(args, upstream: str):
+    from app.main import app
+    from app.schemas.api import APICreate
+    from app.services.api_service import APIService
+    from app.services.egress import egress_policy
+    from prometheus_client import REGISTRY
+
+    db = await use_mock_database("bench_proxy")
+    egress_policy.allow_private = True  # the stub listens on loopback
+    user = await create_user(db)
+    token = await db.tokens.find_one({"token": user["token"]})
+    api = await APIService().create_api(APICreate(name="Stub", endpoint=f"{upstream}/v1", method="POST", coalesce=True), owner_id=token["user_id"])
+    await wait_for_stub(upstream)
+
+    print(f"{args.concurrency} concurrent clients, upstream delay {args.upstream_delay * 1000:.0f} ms; "
+          f"stream of {STREAM_CHUNKS} chunks {STREAM_INTERVAL * 1000:.0f} ms apart")
+    print(f"{'path':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'stream ttfb':>12} {'stream total':>13}")
+
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    async with httpx.AsyncClient(limits=limits) as client:
+        headers = {"content-type": "application/json"}
+        rps, latencies = await load(
+            lambda: direct_post(client, f"{upstream}/v1/echo", headers, payload(args.distinct)), args.concurrency, args.duration
+        )
+        stream = [await direct_post(client, f"{upstream}/v1/stream", headers, payload(args.distinct)) for _ in range(args.stream_requests)]
+        report("direct", rps, latencies, stream)
+
+    async with app.router.lifespan_context(app):
+        base = f"/api/v1/apis/{api.id}/call"
+        rps, latencies = await load(
+            lambda: asgi_post(app, f"{base}/echo", user["headers"], payload(args.distinct)), args.concurrency, args.duration
+        )
+        stream = [await asgi_post(app, f"{base}/stream", user["headers"], payload(args.distinct)) for _ in range(args.stream_requests)]
+        report("proxied", rps, latencies, stream)
+        saved = sum(
+            sample.value for metric in REGISTRY.collect() if metric.name == "proxy_upstream_calls_saved"
+            for sample in metric.samples if sample.name == "proxy_upstream_calls_saved_total"
+        )
+        print(f"proxied calls answered without their own upstream request: {saved:,.0f} of {len(latencies):,}")
+
+        if args.faults:
+            await faults(app, args, upstream, token["user_id"], user["headers"])
+
+
+async def faults(app, args, upstream: str, owner_id: str, headers: dict):
+    from app.schemas.api import APICreate
+    from app.services.api_service import APIService
+    from app.services.proxy import api_upstream
+    from app.services.upstream_guard import upstream_guard
+
+    api = await APIService().create_api(
+        APICreate(name="Faulty", endpoint=f"{upstream}/v1", method="POST", coalesce=False), owner_id=owner_id
+    )
+    base = f"/api/v1/apis/{api.id}/call"
+    print(f"\nfaults: {args.concurrency} concurrent clients for {args.duration:.0f} s per upstream behaviour")
+    print(f"{'upstream':>10} {'calls':>7} {'2xx':>7} {'500':>7} {'503':>7} {'p50 ms':>9} {'p99 ms':>9} {'reached':>8} {'peak':>5} {'limit':>6}")
+
+    async with httpx.AsyncClient() as client:
+        for name in ("error", "overloaded"):
+            upstream_guard.clear()
+            results = []
+            deadline = time.perf_counter() + args.duration
+
+            async def loop():
+                while time.perf_counter() < deadline:
+                    status, _, total = await asgi_call(app, f"{base}/{name}", headers, payload(True))
+                    results.append((status, total))
+
+            await asyncio.gather(*(loop() for _ in range(args.concurrency)))
+            stats = (await client.get(f"{upstream}/v1/stats")).json()
+            state = upstream_guard.snapshot(api_upstream(api))
+            statuses = [status for status, _ in results]
+            latencies = [total for _, total in results]
+            print(
+                f"{name:>10} {len(results):7,} {sum(200 <= s < 300 for s in statuses):7,} {statuses.count(500):7,}"
+                f" {statuses.count(503):7,} {percentile(latencies, 50) * 1000:9.2f} {percentile(latencies, 99) * 1000:9.2f}"
+                f" {stats[name]:8,} {stats['peak_in_flight'] if name == 'overloaded' else '':>5} {state['concurrency_limit']:6}"
+                f"  circuit {state['circuit_state']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream-requests", type=int, default=20)
+    parser.add_argument("--upstream-delay", type=float, default=0.0)
+    parser.add_argument("--distinct", action="store_true", help="a different payload per call, nothing to coalesce")
+    parser.add_argument("--faults", action="store_true", help="also call an erroring and an overloaded upstream")
+    args = parser.parse_args()
+
+    port = free_port()
+    stub = multiprocessing.Process(target=serve_stub, args=(port, args.upstream_delay), daemon=True)
+    stub.start()
+    try:
+        asyncio.run(run(args, f"http://127.0.0.1:{port}"))
+    finally:
+        stub.terminate()
+        stub.join()
+
+
+if __name__ == "__main__":
+    main()
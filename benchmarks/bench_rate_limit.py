@@ -0,0 +1,72 @@
+"""Throughput benchmark: per-request overhead of the rate limiter.
+
+Measures the in-process GCRA backend on its own, then the cost the middleware adds
+to a request against a trivial endpoint (requests/sec with and without it).
+
+Usage:
+    python -m benchmarks.bench_rate_limit --requests 20000 --keys 1000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.services.rate_limiter import MemoryRateLimitBackend
+
+
+async def backend_throughput(requests: int, keys: int) -> float:
+    backend = MemoryRateLimitBackend(maxsize=keys * 2)
+    start = time.perf_counter()
+    for i in range(requests):
+        await backend.hit(f"user:{i % keys}", limit=1_000_000, window=60)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def build_app(with_limiter: bool) -> FastAPI:
+    app = FastAPI()
+    if with_limiter:
+        app.add_middleware(RateLimitMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def app_throughput(with_limiter: bool, requests: int) -> float:
+    transport = ASGITransport(app=build_app(with_limiter))
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/ping")
+        return requests / (time.perf_counter() - start)
+
+
+async def run(args):
+    from app.core.config import settings
+    settings.RATE_LIMIT_REQUESTS = 1_000_000_000
+
+    per_hit = await backend_throughput(args.requests, args.keys)
+    print(f"memory backend: {per_hit:8.2f} us/hit ({1e6 / per_hit:,.0f} hits/s)")
+
+    app_requests = max(1, args.requests // 10)
+    without = await app_throughput(False, app_requests)
+    with_limiter = await app_throughput(True, app_requests)
+    overhead = (1 / with_limiter - 1 / without) * 1e6
+    print(f"without limiter: {without:8.1f} req/s")
+    print(f"   with limiter: {with_limiter:8.1f} req/s  (+{overhead:.1f} us/request)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=1000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Micro-benchmark: time to turn fetched documents into a JSON response body.
+
+Compares, for token listings and usage record pages of ``--sizes`` records:
+
+* models: build a ``Token`` per document and serialize through the route's
+  ``response_model``, which validates every model again (the previous
+  ``list_tokens``), or pass dicts through ``jsonable_encoder`` and ``json.dumps``
+  (the previous usage endpoints);
+* documents: encode the projected documents as they are with ``ORJSONResponse``.
+
+Documents are generated in memory, as the driver returns them (naive UTC
+datetimes), so only serialization is measured.
+
+Usage:
+    python -m benchmarks.bench_serialization --sizes 10000,100000
+"""
+import argparse
+import asyncio
+import datetime
+import time
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from app.api.v1.endpoints.tokens import router as tokens_router
+from app.core.responses import ORJSONResponse
+from app.models.token import Token
+from app.services.token_service import TOKEN_DEFAULTS
+
+
+def token_documents(count: int) -> list:
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    return [
+        {
+            "id": str(ObjectId()),
+            "user_id": "0" * 24,
+            "token": "eyJhbGciOiJIUzI1NiJ9." + "x" * 180,
+            "is_active": i % 7 != 0,
+            "created_at": now - datetime.timedelta(minutes=i),
+            "expires_at": now + datetime.timedelta(minutes=30 - i),
+            "last_used": now if i % 2 else None,
+            "description": "Login token",
+        }
+        for i in range(count)
+    ]
+
+
+def usage_documents(count: int) -> list:
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    return [
+        {
+            "id": str(ObjectId()),
+            "timestamp": now - datetime.timedelta(seconds=i),
+            "endpoint": f"/api/v1/example/{i % 10}",
+            "method": "GET",
+            "status_code": 200,
+            "response_time": 12.5 + i % 50,
+            "token_id": "0" * 24,
+        }
+        for i in range(count)
+    ]
+
+
+async def tokens_via_models(docs: list) -> bytes:
+    field = next(route for route in tokens_router.routes if route.name == "list_tokens").response_field
+    models = [Token(**doc) for doc in docs]
+    return await serialize_response(field=field, response_content=models, dump_json=True)
+
+
+async def tokens_via_documents(docs: list) -> bytes:
+    return ORJSONResponse([{**TOKEN_DEFAULTS, **doc} for doc in docs]).body
+
+
+async def usage_via_encoder(docs: list) -> bytes:
+    return JSONResponse(jsonable_encoder({"items": docs, "next_cursor": None})).body
+
+
+async def usage_via_documents(docs: list) -> bytes:
+    return ORJSONResponse({"items": docs, "next_cursor": None}).body
+
+
+async def best_of(func, docs: list, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await func(docs)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, len(body)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = (
+        ("tokens", token_documents, tokens_via_models, tokens_via_documents),
+        ("usage", usage_documents, usage_via_encoder, usage_via_documents),
+    )
+    print(f"{'endpoint':>8} {'records':>8} {'models ms':>10} {'documents ms':>13} {'speedup':>8} {'MB':>6}")
+    for name, generate, before, after in cases:
+        for size in (int(size) for size in args.sizes.split(",")):
+            docs = generate(size)
+            before_ms, _ = await best_of(before, docs, args.repeat)
+            after_ms, length = await best_of(after, docs, args.repeat)
+            print(f"{name:>8} {size:8,} {before_ms:10.1f} {after_ms:13.1f} {before_ms / after_ms:7.1f}x {length / 1e6:6.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""Benchmark: admin users/costs report, one query per user vs. a single aggregation.
+
+The old report loaded every user and then ran ``get_user_usage_cost`` once per
+user. ``get_users_costs`` answers the same question with one aggregation that
+looks each user up in the ``usage_totals`` rollup.
+
+Runs against the MongoDB at ``--url`` (a throwaway database is created and
+dropped), or against mongomock with ``--mock``, where ``--latency-ms`` adds a
+simulated network round-trip to every database call. mongomock has no indexes,
+so keep ``--users`` small in that mode.
+
+Usage:
+    python -m benchmarks.bench_users_costs --url mongodb://localhost:27017 --users 10000
+    python -m benchmarks.bench_users_costs --mock --users 1000 --latency-ms 0.5
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from bson import ObjectId
+
+from app.services.usage_service import get_user_usage_cost, get_users_costs
+
+
+class LatencyDatabase:
+    """Wraps a mock database so every call pays a simulated round-trip"""
+    def __init__(self, db, latency: float):
+        self._db = db
+        self._latency = latency
+
+    def __getattr__(self, name):
+        return LatencyCollection(getattr(self._db, name), self._latency)
+
+
+class LatencyCollection:
+    def __init__(self, collection, latency: float):
+        self._collection = collection
+        self._latency = latency
+
+    async def find_one(self, *args, **kwargs):
+        await asyncio.sleep(self._latency)
+        return await self._collection.find_one(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        return LatencyCursor(self._collection.find(*args, **kwargs), self._latency)
+
+    def aggregate(self, *args, **kwargs):
+        return LatencyCursor(self._collection.aggregate(*args, **kwargs), self._latency)
+
+
+class LatencyCursor:
+    def __init__(self, cursor, latency: float):
+        self._cursor = cursor
+        self._latency = latency
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self._latency)
+        return await self._cursor.to_list(length=length)
+
+
+async def seed(db, users: int):
+    user_docs = [
+        {"id": str(ObjectId()), "email": f"user{i}@example.com", "username": f"user{i}"}
+        for i in range(users)
+    ]
+    await db.users.insert_many(user_docs)
+    active = random.sample(user_docs, k=max(1, users * 3 // 10))
+    await db.usage_totals.insert_many([
+        {"user_id": user["id"], "count": random.randint(1, 100000), "latency_sum": 0.0}
+        for user in active
+    ])
+
+
+async def per_user_report(db):
+    """The previous implementation: one cost query per registered user"""
+    users = await db.users.find().to_list(length=None)
+    return [
+        {"user_id": user["id"], "total_cost": await get_user_usage_cost(user["id"], db)}
+        for user in users
+    ]
+
+
+async def single_pass_report(db, users: int):
+    return await get_users_costs(db, skip=0, limit=users)
+
+
+async def run(args):
+    if args.mock:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+        raw_db = client.bench_users_costs
+        db = LatencyDatabase(raw_db, args.latency_ms / 1000)
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from app.db.indexes import ensure_indexes
+        client = AsyncIOMotorClient(args.url)
+        raw_db = db = client[f"bench_users_costs_{ObjectId()}"]
+        await ensure_indexes(raw_db, ["users", "usage_totals"])
+
+    try:
+        await seed(raw_db, args.users)
+        for name, report in (
+            ("per-user", lambda: per_user_report(db)),
+            ("single", lambda: single_pass_report(db, args.users)),
+        ):
+            start = time.perf_counter()
+            rows = await report()
+            elapsed = time.perf_counter() - start
+            print(f"{name:>9}: {elapsed * 1000:10.1f} ms for {len(rows)} users")
+    finally:
+        if not args.mock:
+            await client.drop_database(raw_db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="mongodb://localhost:27017")
+    parser.add_argument("--mock", action="store_true")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--latency-ms", type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
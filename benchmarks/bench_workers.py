@@ -0,0 +1,142 @@
+"""Load test: requests/sec of the gunicorn multi-worker server as workers are added.
+
+Starts ``gunicorn app.main:app -c gunicorn.conf.py`` once per worker count against
+the MongoDB at ``--url`` (a throwaway database, dropped at the end). It then hammers
+one authenticated endpoint from several client processes and reports throughput
+and scaling efficiency. Each server is stopped with SIGTERM, so its workers drain.
+
+The load generator needs CPU too: on a single machine, give the clients their own
+cores (``--client-processes``) or the server will look like it stops scaling.
+
+Usage:
+    python -m benchmarks.bench_workers --url mongodb://localhost:27017 --workers 1,2,4 --duration 15
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.harness import BENCH_PASSWORD
+
+DB_NAME = "bench_workers"
+
+
+def start_server(workers: int, port: int, url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "BIND": f"127.0.0.1:{port}",
+        "MONGODB_URL": url,
+        "MONGODB_DB_NAME": DB_NAME,
+        # A single benchmark user would otherwise be throttled
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py"],
+        env=env,
+    )
+
+
+def wait_until_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/v1/auth/jwks.json").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=60)
+
+
+def login(base_url: str) -> dict:
+    email = "bench-workers@example.com"
+    httpx.post(f"{base_url}/api/v1/auth/register", json={"email": email, "username": "bench", "password": BENCH_PASSWORD})
+    response = httpx.post(f"{base_url}/api/v1/auth/login", data={"username": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def drive(base_url: str, path: str, headers: dict, connections: int, duration: float):
+    """One client process: ``connections`` keep-alive loops; returns (ok, errors)"""
+    counts = [0, 0]
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        deadline = time.monotonic() + duration
+
+        async def loop():
+            while time.monotonic() < deadline:
+                try:
+                    response = await client.get(path)
+                    counts[response.status_code >= 400] += 1
+                except httpx.HTTPError:
+                    counts[1] += 1
+
+        await asyncio.gather(*(loop() for _ in range(connections)))
+    return tuple(counts)
+
+
+def client_process(args):
+    return asyncio.run(drive(*args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="mongodb://localhost:27017")
+    parser.add_argument("--workers", default=None, help="Comma-separated worker counts (default: 1, 2, 4 ... up to the cores)")
+    parser.add_argument("--path", default="/api/v1/tokens/")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--client-processes", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(",")]
+    else:
+        worker_counts = [2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores]
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    per_process = max(1, args.connections // args.client_processes)
+    baseline = None
+    print(f"{'workers':>7} {'req/s':>10} {'errors':>7} {'speedup':>8} {'efficiency':>10}")
+    try:
+        for workers in worker_counts:
+            server = start_server(workers, args.port, args.url)
+            try:
+                wait_until_ready(base_url)
+                headers = login(base_url)
+                jobs = [(base_url, args.path, headers, per_process, args.duration)] * args.client_processes
+                started = time.monotonic()
+                with multiprocessing.Pool(args.client_processes) as pool:
+                    results = pool.map(client_process, jobs)
+                elapsed = time.monotonic() - started
+            finally:
+                stop_server(server)
+
+            ok = sum(result[0] for result in results)
+            errors = sum(result[1] for result in results)
+            rps = ok / elapsed
+            baseline = baseline or rps / workers
+            speedup = rps / baseline
+            print(f"{workers:7} {rps:10,.0f} {errors:7} {speedup:7.2f}x {speedup / workers:10.0%}")
+    finally:
+        MongoClient(args.url).drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Shared setup for benchmarks that drive the real app in-process against mongomock."""
+from httpx import ASGITransport, AsyncClient
+from mongomock.collection import BulkOperationBuilder
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.db.mongodb import MongoDB
+from app.main import app
+from app.schemas.user import UserCreate
+from app.services.auth_service import AuthService
+from app.services.token_cache import token_cache
+
+BENCH_PASSWORD = "bench-password-123"
+
+# mongomock 4.3 predates the ``sort`` argument pymongo 4.10+ passes with every bulk update
+_add_update = BulkOperationBuilder.add_update
+BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+
+
+async def use_mock_database(name: str = "bench"):
+    """Point the app at a fresh mongomock database"""
+    client = AsyncMongoMockClient()
+    MongoDB.client, MongoDB.db = client, client[name]
+    token_cache.clear()
+    # Benchmarks hammer a single user, keep the limiter out of the measurements
+    settings.RATE_LIMIT_ENABLED = False
+    return MongoDB.db
+
+
+async def create_user(db, email: str = "bench@example.com") -> dict:
+    """Register a user and log them in; returns their credentials and auth headers"""
+    auth_service = AuthService(db)
+    await auth_service.create_user(UserCreate(email=email, username=email.split("@")[0], password=BENCH_PASSWORD))
+    user = await auth_service.authenticate_user(email, BENCH_PASSWORD)
+    token = await auth_service.create_user_token(user)
+    return {
+        "email": email,
+        "password": BENCH_PASSWORD,
+        "token": token,
+        "headers": {"Authorization": f"Bearer {token}"},
+    }
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def app_client() -> AsyncClient:
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://bench")
@@ -0,0 +1,208 @@
+"""Benchmark suite: latency percentiles and throughput of the main API scenarios.
+
+Boots ``app.main:app`` in-process, lifespan included, against mongomock, or drives
+a server already running at ``--base-url`` (start it with rate limiting disabled).
+Each scenario sends its requests from ``--concurrency`` concurrent clients and
+records p50/p95/p99 latency and requests/sec.
+
+Results are compared with the stored baseline (``--baseline``). A scenario
+regresses when its p95 grows, or its throughput drops, by more than
+``--tolerance``; the run then exits with status 1. Baselines are only comparable
+on the same machine and settings: refresh one with ``--save-baseline``.
+
+Usage:
+    python -m benchmarks.suite --concurrency 10 --requests 200
+    python -m benchmarks.suite --scenarios list_tokens,usage_stats --save-baseline
+    python -m benchmarks.suite --base-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, NamedTuple
+
+import httpx
+
+from app.main import app
+from app.models.usage import APIUsage
+from app.services.usage_service import UsageService
+from benchmarks.harness import BENCH_PASSWORD, app_client, create_user, percentile, use_mock_database
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+
+class Scenario(NamedTuple):
+    name: str
+    send: Callable[[httpx.AsyncClient, dict], Awaitable[httpx.Response]]
+    # Fraction of --requests to send: bcrypt logins and one-second sleeps are slow
+    share: float = 1.0
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario(
+            "login",
+            lambda client, user: client.post(
+                "/api/v1/auth/login", data={"username": user["email"], "password": user["password"]}
+            ),
+            share=0.1,
+        ),
+        Scenario("get_token", lambda client, user: client.get(f"/api/v1/tokens/{user['token_id']}", headers=user["headers"])),
+        Scenario("list_tokens", lambda client, user: client.get("/api/v1/tokens/", headers=user["headers"])),
+        Scenario("usage_stats", lambda client, user: client.get("/api/v1/usage/stats", headers=user["headers"])),
+        Scenario("sleep", lambda client, user: client.get("/api/v1/test/sleep/1", headers=user["headers"]), share=0.1),
+    )
+}
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, user: dict, requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await scenario.send(client, user)
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+async def run_suite(client: httpx.AsyncClient, user: dict, args, scenarios) -> dict:
+    results = {}
+    for scenario in scenarios:
+        requests = max(args.concurrency, int(args.requests * scenario.share))
+        await run_scenario(client, scenario, user, min(requests, args.warmup), args.concurrency)
+        results[scenario.name] = await run_scenario(client, scenario, user, requests, args.concurrency)
+    return results
+
+
+async def seed_usage(user: dict, records: int):
+    """Give the usage stats scenario some history to aggregate"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await UsageService().create_usages([
+        APIUsage(
+            user_id=user["user_id"],
+            token=user["token"],
+            token_id=user["token_id"],
+            endpoint=f"/api/v1/example/{i % 10}",
+            method="GET",
+            status_code=200 if i % 20 else 500,
+            response_time=0.01 + (i % 50) / 1000,
+            timestamp=now - datetime.timedelta(minutes=i),
+        )
+        for i in range(records)
+    ])
+
+
+async def run_in_process(args, scenarios) -> dict:
+    db = await use_mock_database("bench_suite")
+    user = await create_user(db)
+    token = await db.tokens.find_one({"token": user["token"]})
+    user.update(token_id=token["id"], user_id=token["user_id"])
+    await seed_usage(user, args.usage_records)
+
+    # The real lifespan: usage write-behind, revocation sync and logging run as in production
+    async with app.router.lifespan_context(app):
+        async with app_client() as client:
+            return await run_suite(client, user, args, scenarios)
+
+
+async def run_against_server(args, scenarios) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        email = "bench-suite@example.com"
+        await client.post("/api/v1/auth/register", json={"email": email, "username": "bench", "password": BENCH_PASSWORD})
+        response = await client.post("/api/v1/auth/login", data={"username": email, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        tokens = (await client.get("/api/v1/tokens/", headers=headers)).json()
+        user = {"email": email, "password": BENCH_PASSWORD, "headers": headers, "token_id": tokens[0]["id"]}
+        return await run_suite(client, user, args, scenarios)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Names of the scenarios that got slower than the baseline allows"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous and (
+            current["p95"] > previous["p95"] * (1 + tolerance)
+            or current["rps"] < previous["rps"] * (1 - tolerance)
+        ):
+            regressions.append(name)
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    previous = baseline.get("results", {})
+    print(f"{'scenario':>12} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'vs baseline':>22}")
+    for name, r in results.items():
+        delta = ""
+        if name in previous:
+            delta = f"p95 {r['p95'] / previous[name]['p95'] - 1:+.0%}, req/s {r['rps'] / previous[name]['rps'] - 1:+.0%}"
+        print(
+            f"{name:>12} {r['requests']:8} {r['errors']:6} {r['rps']:9,.0f} "
+            f"{r['p50']:8.2f} {r['p95']:8.2f} {r['p99']:8.2f} {delta:>22}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario, before its share")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--usage-records", type=int, default=500)
+    parser.add_argument("--base-url", help="Benchmark a running server instead of the app in-process")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    scenarios = [SCENARIOS[name] for name in args.scenarios.split(",")]
+    runner = run_against_server if args.base_url else run_in_process
+    results = asyncio.run(runner(args, scenarios))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    config = {"concurrency": args.concurrency, "requests": args.requests, "target": args.base_url or "in-process"}
+    if baseline and baseline.get("config") != config:
+        print(f"Warning: baseline was recorded with {baseline.get('config')}, this run uses {config}")
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        baseline = {
+            "config": config,
+            "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+            "results": {**baseline.get("results", {}), **results},
+        }
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Gunicorn settings: several uvicorn worker processes behind one socket.
+
+Usage:
+    gunicorn app.main:app -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# One single-threaded event loop per core
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+# Workers read it to size their own thread pools and to pick shared backends
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Workers keep their metric values in files here, so /metrics on any of them reports all.
+# prometheus_client reads it on import, hence before the workers load the app.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "ai-to-api-metrics"))
+
+# Each worker imports the app after fork, so no client, pool or thread is inherited.
+# MONGODB_MAX_POOL_SIZE applies per worker.
+preload_app = False
+
+# On SIGTERM a worker stops accepting, finishes in-flight requests, then runs the
+# lifespan shutdown, which flushes buffered usage. Leave room for
+# USAGE_WRITER_FLUSH_TIMEOUT_SECONDS on top of the slowest request.
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = 5
+
+
+def on_starting(server):
+    # Counters restart with the server: drop the files of a previous run
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Its counters still count; its gauges no longer do
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
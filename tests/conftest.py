@@ -1,15 +1,26 @@
 import pytest
 import logging
 import asyncio
-from httpx import AsyncClient
+from httpx import AsyncClient, ASGITransport
 from fastapi.testclient import TestClient
 from app.main import app
 from app.core.config import settings
+from app.db.mongodb import MongoDB, get_database
 from app.models.token import Token
 from app.services.token_service import TokenService
 from app.services.usage_service import UsageService
-import mongomock
-import motor.motor_asyncio
+from app.services.token_cache import token_cache
+from app.services.revocation import revocation_list
+from app.services.profiling import profiler
+from app.services.response_cache import response_cache
+from app.services.catalog_index import catalog_index
+from app.services.egress import egress_policy, system_resolver
+from mongomock.collection import BulkOperationBuilder
+from mongomock_motor import AsyncMongoMockClient
+
+# mongomock 4.3 predates the ``sort`` argument pymongo 4.10+ passes with every bulk update
+_add_update = BulkOperationBuilder.add_update
+BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,9 +36,21 @@ def event_loop():
 def setup_logging():
     yield
 
+@pytest.fixture(autouse=True)
+def upstream_dns(monkeypatch):
+    """Resolve the tests' ``*.test`` upstreams to a public address; stub transports never connect to it"""
+    async def resolver(host: str, port: int):
+        if host.endswith(".test"):
+            return ["93.184.215.14"]
+        return await system_resolver(host, port)
+    monkeypatch.setattr(egress_policy, "resolver", resolver)
+    egress_policy.clear()
+    yield
+
 class MockMotorClient:
     def __init__(self):
-        self.mock_db = mongomock.MongoClient().db
+        self.client = AsyncMongoMockClient()
+        self.mock_db = self.client.db
         self.db = self.mock_db
 
     def get_database(self):
@@ -39,10 +62,19 @@ async def test_db():
     mock_client = MockMotorClient()
     db = mock_client.get_database()
     # Clear all collections before tests
-    db.users.delete_many({})
-    db.tokens.delete_many({})
-    db.usage.delete_many({})
-    return db
+    await db.users.delete_many({})
+    await db.tokens.delete_many({})
+    await db.usage.delete_many({})
+    # Services read the database from MongoDB directly, so point it at the mock
+    MongoDB.client, MongoDB.db = mock_client.client, db
+    token_cache.clear()
+    revocation_list.clear()
+    catalog_index.clear()
+    profiler.reset()
+    await response_cache.clear()
+    yield db
+    MongoDB.client, MongoDB.db = None, None
+    profiler.reset()
 
 @pytest.fixture
 def override_get_db(test_db):
@@ -55,7 +87,7 @@ def override_get_db(test_db):
 
 @pytest.fixture
 async def client(override_get_db):
-    async with AsyncClient(app=app, base_url="http://test") as ac:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
         yield ac
 
 @pytest.fixture
@@ -83,11 +115,11 @@ def normal_user():
     }
 
 @pytest.fixture
-def token_service():
+def token_service(test_db):
     return TokenService()
 
 @pytest.fixture
-def usage_service():
+def usage_service(test_db):
     return UsageService()
 
 @pytest.fixture
@@ -148,11 +180,11 @@ async def auth_headers_and_token(client, test_user, test_db):
 @pytest.fixture
 async def auth_headers(auth_headers_and_token):
     """Returns just the auth headers"""
-    headers, _ = await auth_headers_and_token
+    headers, _ = auth_headers_and_token
     return headers
 
 @pytest.fixture
-async def sample_token(auth_headers_and_token) -> Token:
+async def sample_token(auth_headers_and_token, token_service) -> Token:
     """Returns just the token object"""
-    _, token = await auth_headers_and_token
-    return token 
\ No newline at end of file
+    _, token = auth_headers_and_token
+    return await token_service.get_token_by_value(token) 
\ No newline at end of file
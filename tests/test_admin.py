@@ -6,6 +6,7 @@ import mongomock
 from app.models.user import User
 from app.schemas.user import UserCreate
 from app.services.auth_service import AuthService
+from app.services.usage_service import get_users_costs
 
 @pytest.mark.asyncio
 async def test_first_user_is_admin(client: AsyncClient, test_db):
@@ -45,7 +46,7 @@ async def test_second_user_not_admin(client: AsyncClient, test_db):
 async def test_admin_get_users(client: AsyncClient, test_db, admin_token):
     """Test that admin can get list of all users"""
     response = await client.get(
-        "/api/v1/users",
+        "/api/v1/users/users",
         headers={"Authorization": f"Bearer {admin_token}"}
     )
     assert response.status_code == 200
@@ -57,7 +58,7 @@ async def test_admin_get_users(client: AsyncClient, test_db, admin_token):
 async def test_non_admin_get_users_forbidden(client: AsyncClient, test_db, normal_token):
     """Test that non-admin users cannot access user list"""
     response = await client.get(
-        "/api/v1/users",
+        "/api/v1/users/users",
         headers={"Authorization": f"Bearer {normal_token}"}
     )
     assert response.status_code == 403
@@ -66,7 +67,7 @@ async def test_non_admin_get_users_forbidden(client: AsyncClient, test_db, norma
 async def test_admin_get_users_costs(client: AsyncClient, test_db, admin_token):
     """Test that admin can get users costs"""
     response = await client.get(
-        "/api/v1/users/costs",
+        "/api/v1/users/users/costs",
         headers={"Authorization": f"Bearer {admin_token}"}
     )
     assert response.status_code == 200
@@ -82,7 +83,28 @@ async def test_admin_get_users_costs(client: AsyncClient, test_db, admin_token):
 async def test_non_admin_get_users_costs_forbidden(client: AsyncClient, test_db, normal_token):
     """Test that non-admin users cannot access user costs"""
     response = await client.get(
-        "/api/v1/users/costs",
+        "/api/v1/users/users/costs",
         headers={"Authorization": f"Bearer {normal_token}"}
     )
-    assert response.status_code == 403 
\ No newline at end of file
+    assert response.status_code == 403
+
+@pytest.mark.asyncio
+async def test_users_costs_single_aggregation(test_db):
+    """Test that all users' costs come back sorted by cost, paginated, including idle users"""
+    await test_db.users.insert_many([
+        {"id": "u1", "email": "u1@example.com", "username": "u1"},
+        {"id": "u2", "email": "u2@example.com", "username": "u2"},
+        {"id": "u3", "email": "u3@example.com", "username": "u3"},
+    ])
+    await test_db.usage_totals.insert_many([
+        {"user_id": "u1", "count": 10, "latency_sum": 0.0},
+        {"user_id": "u3", "count": 300, "latency_sum": 0.0},
+    ])
+
+    costs = await get_users_costs(test_db)
+    assert [cost["user_id"] for cost in costs] == ["u3", "u1", "u2"]
+    assert costs[0]["total_cost"] == pytest.approx(3.0)
+    assert costs[2]["total_cost"] == 0
+
+    page = await get_users_costs(test_db, skip=1, limit=1, descending=False)
+    assert [cost["user_id"] for cost in page] == ["u1"]
@@ -0,0 +1,278 @@
+import pytest
+import asyncio
+import json
+import httpx
+from httpx import AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.services.api_service import api_cache
+from app.services.coalescing import SharedResponse, proxy_cache
+from app.services.egress import EgressPolicy, egress_policy
+from app.services.proxy import upstream_proxy
+
+async def echo(request):
+    body = await request.body()
+    return JSONResponse(
+        {
+            "method": request.method,
+            "path": request.url.path,
+            "query": request.url.query,
+            "headers": dict(request.headers),
+            "body": body.decode(),
+        },
+        headers={"X-Upstream": "stub"},
+    )
+
+async def stream(request):
+    async def chunks():
+        for i in range(3):
+            yield f"data: {i}\n\n"
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+upstream_calls = []
+
+async def slow(request):
+    upstream_calls.append(await request.body())
+    await asyncio.sleep(0.1)
+    return JSONResponse({"completion": len(upstream_calls)})
+
+async def session(request):
+    upstream_calls.append(await request.body())
+    await asyncio.sleep(0.1)
+    return JSONResponse({"session": len(upstream_calls)}, headers={"Set-Cookie": f"sid={len(upstream_calls)}"})
+
+async def no_store(request):
+    upstream_calls.append(await request.body())
+    return JSONResponse({"completion": len(upstream_calls)}, headers={"Cache-Control": "no-store"})
+
+def refuse(request: httpx.Request):
+    raise httpx.ConnectError("connection refused", request=request)
+
+stub_upstream = Starlette(routes=[
+    Route("/v1/stream", stream, methods=["POST"]),
+    Route("/v1/slow", slow, methods=["POST"]),
+    Route("/v1/session", session, methods=["POST"]),
+    Route("/v1/no-store", no_store, methods=["POST"]),
+    Route("/v1/{path:path}", echo, methods=["GET", "POST"]),
+])
+
+@pytest.fixture
+async def upstream():
+    """Route every proxied call to the in-process stub upstream"""
+    await upstream_proxy.close()
+    upstream_proxy.transport = httpx.ASGITransport(app=stub_upstream)
+    api_cache.clear()
+    await proxy_cache.clear()
+    upstream_calls.clear()
+    yield
+    await upstream_proxy.close()
+    upstream_proxy.transport = None
+
+async def publish(client: AsyncClient, headers: dict, **fields) -> dict:
+    api = {"name": "Echo", "endpoint": "http://upstream.test/v1", "method": "POST", **fields}
+    response = await client.post("/api/v1/apis/", json=api, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+async def test_api_crud(client: AsyncClient, admin_token, normal_token):
+    """Test that an API is published, listed, and only changed by its owner or an admin"""
+    owner = {"Authorization": f"Bearer {normal_token}"}
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    api = await publish(client, owner, pricing_type="pay-per-call", price=0.002)
+    assert api["status"] == "active"
+
+    response = await client.get("/api/v1/apis/", headers=admin)
+    assert [a["id"] for a in response.json()] == [api["id"]]
+
+    response = await client.put(f"/api/v1/apis/{api['id']}", json={"status": "disabled"}, headers=owner)
+    assert response.status_code == 200
+    assert response.json()["status"] == "disabled"
+    response = await client.get("/api/v1/apis/", headers=admin)
+    assert response.json() == []
+
+    other = await publish(client, admin)
+    response = await client.delete(f"/api/v1/apis/{other['id']}", headers=owner)
+    assert response.status_code == 403
+    response = await client.delete(f"/api/v1/apis/{api['id']}", headers=admin)
+    assert response.status_code == 200
+    response = await client.get(f"/api/v1/apis/{api['id']}", headers=admin)
+    assert response.status_code == 404
+
+async def test_call_api_forwards_request(client: AsyncClient, auth_headers, upstream, test_db):
+    """Test that a call reaches the upstream below the API's endpoint, without the platform token, and is metered"""
+    api = await publish(client, auth_headers)
+    response = await client.post(
+        f"/api/v1/apis/{api['id']}/call/chat?model=small",
+        content=b'{"prompt": "hi"}',
+        headers={**auth_headers, "Content-Type": "application/json"},
+    )
+    assert response.status_code == 200
+    assert response.headers["x-upstream"] == "stub"
+    echoed = response.json()
+    assert echoed["method"] == "POST"
+    assert echoed["path"] == "/v1/chat"
+    assert echoed["query"] == "model=small"
+    assert json.loads(echoed["body"]) == {"prompt": "hi"}
+    assert "authorization" not in echoed["headers"]
+
+    usage = await test_db.usage.find_one({"api_id": api["id"]})
+    assert usage["endpoint"] == f"/api/v1/apis/{api['id']}/call/chat"
+    assert usage["status_code"] == 200
+
+async def test_call_api_streams_response(client: AsyncClient, auth_headers, upstream):
+    """Test that a streamed upstream response arrives whole, with its content type"""
+    api = await publish(client, auth_headers)
+    async with client.stream("POST", f"/api/v1/apis/{api['id']}/call/stream", headers=auth_headers) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = b"".join([chunk async for chunk in response.aiter_bytes()])
+    assert body == b"data: 0\n\ndata: 1\n\ndata: 2\n\n"
+
+async def test_call_api_errors(client: AsyncClient, auth_headers, upstream):
+    """Test the answers to unknown APIs, wrong methods and unreachable upstreams"""
+    response = await client.post("/api/v1/apis/missing/call", headers=auth_headers)
+    assert response.status_code == 404
+
+    api = await publish(client, auth_headers)
+    response = await client.get(f"/api/v1/apis/{api['id']}/call/chat", headers=auth_headers)
+    assert response.status_code == 405
+    assert response.headers["allow"] == "POST"
+
+    upstream_proxy.transport = httpx.MockTransport(refuse)
+    await upstream_proxy.close()
+    response = await client.post(f"/api/v1/apis/{api['id']}/call/chat", headers=auth_headers)
+    assert response.status_code == 502
+
+async def test_update_ignores_nulls(client: AsyncClient, auth_headers):
+    """Test that null fields in an update leave the stored API unchanged"""
+    api = await publish(client, auth_headers)
+    response = await client.put(
+        f"/api/v1/apis/{api['id']}",
+        json={"name": None, "price": None, "method": None, "endpoint": None, "description": "v2"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["name"] == api["name"]
+    assert response.json()["description"] == "v2"
+    response = await client.get(f"/api/v1/apis/{api['id']}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["endpoint"] == api["endpoint"]
+
+async def test_private_endpoints_rejected(client: AsyncClient, auth_headers):
+    """Test that APIs cannot be published on, or moved to, loopback, private or link-local addresses"""
+    for endpoint in ("http://127.0.0.1:8080/v1", "http://localhost/v1", "http://169.254.169.254/latest", "http://[::1]/v1", "http://10.0.0.5/v1"):
+        response = await client.post("/api/v1/apis/", json={"name": "Internal", "endpoint": endpoint}, headers=auth_headers)
+        assert response.status_code == 422, endpoint
+
+    api = await publish(client, auth_headers)
+    response = await client.put(f"/api/v1/apis/{api['id']}", json={"endpoint": "http://192.168.1.1/"}, headers=auth_headers)
+    assert response.status_code == 422
+
+async def test_proxy_checks_address_on_connect(client: AsyncClient, auth_headers, monkeypatch):
+    """Test that a host rebound to a private address after publishing is refused when the call connects"""
+    api = await publish(client, auth_headers)
+
+    async def rebound(host: str, port: int):
+        return ["10.0.0.5"]
+    monkeypatch.setattr(egress_policy, "resolver", rebound)
+    egress_policy.clear()
+    await upstream_proxy.close()
+    api_cache.clear()
+    response = await client.post(f"/api/v1/apis/{api['id']}/call/chat", headers=auth_headers)
+    assert response.status_code == 502
+    assert response.json()["detail"] == "Upstream address not allowed"
+
+async def test_allowed_hosts():
+    """Test that PROXY_ALLOWED_HOSTS admits exact hosts and, with a leading dot, subdomains"""
+    policy = EgressPolicy(["api.example.com", ".models.example.org"], allow_private=True, cache_ttl=30)
+    assert policy.host_allowed("api.example.com")
+    assert policy.host_allowed("eu.models.example.org")
+    assert not policy.host_allowed("models.example.org.evil.com")
+    assert not policy.host_allowed("example.com")
+
+async def test_identical_calls_share_upstream_request(client: AsyncClient, auth_headers, upstream, test_db):
+    """Test that identical concurrent calls make one upstream request, and each caller is still metered"""
+    api = await publish(client, auth_headers, coalesce=True)
+    url = f"/api/v1/apis/{api['id']}/call/slow"
+    headers = {**auth_headers, "Content-Type": "application/json"}
+    # The same JSON with its keys in another order is the same call
+    first, second = await asyncio.gather(
+        client.post(url, content=b'{"prompt": "hi", "n": 1}', headers=headers),
+        client.post(url, content=b'{"n":1,"prompt":"hi"}', headers=headers),
+    )
+    assert len(upstream_calls) == 1
+    assert first.json() == second.json() == {"completion": 1}
+    assert sorted([first.headers["x-gateway-cache"], second.headers["x-gateway-cache"]]) == ["coalesced", "miss"]
+    assert await test_db.usage.count_documents({"api_id": api["id"]}) == 2
+
+    # Once it has completed, the next identical call goes upstream again
+    response = await client.post(url, content=b'{"prompt": "hi", "n": 1}', headers=headers)
+    assert response.json() == {"completion": 2}
+
+async def test_calls_with_other_credentials_not_shared(client: AsyncClient, auth_headers, upstream):
+    """Test that calls differing in credential or content negotiation headers do not share a response"""
+    api = await publish(client, auth_headers, coalesce=True)
+    url = f"/api/v1/apis/{api['id']}/call/slow"
+    await asyncio.gather(
+        client.post(url, content=b"same", headers={**auth_headers, "X-Api-Key": "alice"}),
+        client.post(url, content=b"same", headers={**auth_headers, "X-Api-Key": "bob"}),
+        client.post(url, content=b"same", headers={**auth_headers, "X-Api-Key": "bob", "Accept": "text/plain"}),
+    )
+    assert len(upstream_calls) == 3
+
+async def test_private_responses_not_shared(client: AsyncClient, auth_headers, upstream):
+    """Test that a response setting a cookie goes to its own caller only, and no-store ones are not cached"""
+    api = await publish(client, auth_headers, coalesce=True, cache_ttl_seconds=60)
+    url = f"/api/v1/apis/{api['id']}/call/session"
+    first, second = await asyncio.gather(
+        client.post(url, content=b"same", headers=auth_headers),
+        client.post(url, content=b"same", headers=auth_headers),
+    )
+    # The caller that joined found the response private and made its own request
+    assert len(upstream_calls) == 2
+    assert {first.cookies["sid"], second.cookies["sid"]} == {"1", "2"}
+    assert (await client.post(url, content=b"same", headers=auth_headers)).headers["x-gateway-cache"] == "miss"
+
+    url = f"/api/v1/apis/{api['id']}/call/no-store"
+    await client.post(url, content=b"same", headers=auth_headers)
+    response = await client.post(url, content=b"same", headers=auth_headers)
+    assert response.headers["x-gateway-cache"] == "miss"
+
+async def test_shared_response_memory_cap():
+    """Test that a response past the size cap takes no more callers and drops the chunks read by all"""
+    flight = SharedResponse(max_bytes=10)
+    flight.start(200, [])
+    first, second = flight.join(), flight.join()
+    first_stream, second_stream = flight.stream(first), flight.stream(second)
+    flight.append(b"aaaaaa")
+    assert await first_stream.__anext__() == b"aaaaaa"
+    flight.append(b"bbbbbb")
+    assert not flight.shareable
+    # The second caller has read nothing yet: everything is still there for it
+    assert flight.chunks == [b"aaaaaa", b"bbbbbb"]
+    assert await second_stream.__anext__() == b"aaaaaa"
+    assert flight.chunks == [b"bbbbbb"]
+    assert await first_stream.__anext__() == b"bbbbbb"
+    assert await second_stream.__anext__() == b"bbbbbb"
+    assert flight.chunks == []
+    flight.finish(True)
+    assert [chunk async for chunk in first_stream] == [chunk async for chunk in second_stream] == []
+
+async def test_cached_api_responses(client: AsyncClient, auth_headers, upstream):
+    """Test that an API opting in answers repeated calls from the cache until it changes"""
+    api = await publish(client, auth_headers, cache_ttl_seconds=60)
+    url = f"/api/v1/apis/{api['id']}/call/slow"
+    response = await client.post(url, content=b"same", headers=auth_headers)
+    assert response.headers["x-gateway-cache"] == "miss"
+    response = await client.post(url, content=b"same", headers=auth_headers)
+    assert response.headers["x-gateway-cache"] == "hit"
+    assert response.json() == {"completion": 1}
+    response = await client.post(url, content=b"other", headers=auth_headers)
+    assert response.json() == {"completion": 2}
+
+    # Changing the API drops its cached responses
+    await client.put(f"/api/v1/apis/{api['id']}", json={"description": "v2"}, headers=auth_headers)
+    response = await client.post(url, content=b"same", headers=auth_headers)
+    assert response.json() == {"completion": 3}
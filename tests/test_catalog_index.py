@@ -0,0 +1,174 @@
+import pytest
+import datetime
+from httpx import AsyncClient
+
+from app.models.api import API
+from app.services.catalog_index import CatalogIndex, catalog_index
+
+def make_api(api_id: str, name: str, description: str = "", pricing_type: str = "free", price: float = 0.0, status: str = "active") -> API:
+    return API(
+        id=api_id,
+        name=name,
+        description=description,
+        endpoint="http://upstream.test/v1",
+        owner_id="owner",
+        pricing_type=pricing_type,
+        price=price,
+        status=status,
+    )
+
+@pytest.fixture
+def index() -> CatalogIndex:
+    index = CatalogIndex(sync_interval=1.0, overlap=5.0)
+    index.add(make_api("a", "Text Summarizer", "Summarize long documents", "pay-per-call", 0.002))
+    index.add(make_api("b", "Translator", "Translate text between languages", "pay-per-call", 0.01))
+    index.add(make_api("c", "Image Captions", "Describe images in text", "subscription", 25.0))
+    index.add(make_api("d", "Text Classifier", "Label text", "free", 0.0, status="disabled"))
+    return index
+
+def ids(result: dict) -> list:
+    return [item["id"] for item in result["items"]]
+
+def test_search_ranks_name_matches_first(index: CatalogIndex):
+    """Test that every term must match, names outrank descriptions, and ties go to the newest"""
+    result = index.search("text", status="active")
+    assert ids(result) == ["a", "c", "b"]
+    assert result["total"] == 3
+    assert result["items"][0]["score"] > result["items"][1]["score"]
+    assert ids(index.search("TEXT summarizer")) == ["a"]
+    assert index.search("text video")["total"] == 0
+    assert ids(index.search("", sort="newest", limit=2)) == ["d", "c"]
+    assert ids(index.search("text", status="active", skip=1, limit=1)) == ["c"]
+
+def test_search_facets_and_price_range(index: CatalogIndex):
+    """Test the price range filter and that each facet's counts ignore its own filter"""
+    result = index.search("text", pricing_type="pay-per-call")
+    assert ids(result) == ["a", "b"]
+    assert result["facets"]["pricing_type"] == {"pay-per-call": 2, "subscription": 1, "free": 1}
+    assert result["facets"]["status"] == {"active": 2, "disabled": 0}
+
+    assert ids(index.search(min_price=0.002, max_price=0.01)) == ["b", "a"]
+    assert ids(index.search(min_price=0.003)) == ["c", "b"]
+    assert ids(index.search(max_price=0.0)) == ["d"]
+    assert index.search(min_price=1, max_price=0.5)["total"] == 0
+
+def test_index_follows_updates_and_deletions(index: CatalogIndex):
+    """Test that an updated API is filed under its new terms and price, and a deleted one is gone"""
+    index.add(make_api("b", "Speech to Text", "Transcribe audio", "subscription", 9.0))
+    assert index.search("translate")["total"] == 0
+    assert ids(index.search("speech")) == ["b"]
+    assert ids(index.search("", pricing_type="subscription", sort="newest")) == ["c", "b"]
+    assert ids(index.search(min_price=5, max_price=10)) == ["b"]
+
+    index.remove("a")
+    index.remove("a")
+    assert index.search("summarizer")["total"] == 0
+    assert len(index) == 3
+    assert index.search()["facets"]["pricing_type"] == {"subscription": 2, "free": 1}
+
+async def test_sync_replays_other_workers_changes(test_db):
+    """Test that a sync loads the catalog, then picks up the APIs changed or deleted elsewhere"""
+    index = CatalogIndex(sync_interval=1.0, overlap=5.0)
+    await test_db.apis.insert_one(make_api("a", "Text Summarizer").model_dump())
+    assert await index.sync() == 1
+    assert ids(index.search("summarizer")) == ["a"]
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await test_db.apis.insert_one(make_api("b", "Translator").model_dump())
+    await test_db.apis.update_one({"id": "a"}, {"$set": {"name": "Text Shortener", "updated_at": now}})
+    await index.sync()
+    assert ids(index.search("text")) == ["a"]
+    assert ids(index.search("translator")) == ["b"]
+
+    await test_db.apis.delete_one({"id": "b"})
+    await test_db.api_deletions.insert_one({"id": "b", "deleted_at": now})
+    await index.sync()
+    assert index.search("translator")["total"] == 0
+
+async def test_sync_compacts_freed_slots(test_db, monkeypatch):
+    """Test that once deletions free more slots than there are APIs, a sync renumbers the rest in order"""
+    monkeypatch.setattr("app.services.catalog_index.COMPACT_MIN_FREE_SLOTS", 2)
+    index = CatalogIndex(sync_interval=1.0, overlap=5.0)
+    await index.sync()
+    for i in range(6):
+        index.add(make_api(f"api{i}", f"Model {i}", pricing_type="free" if i % 2 else "pay-per-call", price=i))
+    for i in (0, 2, 3, 4):
+        index.remove(f"api{i}")
+    await index.sync()
+    assert index._next_slot == 2
+    assert ids(index.search("model", sort="newest")) == ["api5", "api1"]
+    assert index.search(min_price=3)["total"] == 1
+    assert index.search()["facets"]["pricing_type"] == {"free": 2}
+
+    index.add(make_api("api6", "Model 6"))
+    assert ids(index.search("model", sort="newest")) == ["api6", "api5", "api1"]
+
+async def test_search_endpoint(client: AsyncClient, admin_token, normal_token):
+    """Test that searches see published, updated and deleted APIs at once, disabled ones only for admins"""
+    owner = {"Authorization": f"Bearer {normal_token}"}
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    for name, pricing_type, price in [("Text Summarizer", "pay-per-call", 0.002), ("Text Translator", "subscription", 20.0)]:
+        response = await client.post(
+            "/api/v1/apis/",
+            json={"name": name, "endpoint": "http://upstream.test/v1", "pricing_type": pricing_type, "price": price},
+            headers=owner,
+        )
+        assert response.status_code == 200
+    summarizer, translator = [api["id"] for api in (await client.get("/api/v1/apis/", headers=owner)).json()]
+
+    response = await client.get("/api/v1/apis/search", params={"q": "text", "max_price": 1}, headers=owner)
+    assert response.status_code == 200
+    result = response.json()
+    assert ids(result) == [summarizer]
+    assert result["facets"]["pricing_type"] == {"pay-per-call": 1, "subscription": 0}
+    # Counts of disabled APIs are for admins only
+    assert "status" not in result["facets"]
+    response = await client.get("/api/v1/apis/search", params={"q": "text"}, headers=admin)
+    assert response.json()["facets"]["status"] == {"active": 2}
+
+    await client.put(f"/api/v1/apis/{summarizer}", json={"status": "disabled"}, headers=owner)
+    await client.delete(f"/api/v1/apis/{translator}", headers=owner)
+    response = await client.get("/api/v1/apis/search", params={"q": "text", "status": "disabled"}, headers=owner)
+    assert response.json()["total"] == 0
+    response = await client.get("/api/v1/apis/search", params={"q": "text", "status": "disabled"}, headers=admin)
+    assert ids(response.json()) == [summarizer]
+    assert len(catalog_index) == 1
+
+    response = await client.get("/api/v1/apis/search", params={"sort": "cheapest"}, headers=owner)
+    assert response.status_code == 422
+
+def test_bitmaps_and_sets_agree(monkeypatch):
+    """Test that common terms, kept as bitmaps, give the same results as rare ones kept as sets"""
+    words = ["text", "image", "audio", "fast", "large", "chat"]
+    apis = [
+        make_api(
+            f"api{i}",
+            " ".join(words[(i * j) % len(words)] for j in (1, 2)),
+            " ".join(words[(i + j) % len(words)] for j in range(i % 4)),
+            "free" if i % 3 == 0 else "pay-per-call",
+            0.0 if i % 3 == 0 else 0.001 * i,
+            "active" if i % 5 else "disabled",
+        )
+        for i in range(40)
+    ]
+    queries = [
+        dict(query="text"), dict(query="text large", sort="newest"), dict(query="fast large chat", pricing_type="free"),
+        dict(query="image", min_price=0.005, max_price=0.02, status="active"), dict(min_price=0.01, skip=3, limit=5),
+    ]
+    sets = CatalogIndex(sync_interval=1.0, overlap=5.0)
+    sets.load(apis)
+    monkeypatch.setattr("app.services.catalog_index.SPARSE_MAX_POSTINGS", 4)
+    bitmaps = CatalogIndex(sync_interval=1.0, overlap=5.0)
+    for api in apis:
+        bitmaps.add(api)
+    assert bitmaps._dense and not sets._dense
+    for kwargs in queries:
+        assert bitmaps.search(**kwargs) == sets.search(**kwargs)
+
+    # Down to a few APIs, a term goes back to a set
+    for api in apis[:36]:
+        bitmaps.remove(api.id)
+        sets.remove(api.id)
+    assert not bitmaps._dense
+    for kwargs in queries:
+        assert bitmaps.search(**kwargs) == sets.search(**kwargs)
@@ -0,0 +1,75 @@
+import pytest
+import os
+import datetime
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.db.indexes import ensure_indexes, index_registry
+
+MONGODB_TEST_URL = os.getenv("MONGODB_TEST_URL")
+NOW = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+
+# The filters the services send to each collection
+SERVICE_QUERIES = [
+    ("users", {"email": "someone@example.com"}, None),
+    ("tokens", {"token": "some.jwt.value"}, None),
+    ("tokens", {"id": "6630f0c0a1b2c3d4e5f60708"}, None),
+    ("tokens", {"user_id": "6630f0c0a1b2c3d4e5f60708"}, None),
+    ("usage", {"user_id": "u", "timestamp": {"$gte": NOW, "$lte": NOW}}, [("timestamp", 1), ("_id", 1)]),
+    ("usage", {"api_id": "a"}, None),
+    ("usage_rollups", {"user_id": "u", "granularity": "hour"}, None),
+    ("usage_totals", {"user_id": "u"}, None),
+    ("users", {"id": "6630f0c0a1b2c3d4e5f60708"}, None),
+    ("usage_rollups", {"user_id": "u", "granularity": "minute", "bucket": {"$gte": NOW, "$lte": NOW}}, None),
+    ("token_revocations", {"revoked_at": {"$gte": NOW}}, None),
+    ("apis", {"id": "6630f0c0a1b2c3d4e5f60708"}, None),
+    ("apis", {"owner_id": "u"}, [("created_at", 1)]),
+    ("apis", {"status": "active"}, [("created_at", 1)]),
+    ("apis", {"updated_at": {"$gte": NOW}}, None),
+    ("api_deletions", {"deleted_at": {"$gte": NOW}}, None),
+]
+
+def plan_stages(plan: dict):
+    """Every stage name in a (possibly nested) winning plan"""
+    yield plan.get("stage")
+    for child in plan.get("inputStages", []) + [plan.get("inputStage") or {}]:
+        if child:
+            yield from plan_stages(child)
+    if "queryPlan" in plan:
+        yield from plan_stages(plan["queryPlan"])
+
+async def test_ensure_indexes_creates_registry(test_db):
+    """Test that every registered index is created and re-running is a no-op"""
+    await ensure_indexes(test_db)
+    await ensure_indexes(test_db)
+    for collection, indexes in index_registry().items():
+        info = await test_db[collection].index_information()
+        for index in indexes:
+            assert index.document["name"] in info
+
+    tokens = await test_db.tokens.index_information()
+    assert "expireAfterSeconds" in tokens["expires_at_ttl"]
+    rollups = await test_db.usage_rollups.index_information()
+    assert "expireAfterSeconds" in rollups["minute_bucket_ttl"]
+    # Only minute buckets expire
+    ttl = next(index for index in index_registry()["usage_rollups"] if index.document["name"] == "minute_bucket_ttl")
+    assert ttl.document["partialFilterExpression"] == {"granularity": "minute"}
+
+@pytest.mark.skipif(not MONGODB_TEST_URL, reason="explain plans need a real MongoDB (set MONGODB_TEST_URL)")
+@pytest.mark.parametrize("collection,query,sort", SERVICE_QUERIES)
+async def test_service_queries_use_indexes(collection, query, sort):
+    """Test that each service query is answered by an index scan, never a COLLSCAN"""
+    client = AsyncIOMotorClient(MONGODB_TEST_URL)
+    db = client[f"explain_{ObjectId()}"]
+    try:
+        await ensure_indexes(db)
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = set(plan_stages(explain["queryPlanner"]["winningPlan"]))
+        assert "COLLSCAN" not in stages
+        assert "IXSCAN" in stages or "EXPRESS_IXSCAN" in stages
+    finally:
+        await client.drop_database(db.name)
+        client.close()
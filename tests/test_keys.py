@@ -0,0 +1,104 @@
+import pytest
+import json
+import os
+import time
+from httpx import AsyncClient
+
+from app.commands.generate_signing_key import add_key, public_pem
+from jwt.utils import base64url_decode, base64url_encode
+
+from app.core.keys import HMACKey, InvalidTokenError, KeySet, KeyStore, load_key
+from app.core import security
+
+def make_keyset_file(path, alg="ES256", kid="k1") -> dict:
+    keyset = add_key({"active_kid": None, "keys": []}, alg, kid, activate=True)
+    path.write_text(json.dumps(keyset))
+    return keyset
+
+@pytest.mark.parametrize("alg", ["RS256", "ES256", "EdDSA"])
+def test_asymmetric_round_trip(alg):
+    """Test that tokens carry the kid and verify with the public half only"""
+    entry = add_key({"active_kid": None, "keys": []}, alg, "k1", activate=True)["keys"][0]
+    keyset = KeySet([load_key(entry)], active_kid="k1")
+    token = keyset.encode({"sub": "a@example.com", "exp": time.time() + 60})
+
+    public_entry = {"kid": "k1", "alg": alg, "public_key": public_pem(keyset.keys["k1"].private_key)}
+    public_only = KeySet([load_key(public_entry)])
+    assert public_only.decode(token)["sub"] == "a@example.com"
+    assert public_only.jwks()["keys"][0]["kid"] == "k1"
+
+def test_rejects_bad_tokens():
+    """Test that tampered, expired, unknown-kid and alg-swapped tokens are rejected"""
+    legacy = HMACKey(None, b"secret")
+    entry = add_key({"active_kid": None, "keys": []}, "ES256", "k1", activate=True)["keys"][0]
+    keyset = KeySet([load_key(entry)], active_kid="k1", legacy_key=legacy)
+
+    token = keyset.encode({"sub": "a@example.com", "exp": time.time() + 60})
+    header, payload, signature = token.split(".")
+    forged = base64url_encode(json.dumps({"sub": "admin@example.com"}).encode()).decode()
+    bad_tokens = [
+        f"{header}.{forged}.{signature}",
+        keyset.encode({"sub": "a@example.com", "exp": time.time() - 1}),
+        KeySet([], legacy_key=HMACKey(None, b"other")).encode({"sub": "a@example.com"}),
+        "not-a-token",
+    ]
+    # An HS256 header naming the public key must not turn it into an HMAC secret
+    swapped = base64url_encode(json.dumps({"alg": "HS256", "kid": "k1"}).encode()).decode()
+    bad_tokens.append(f"{swapped}.{payload}.{signature}")
+    unknown = base64url_encode(json.dumps({"alg": "ES256", "kid": "k2"}).encode()).decode()
+    bad_tokens.append(f"{unknown}.{payload}.{signature}")
+
+    for bad in bad_tokens:
+        with pytest.raises(InvalidTokenError):
+            keyset.decode(bad)
+
+def test_legacy_tokens_still_verify():
+    """Test that kid-less tokens signed with the shared secret verify after switching to a key set"""
+    legacy = HMACKey(None, b"secret")
+    old_token = KeySet([], legacy_key=legacy).encode({"sub": "a@example.com"})
+    entry = add_key({"active_kid": None, "keys": []}, "EdDSA", "k1", activate=True)["keys"][0]
+    keyset = KeySet([load_key(entry)], active_kid="k1", legacy_key=legacy)
+
+    assert keyset.decode(old_token)["sub"] == "a@example.com"
+    assert keyset.jwks()["keys"][0]["kty"] == "OKP"  # The shared secret is never published
+
+def test_key_store_rotates_without_restart(tmp_path):
+    """Test that a rewritten key set file is picked up and old tokens keep verifying"""
+    path = tmp_path / "keyset.json"
+    keyset = make_keyset_file(path, kid="k1")
+    store = KeyStore(str(path), reload_interval=0)
+    old_token = store.current().encode({"sub": "a@example.com"})
+
+    path.write_text(json.dumps(add_key(keyset, "RS256", "k2", activate=True)))
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    current = store.current()
+
+    assert current.active.kid == "k2"
+    assert not current.keys["k1"].can_sign
+    assert current.decode(old_token)["sub"] == "a@example.com"
+    assert {key["kid"] for key in current.jwks()["keys"]} == {"k1", "k2"}
+
+    # A broken file after startup keeps the last good keys
+    path.write_text("{")
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 2 * 10**9))
+    assert store.current() is current
+
+@pytest.mark.asyncio
+async def test_jwks_endpoint(client: AsyncClient, monkeypatch, tmp_path):
+    """Test that the JWKS endpoint is public and lists the key set's public keys"""
+    path = tmp_path / "keyset.json"
+    make_keyset_file(path, alg="ES256", kid="k1")
+    monkeypatch.setattr(security.key_store, "path", str(path))
+    security.key_store.reload(force=True)
+    try:
+        token = security.create_access_token({"sub": "a@example.com"})
+        response = await client.get("/api/v1/auth/jwks.json")
+    finally:
+        monkeypatch.undo()
+        security.key_store.reload(force=True)
+
+    assert response.status_code == 200
+    keys = response.json()["keys"]
+    assert [(key["kid"], key["alg"], key["kty"]) for key in keys] == [("k1", "ES256", "EC")]
+    assert "d" not in keys[0]
+    assert json.loads(base64url_decode(token.split(".")[0]))["kid"] == "k1"
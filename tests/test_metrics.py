@@ -0,0 +1,114 @@
+import pytest
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import AsyncClient
+
+from app.core.context import request_context
+from app.middleware.usage_tracker import UsageMiddleware
+from prometheus_client import REGISTRY
+
+from app.core.config import settings
+from app.core.metrics import BoundedLabel, metrics_sampler, sampled_counter, sampled_gauge
+
+def test_sampled_metrics():
+    """Test that callback values are copied into their metrics when sampled"""
+    depths = {("a",): 5}
+    dropped = 2
+    sampled_gauge("test_queue_depth", "Depth", lambda: dict(depths), ["queue"])
+    sampled_counter("test_dropped_total", "Dropped", lambda: dropped)
+
+    metrics_sampler.sample()
+    assert REGISTRY.get_sample_value("test_queue_depth", {"queue": "a"}) == 5
+    assert REGISTRY.get_sample_value("test_dropped_total") == 2
+
+    # Gone labels are removed; counters only move by the increase
+    depths = {("b",): 1}
+    dropped = 7
+    metrics_sampler.sample()
+    assert REGISTRY.get_sample_value("test_queue_depth", {"queue": "a"}) is None
+    assert REGISTRY.get_sample_value("test_queue_depth", {"queue": "b"}) == 1
+    assert REGISTRY.get_sample_value("test_dropped_total") == 7
+
+def test_bounded_label():
+    """Test that label values past the bound collapse into "other" while known ones keep their series"""
+    label = BoundedLabel(2)
+    assert [label(value) for value in ("a", "b", "c", "a", "d")] == ["a", "b", "other", "a", "other"]
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient, auth_headers, monkeypatch):
+    """Test that /metrics reports requests by route, middlewares and DB calls"""
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 200
+
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/api/v1/tokens/",status="200"}' in text
+    assert 'middleware_duration_seconds_count{middleware="auth"}' in text
+    assert 'db_operation_duration_seconds_count{operation="get_user_tokens",service="TokenService"}' in text
+    assert 'password_hash_duration_seconds_count{operation="verify"}' in text
+    assert "usage_writer_pending" in text
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_requires_token(client: AsyncClient, monkeypatch):
+    """Test that /metrics is not served without METRICS_TOKEN and asks for it once it is set"""
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    assert (await client.get("/metrics")).status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+
+    assert (await client.get("/metrics")).status_code == 401
+    assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "http_requests_total" in response.text
+
+@pytest.mark.asyncio
+async def test_usage_middleware_streams_and_times_response():
+    """Test that a streamed response goes out chunk by chunk and is timed to its first byte and its end"""
+    app = FastAPI()
+    sent = []
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            yield "first\n"
+            await asyncio.sleep(0.05)
+            # Not buffered: the first chunk reached the client before the endpoint went on
+            assert sent == [b"first\n"]
+            yield "second\n"
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app.add_middleware(UsageMiddleware)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/stream", "raw_path": b"/stream", "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 50000), "server": ("test", 80), "state": {},
+    }
+    done = asyncio.Event()
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            if message.get("body"):
+                sent.append(message["body"])
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    assert sent == [b"first\n", b"second\n"]
+    context = request_context(scope)
+    assert context.status_code == 200
+    assert context.first_byte - context.started < 0.05
+    assert context.finished - context.started >= 0.05
@@ -0,0 +1,24 @@
+import datetime
+import time
+
+from app.models.token import Token
+from app.models.usage import APIUsage, UsageRecord
+
+def test_default_timestamps_are_per_instance():
+    """Test that created_at and timestamp are taken when each record is built, not at import"""
+    before = datetime.datetime.now(datetime.timezone.utc)
+    first = APIUsage(user_id="u", token="t", endpoint="/a", response_time=1.0)
+    time.sleep(0.001)
+    second = APIUsage(user_id="u", token="t", endpoint="/a", response_time=1.0)
+    assert before <= first.timestamp < second.timestamp
+
+    token = Token(user_id="u", token="t", expires_at=before)
+    assert token.created_at >= before
+    assert UsageRecord("u", "t", "/a", 1.0).timestamp >= before
+
+def test_usage_record_matches_model():
+    """Test that the unvalidated record stores the same document as the model"""
+    model = APIUsage(user_id="u", token="t", token_id="i", endpoint="/a", status_code=404, response_time=1.5)
+    record = UsageRecord.from_document({**model.to_document(), "_id": "ignored"})
+    assert record.to_document() == model.to_document()
+    assert record.to_model() == model
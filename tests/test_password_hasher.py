@@ -0,0 +1,52 @@
+import pytest
+import asyncio
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.core import security
+from app.core.security import PasswordHasher
+
+async def test_hash_and_verify_in_pool():
+    """Test that hashing and verification run on the pool and round-trip"""
+    hasher = PasswordHasher(workers=2, max_pending=4)
+    hashed = await hasher.hash("s3cret-pass")
+    assert await hasher.verify_for_login("s3cret-pass", hashed) == (True, None)
+    assert (await hasher.verify_for_login("wrong", hashed))[0] is False
+    hasher.shutdown()
+
+async def test_login_rejected_when_saturated():
+    """Test that logins get a 503 instead of queueing once the pool is full"""
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    hashed = await hasher.hash("s3cret-pass")
+    in_flight = asyncio.create_task(hasher.hash("another-pass"))
+    await asyncio.sleep(0)
+    assert hasher.saturated
+
+    with pytest.raises(HTTPException) as exc:
+        await hasher.verify_for_login("s3cret-pass", hashed)
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"] == "1"
+
+    await in_flight
+    assert (await hasher.verify_for_login("s3cret-pass", hashed))[0] is True
+    hasher.shutdown()
+
+async def test_login_rehashes_outdated_hash(client, test_db, monkeypatch):
+    """Test that a login upgrades a hash made with different cost parameters"""
+    old_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4)
+    await test_db.users.insert_one({
+        "id": "u1",
+        "email": "old@example.com",
+        "username": "old",
+        "password_hash": old_context.hash("oldpass123"),
+        "is_admin": False,
+    })
+    monkeypatch.setattr(security, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5))
+
+    response = await client.post(
+        "/api/v1/auth/login",
+        data={"username": "old@example.com", "password": "oldpass123"}
+    )
+    assert response.status_code == 200
+    user = await test_db.users.find_one({"email": "old@example.com"})
+    assert user["password_hash"].startswith("$2b$05$")
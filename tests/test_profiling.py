@@ -0,0 +1,82 @@
+import pytest
+from httpx import AsyncClient
+from starlette.requests import Request
+
+from app.services.profiling import profiler
+
+@pytest.mark.asyncio
+async def test_profile_endpoint_with_stages(client: AsyncClient, admin_token):
+    """Test that a request matching an endpoint rule is profiled with a per-stage breakdown"""
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await client.put(
+        "/api/v1/profiling/rules", json={"endpoints": ["/api/v1/tokens/{token_id}"]}, headers=headers
+    )
+    assert response.status_code == 200
+
+    # Other endpoints are left alone
+    response = await client.get("/api/v1/tokens/", headers=headers)
+    assert "X-Profile-Id" not in response.headers
+    token_id = response.json()[0]["id"]
+
+    response = await client.get(f"/api/v1/tokens/{token_id}", headers=headers)
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    response = await client.get(f"/api/v1/profiling/profiles/{profile_id}", headers=headers)
+    assert response.status_code == 200
+    profile = response.json()
+    assert profile["reason"] == "endpoint"
+    assert profile["path"] == f"/api/v1/tokens/{token_id}"
+    assert profile["status_code"] == 200
+    for stage in ("auth", "rate_limit", "usage", "dependencies", "handler", "serialization", "other"):
+        assert stage in profile["stages_ms"]
+    assert sum(profile["stages_ms"].values()) == pytest.approx(profile["duration_ms"], rel=0.01)
+
+    response = await client.get(f"/api/v1/profiling/profiles/{profile_id}/flamegraph", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == f'attachment; filename="profile-{profile_id}.folded"'
+    counts = []
+    for line in response.text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert ";" in stack
+        counts.append(int(count))
+    assert sum(counts) == profile["samples"] >= 1
+
+@pytest.mark.asyncio
+async def test_profile_user_and_ring_buffer(client: AsyncClient, admin_token, normal_token, test_db):
+    """Test that user rules only select that user's requests and old profiles are dropped"""
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    normal = {"Authorization": f"Bearer {normal_token}"}
+    user = (await client.get("/api/v1/tokens/", headers=normal)).json()[0]["user_id"]
+    await client.put("/api/v1/profiling/rules", json={"user_ids": [user]}, headers=admin)
+
+    max_profiles, profiler.max_profiles = profiler.max_profiles, 2
+    try:
+        for _ in range(3):
+            response = await client.get("/api/v1/tokens/", headers=normal)
+            assert response.headers["X-Profile-Id"]
+        response = await client.get("/api/v1/tokens/", headers=admin)
+        assert "X-Profile-Id" not in response.headers
+        # Other callers are not even sampled
+        scope = {"type": "http", "method": "GET", "path": "/api/v1/tokens/", "headers": [(b"authorization", admin["Authorization"].encode())]}
+        assert profiler.match(Request(scope)) is None
+    finally:
+        profiler.max_profiles = max_profiles
+
+    profiles = (await client.get("/api/v1/profiling/profiles", headers=admin)).json()
+    assert len(profiles) == 2
+    assert all(profile["reason"] == "user" and profile["user_id"] == user for profile in profiles)
+
+    response = await client.delete("/api/v1/profiling/profiles", headers=admin)
+    assert response.json() == {"deleted": 2}
+
+@pytest.mark.asyncio
+async def test_profiling_admin_only(client: AsyncClient, normal_token):
+    """Test that non-admin users cannot change the profiling rules"""
+    response = await client.put(
+        "/api/v1/profiling/rules",
+        json={"sample_rate": 1.0},
+        headers={"Authorization": f"Bearer {normal_token}"}
+    )
+    assert response.status_code == 403
+    assert not profiler.active
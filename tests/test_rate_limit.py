@@ -0,0 +1,88 @@
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+from pymongo.errors import AutoReconnect
+
+from app.core.config import settings
+from app.services.rate_limiter import MemoryRateLimitBackend, MongoRateLimitBackend, RateLimitBackend, create_backend, rate_limit_backend
+
+class FakeTimer:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+async def test_memory_backend_token_bucket():
+    """Test that the in-process limiter allows a burst, then refills over the window"""
+    timer = FakeTimer()
+    backend = MemoryRateLimitBackend(maxsize=100, timer=timer)
+
+    results = [await backend.hit("k", limit=3, window=3) for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results[:3]] == [2, 1, 0]
+    assert results[3].retry_after == pytest.approx(1.0)
+
+    timer.now += 1
+    assert (await backend.hit("k", limit=3, window=3)).allowed
+    assert (await backend.hit("other", limit=3, window=3)).remaining == 2
+
+async def test_mongo_backend_sliding_window(test_db):
+    """Test that the shared limiter counts across windows through MongoDB"""
+    timer = FakeTimer(now=600.0)
+    backend = MongoRateLimitBackend(maxsize=100, timer=timer)
+
+    results = [await backend.hit("k", limit=2, window=60) for _ in range(2)]
+    assert [r.allowed for r in results] == [True, True]
+    assert (await backend.hit("burst", limit=1, window=60)).allowed is True
+    assert (await backend.hit("burst", limit=1, window=60)).allowed is False
+
+    # Half-way into the next window, half of the previous window still counts
+    timer.now += 90
+    assert (await backend.hit("k", limit=2, window=60)).allowed is True
+    assert (await backend.hit("k", limit=2, window=60)).allowed is False
+
+async def test_mongo_backend_fails_open(monkeypatch):
+    """Test that a MongoDB failure falls back to counting in-process instead of failing requests"""
+    class Unreachable:
+        async def find_one_and_update(self, *args, **kwargs):
+            raise AutoReconnect("connection refused")
+    monkeypatch.setattr(MongoRateLimitBackend, "collection", Unreachable())
+    backend = MongoRateLimitBackend(maxsize=100)
+    errors = REGISTRY.get_sample_value("rate_limit_backend_errors_total")
+
+    results = [await backend.hit("k", limit=2, window=60) for _ in range(3)]
+    assert [r.allowed for r in results] == [True, True, False]
+    assert REGISTRY.get_sample_value("rate_limit_backend_errors_total") == errors + 3
+
+def test_auto_backend_is_shared_across_workers(monkeypatch):
+    """Test that several server workers get the shared backend instead of per-process counters"""
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 1)
+    assert isinstance(create_backend("auto"), MemoryRateLimitBackend)
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+    assert isinstance(create_backend("auto"), MongoRateLimitBackend)
+
+def test_incomplete_backend_fails_on_creation():
+    """Test that a backend missing a method cannot be created at all"""
+    class NoClear(RateLimitBackend):
+        async def hit(self, key: str, limit: int, window: float):
+            return None
+
+    with pytest.raises(TypeError):
+        NoClear()
+
+async def test_rate_limit_middleware(client: AsyncClient, auth_headers, monkeypatch):
+    """Test that the middleware sets RateLimit headers and returns 429 when exhausted"""
+    rate_limit_backend.clear()
+    monkeypatch.setattr(settings, "RATE_LIMIT_REQUESTS", 2)
+
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["RateLimit-Limit"] == "2"
+    assert response.headers["RateLimit-Remaining"] == "1"
+
+    await client.get("/api/v1/tokens/", headers=auth_headers)
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    rate_limit_backend.clear()
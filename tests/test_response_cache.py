@@ -0,0 +1,105 @@
+import pytest
+from httpx import AsyncClient
+
+from app.services.response_cache import CachedResponse, MemoryResponseCacheBackend, ResponseCacheBackend, response_cache
+
+@pytest.mark.asyncio
+async def test_cached_token_listing(client: AsyncClient, auth_headers, test_user, test_db):
+    """Test that a repeated listing is served from the cache and revalidates with a 304"""
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "miss"
+    etag = response.headers["ETag"]
+
+    # A hit resolves no dependency: the user is not even loaded
+    users = await test_db.users.find().to_list(length=None)
+    await test_db.users.delete_many({})
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "hit"
+    assert response.headers["ETag"] == etag
+
+    response = await client.get("/api/v1/tokens/", headers={**auth_headers, "If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+    assert response.content == b""
+    await test_db.users.insert_many(users)
+
+    # A new login creates a token, which invalidates the user's listing
+    await client.post("/api/v1/auth/login", data={"username": test_user["email"], "password": test_user["password"]})
+    response = await client.get("/api/v1/tokens/", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "miss"
+    assert len(response.json()) == 2
+
+    # So does revoking one
+    token_id = response.json()[1]["id"]
+    response = await client.get(f"/api/v1/tokens/{token_id}", headers=auth_headers)
+    assert response.json()["is_active"] is True
+    await client.delete(f"/api/v1/tokens/{token_id}", headers=auth_headers)
+    response = await client.get(f"/api/v1/tokens/{token_id}", headers=auth_headers)
+    assert response.headers["X-Cache"] == "miss"
+    assert response.json()["is_active"] is False
+
+@pytest.mark.asyncio
+async def test_cache_is_per_user(client: AsyncClient, admin_token, normal_token):
+    """Test that callers never see each other's cached responses"""
+    admin = (await client.get("/api/v1/tokens/", headers={"Authorization": f"Bearer {admin_token}"})).json()
+    normal = await client.get("/api/v1/tokens/", headers={"Authorization": f"Bearer {normal_token}"})
+    assert normal.headers["X-Cache"] == "miss"
+    assert normal.json()[0]["user_id"] != admin[0]["user_id"]
+
+@pytest.mark.asyncio
+async def test_usage_stats_expire_instead_of_invalidation(client: AsyncClient, auth_headers):
+    """Test that recording usage leaves the cached stats alone and a backfill drops them"""
+    response = await client.get("/api/v1/usage/stats", headers=auth_headers)
+    assert response.headers["X-Cache"] == "miss"
+    # Without the background writer the previous request's usage was recorded inline
+    response = await client.get("/api/v1/usage/stats", headers=auth_headers)
+    assert response.headers["X-Cache"] == "hit"
+
+    await response_cache.invalidate("usage")  # what UsageRollupService.backfill ends with
+    response = await client.get("/api/v1/usage/stats", headers=auth_headers)
+    assert response.headers["X-Cache"] == "miss"
+
+@pytest.mark.asyncio
+async def test_memory_backend_caps_and_tags():
+    """Test LRU eviction by entry count and bytes, expiry and tag invalidation"""
+    now = [0.0]
+    cache = MemoryResponseCacheBackend(max_entries=3, max_bytes=10, timer=lambda: now[0])
+
+    def response(size: int) -> CachedResponse:
+        return CachedResponse(b"x" * size, "application/json", '"etag"')
+
+    await cache.set("a", response(4), ["user:1"], ttl=10)
+    await cache.set("b", response(4), ["user:1", "users"], ttl=10)
+    await cache.get("a")
+    await cache.set("c", response(4), ["user:2"], ttl=10)
+    # Over 10 bytes: the least recently used entry goes
+    assert await cache.get("b") is None
+    assert cache.size == 8
+
+    await cache.set("d", response(11), [], ttl=10)
+    assert await cache.get("d") is None
+
+    assert await cache.invalidate("user:1") == 1
+    assert await cache.get("a") is None
+    assert len(cache) == 1
+
+    now[0] = 10.0
+    assert await cache.get("c") is None
+    assert cache.size == 0
+
+def test_incomplete_backend_fails_on_creation():
+    """Test that a custom cache backend missing a method cannot be created at all"""
+    class NoInvalidate(ResponseCacheBackend):
+        async def get(self, key: str):
+            return None
+
+        async def set(self, key: str, response: CachedResponse, tags, ttl: float) -> None:
+            pass
+
+        async def clear(self) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        NoInvalidate()
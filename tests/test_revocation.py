@@ -0,0 +1,70 @@
+import pytest
+import datetime
+import time
+from httpx import AsyncClient
+
+from app.services.revocation import RevocationList, revocation_list
+from app.services.token_service import TokenService
+
+def in_minutes(minutes: int) -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=minutes)
+
+def make_list() -> RevocationList:
+    return RevocationList(sync_interval=1.0, overlap=5.0, max_staleness=10.0)
+
+def test_revocation_list_prunes_expired_tokens():
+    """Test that revocations are forgotten once their token has expired"""
+    revoked = make_list()
+    revoked.add("a", in_minutes(1))
+    revoked.add("b", in_minutes(10))
+    revoked.add("c", in_minutes(-1))  # Already expired: nothing to remember
+    assert "a" in revoked and "b" in revoked and "c" not in revoked
+
+    revoked.prune(now=time.time() + 120)
+    assert "a" not in revoked and "b" in revoked
+    assert len(revoked) == 1
+
+async def test_revocations_sync_between_workers(test_db):
+    """Test that a revocation made by one worker reaches another through the change log"""
+    worker_a, worker_b = make_list(), make_list()
+    await worker_a.revoke("token-1", "user-1", in_minutes(30))
+    assert "token-1" in worker_a
+
+    assert not worker_b.fresh
+    assert await worker_b.sync() == 1
+    assert "token-1" in worker_b and worker_b.fresh
+
+    await worker_a.revoke("token-2", "user-1", in_minutes(30))
+    await worker_b.sync()
+    assert "token-2" in worker_b
+
+@pytest.mark.asyncio
+async def test_middleware_skips_token_lookup_when_synced(client: AsyncClient, auth_headers, sample_token, test_db):
+    """Test that a synced worker authenticates without reading the token and honours revocations"""
+    await revocation_list.sync()
+
+    # The token document is not consulted: requests keep working without it
+    await test_db.tokens.delete_many({})
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 200
+
+    # Revoked by another worker, picked up on the next sync
+    await make_list().revoke(sample_token.id, sample_token.user_id, sample_token.expires_at)
+    await revocation_list.sync()
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token is invalid or revoked"
+
+async def test_failed_revocation_leaves_token_active(sample_token, test_db, monkeypatch):
+    """Test that a revocation that cannot be logged raises and does not deactivate the token"""
+    async def failing_revoke(*args):
+        raise RuntimeError("change log unavailable")
+    monkeypatch.setattr(revocation_list, "revoke", failing_revoke)
+    with pytest.raises(RuntimeError):
+        await TokenService().deactivate_token(sample_token.id)
+    assert (await test_db.tokens.find_one({"id": sample_token.id}))["is_active"] is True
+
+    monkeypatch.undo()
+    assert await TokenService().deactivate_token(sample_token.id) is True
+    assert sample_token.id in revocation_list
+    assert await TokenService().deactivate_token(sample_token.id) is False
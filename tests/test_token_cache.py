@@ -0,0 +1,76 @@
+import pytest
+import datetime
+from httpx import AsyncClient
+
+from app.core.cache import TTLCache
+from app.services.token_cache import CachedToken, TokenCache
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_token(token_id: str, minutes: int = 30) -> CachedToken:
+    return CachedToken(
+        token_id=token_id,
+        user_id="user-1",
+        is_active=True,
+        expires_at=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=minutes),
+    )
+
+def test_ttl_cache_expires_entries():
+    """Test that entries disappear once their TTL has elapsed"""
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    timer.now = 5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test that the cache stays bounded by evicting the LRU entry"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+def test_token_cache_invalidate_by_id():
+    """Test that a token can be dropped from the cache by its id"""
+    cache = TokenCache(maxsize=10, ttl=60)
+    cache.set("raw-token", make_token("token-1"))
+    assert cache.get("raw-token").token_id == "token-1"
+    cache.invalidate("token-1")
+    assert cache.get("raw-token") is None
+
+def test_token_cache_skips_expired_tokens():
+    """Test that expired tokens are never cached"""
+    cache = TokenCache(maxsize=10, ttl=60)
+    cache.set("raw-token", make_token("token-1", minutes=-1))
+    assert cache.get("raw-token") is None
+
+async def test_cached_lookup_skips_database(auth_headers_and_token, token_service):
+    """Test that a cached token is served without touching the tokens collection"""
+    _, token = auth_headers_and_token
+    cached = await token_service.get_cached_token(token)
+    assert cached.is_active is True
+
+    await token_service.collection.delete_many({})
+    assert await token_service.get_cached_token(token) == cached
+
+async def test_deactivate_invalidates_cache(client: AsyncClient, auth_headers_and_token, token_service):
+    """Test that revoking a token takes effect immediately despite the cache"""
+    headers, token = auth_headers_and_token
+    cached = await token_service.get_cached_token(token)
+
+    assert await token_service.deactivate_token(cached.token_id) is True
+    assert (await token_service.get_cached_token(token)).is_active is False
+
+    response = await client.get("/api/v1/tokens/", headers=headers)
+    assert response.status_code == 401
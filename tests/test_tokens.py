@@ -1,15 +1,15 @@
 import pytest
-from fastapi.testclient import TestClient
+from httpx import AsyncClient
 from app.models.token import Token
 
-def test_list_tokens_unauthorized(client: TestClient):
+async def test_list_tokens_unauthorized(client: AsyncClient):
     """Test that unauthorized users cannot list tokens"""
-    response = client.get("/api/v1/tokens/")
+    response = await client.get("/api/v1/tokens/")
     assert response.status_code == 401
 
-def test_list_tokens(client: TestClient, auth_headers, sample_token):
+async def test_list_tokens(client: AsyncClient, auth_headers, sample_token):
     """Test listing user tokens"""
-    response = client.get("/api/v1/tokens/", headers=auth_headers)
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
     assert response.status_code == 200
     tokens = response.json()
     assert len(tokens) > 0
@@ -25,24 +25,35 @@ def test_list_tokens(client: TestClient, auth_headers, sample_token):
     assert found_token["token"] == sample_token.token
     assert found_token["user_id"] == sample_token.user_id
 
-def test_get_token_details(client: TestClient, auth_headers, sample_token):
+async def test_get_token_details(client: AsyncClient, auth_headers, sample_token):
     """Test getting specific token details"""
-    response = client.get(f"/api/v1/tokens/{sample_token.id}", headers=auth_headers)
+    response = await client.get(f"/api/v1/tokens/{sample_token.id}", headers=auth_headers)
     assert response.status_code == 200
     token_data = response.json()
     assert token_data["id"] == sample_token.id
     assert token_data["token"] == sample_token.token
 
-def test_get_nonexistent_token(client: TestClient, auth_headers):
+async def test_get_nonexistent_token(client: AsyncClient, auth_headers):
     """Test getting a token that doesn't exist"""
-    response = client.get("/api/v1/tokens/nonexistent", headers=auth_headers)
+    response = await client.get("/api/v1/tokens/nonexistent", headers=auth_headers)
     assert response.status_code == 404
 
-def test_revoke_token(client: TestClient, auth_headers, sample_token):
+async def test_revoke_token(client: AsyncClient, auth_headers, sample_token):
     """Test revoking a token"""
-    response = client.delete(f"/api/v1/tokens/{sample_token.id}", headers=auth_headers)
+    response = await client.delete(f"/api/v1/tokens/{sample_token.id}", headers=auth_headers)
     assert response.status_code == 200
     
     # Verify token is deactivated
-    response = client.get("/api/v1/test/sleep/1", headers=auth_headers)
-    assert response.status_code == 401 
\ No newline at end of file
+    response = await client.get("/api/v1/test/sleep/1", headers=auth_headers)
+    assert response.status_code == 401 
+
+
+async def test_list_tokens_matches_model(client: AsyncClient, auth_headers, sample_token, test_db):
+    """Test that the listing, encoded from the raw documents, has the shape of the Token model"""
+    # A document written before some fields existed still lists them with their defaults
+    await test_db.tokens.update_one({"id": sample_token.id}, {"$unset": {"description": "", "last_used": ""}})
+    response = await client.get("/api/v1/tokens/", headers=auth_headers)
+    assert response.status_code == 200
+    token = response.json()[0]
+    assert set(token) == set(Token.model_fields)
+    assert Token(**token).model_dump(mode="json") == token
@@ -0,0 +1,199 @@
+import pytest
+import asyncio
+import time
+import httpx
+from fastapi import HTTPException
+from httpx import AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.services.api_service import api_cache
+from app.services.proxy import upstream_proxy
+from app.services.upstream_guard import AdaptiveConcurrencyLimit, CircuitBreaker, UpstreamGuard
+
+class FakeTimer:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def make_limit(timer, **options) -> AdaptiveConcurrencyLimit:
+    defaults = dict(initial=4, min_limit=1, max_limit=8, latency_tolerance=2.0, backoff=0.5, max_queue=2, queue_timeout=0.05)
+    return AdaptiveConcurrencyLimit("upstream", timer=timer, **{**defaults, **options})
+
+async def test_concurrency_limit_adapts_to_latency():
+    """Test that fast calls at the limit raise it and a slow call cuts it, once per round trip"""
+    timer = FakeTimer()
+    limit = make_limit(timer)
+    for _ in range(20):
+        calls = int(limit.limit)
+        for _ in range(calls):
+            await limit.acquire()
+        for _ in range(calls):
+            limit.release()
+            limit.record(0.010, failed=False)
+    assert int(limit.limit) == 8  # capped at max_limit
+
+    limit.record(0.050, failed=False)
+    assert limit.limit == 4.0
+    limit.record(0.050, failed=False)  # the same burst, less than a round trip later
+    assert limit.limit == 4.0
+    timer.now += 1
+    limit.record(None, failed=True)
+    assert limit.limit == 2.0
+
+async def test_concurrency_limit_queue():
+    """Test that calls over the limit wait in order, and are turned away when the queue is full or too slow"""
+    limit = make_limit(FakeTimer(), initial=1)
+    await limit.acquire()
+    waiter = asyncio.create_task(limit.acquire())
+    await asyncio.sleep(0)
+    assert limit.queued == 1
+    limit.release()
+    await waiter
+    assert limit.in_flight == 1 and limit.queued == 0
+
+    # Nobody releases: the next two time out, a third does not fit in the queue
+    waiters = [asyncio.create_task(limit.acquire()) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as full:
+        await limit.acquire()
+    assert full.value.status_code == 503
+    for task in waiters:
+        with pytest.raises(HTTPException):
+            await task
+    assert limit.queued == 0 and limit.in_flight == 1
+
+async def test_waiter_rejected_as_it_times_out_keeps_count():
+    """Test that a call rejected from the queue as its wait times out does not give back a slot it never had"""
+    limit = make_limit(FakeTimer(), initial=1, queue_timeout=0.01)
+    await limit.acquire()
+    waiter = asyncio.create_task(limit.acquire())
+    await asyncio.sleep(0)
+
+    # Both due by the next loop iteration: the timeout first, then the rejection
+    error = HTTPException(status_code=503, detail="Upstream circuit is open")
+    asyncio.get_running_loop().call_later(0.02, limit.reject_waiters, error)
+    time.sleep(0.05)
+    with pytest.raises(HTTPException):
+        await waiter
+    assert limit.in_flight == 1 and limit.queued == 0
+
+def test_circuit_breaker():
+    """Test that the circuit opens on errors, fails fast, and closes after successful probes"""
+    timer = FakeTimer()
+    breaker = CircuitBreaker(error_threshold=0.5, min_calls=4, window_seconds=10, open_seconds=5, half_open_calls=2, timer=timer)
+    for failed in (False, True, False):
+        breaker.allow()
+        breaker.record(failed)
+    assert breaker.state == "closed"
+    breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "open"
+    with pytest.raises(HTTPException) as rejected:
+        breaker.allow()
+    assert rejected.value.headers["Retry-After"] == "5"
+
+    # Half-open: a failed probe opens it again
+    timer.now += 5
+    breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "open"
+
+    timer.now += 5
+    breaker.allow()
+    breaker.allow()
+    with pytest.raises(HTTPException):
+        breaker.allow()  # only two probes at a time
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == "closed"
+
+    # Old outcomes leave the window
+    for failed in (True, True, False):
+        breaker.allow()
+        breaker.record(failed)
+    timer.now += 11
+    breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+async def test_open_circuit_rejects_queued_calls():
+    """Test that the calls waiting for a slot fail fast once the circuit opens"""
+    guard = UpstreamGuard(
+        limit_options=dict(initial=2, min_limit=1, max_limit=2, latency_tolerance=2.0, backoff=0.5, max_queue=5, queue_timeout=10.0),
+        breaker_options=dict(error_threshold=0.5, min_calls=2, window_seconds=10, open_seconds=5, half_open_calls=1),
+        timer=FakeTimer(),
+    )
+    calls = [await guard.acquire("upstream") for _ in range(2)]
+    waiters = [asyncio.create_task(guard.acquire("upstream")) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert guard.snapshot("upstream")["queued"] == 3
+    for call in calls:
+        call.finish(failed=True)
+    for task in waiters:
+        with pytest.raises(HTTPException) as rejected:
+            await task
+        assert rejected.value.detail == "Upstream circuit is open"
+    assert guard.snapshot("upstream")["in_flight"] == 0
+
+failing = {"errors": True}
+
+async def flaky(request):
+    if failing["errors"]:
+        return JSONResponse({"detail": "overloaded"}, status_code=500)
+    await asyncio.sleep(0.01)
+    return JSONResponse({"ok": True})
+
+@pytest.fixture
+async def guarded_upstream():
+    """A stub upstream failing on demand, behind a guard with small thresholds"""
+    original_guard = upstream_proxy.guard
+    await upstream_proxy.close()
+    upstream_proxy.transport = httpx.ASGITransport(app=Starlette(routes=[Route("/v1/{path:path}", flaky, methods=["POST"])]))
+    upstream_proxy.guard = UpstreamGuard(
+        limit_options=dict(initial=2, min_limit=1, max_limit=4, latency_tolerance=2.0, backoff=0.5, max_queue=10, queue_timeout=5.0),
+        breaker_options=dict(error_threshold=0.5, min_calls=3, window_seconds=60, open_seconds=0.2, half_open_calls=1),
+    )
+    api_cache.clear()
+    failing["errors"] = True
+    yield upstream_proxy.guard
+    await upstream_proxy.close()
+    upstream_proxy.transport = None
+    upstream_proxy.guard = original_guard
+
+async def test_proxy_fails_fast_on_erroring_upstream(client: AsyncClient, auth_headers, guarded_upstream, monkeypatch):
+    """Test that an erroring upstream trips its circuit, calls then fail fast, and it recovers"""
+    import app.api.v1.endpoints.apis as apis_endpoint
+    monkeypatch.setattr(apis_endpoint, "upstream_guard", guarded_upstream)
+    response = await client.post(
+        "/api/v1/apis/",
+        json={"name": "Flaky", "endpoint": "http://flaky.test/v1", "method": "POST", "coalesce": False},
+        headers=auth_headers,
+    )
+    api = response.json()
+    url = f"/api/v1/apis/{api['id']}/call/complete"
+
+    statuses = [(await client.post(url, content=str(i), headers=auth_headers)).status_code for i in range(3)]
+    assert statuses == [500, 500, 500]
+    response = await client.post(url, content=b"3", headers=auth_headers)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Upstream circuit is open"
+    assert "retry-after" in response.headers
+
+    metrics = (await client.get(f"/api/v1/apis/{api['id']}/metrics", headers=auth_headers)).json()
+    assert metrics["total_calls"] == 4
+    assert metrics["success_rate"] == 0
+    assert metrics["upstream"]["circuit_state"] == "open"
+    assert metrics["upstream"]["concurrency_limit"] == 1
+
+    # After open_seconds a probe goes through, and its success closes the circuit
+    failing["errors"] = False
+    await asyncio.sleep(0.25)
+    response = await client.post(url, content=b"4", headers=auth_headers)
+    assert response.status_code == 200
+    metrics = (await client.get(f"/api/v1/apis/{api['id']}/metrics", headers=auth_headers)).json()
+    assert metrics["upstream"]["circuit_state"] == "closed"
+    assert metrics["upstream"]["in_flight"] == 0
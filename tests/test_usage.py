@@ -1,20 +1,21 @@
 import pytest
-from fastapi.testclient import TestClient
+from httpx import AsyncClient
 import datetime
 import time
+import json
 
-def test_usage_tracking_unauthorized(client: TestClient):
+async def test_usage_tracking_unauthorized(client: AsyncClient):
     """Test that unauthorized requests are tracked"""
-    response = client.get("/api/v1/test/sleep/1")
+    response = await client.get("/api/v1/test/sleep/1")
     assert response.status_code == 401
 
-def test_usage_tracking_authorized(client: TestClient, auth_headers, usage_service):
+async def test_usage_tracking_authorized(client: AsyncClient, auth_headers, usage_service):
     """Test that authorized requests are tracked with token info"""
     # Get the token from auth headers
     token = auth_headers["Authorization"].split(" ")[1]
 
     # Make a test request
-    response = client.get("/api/v1/test/sleep/1", headers=auth_headers)
+    response = await client.get("/api/v1/test/sleep/1", headers=auth_headers)
     response_data = response.json()
     assert response.status_code == 200
 
@@ -25,15 +26,15 @@ def test_usage_tracking_authorized(client: TestClient, auth_headers, usage_servi
     user_id = response_data["user"]["id"]
 
     # Get usage stats
-    usages = usage_service.get_user_usage(user_id)
+    usages = await usage_service.get_user_usage(user_id)
     assert len(usages) > 0
     latest_usage = usages[-1]
     assert latest_usage.token == token
 
-def test_usage_stats_filtering(client: TestClient, auth_headers, usage_service):
+async def test_usage_stats_filtering(client: AsyncClient, auth_headers, usage_service):
     """Test usage statistics with date filtering"""
     # Create some usage data
-    response = client.get("/api/v1/test/sleep/1", headers=auth_headers)
+    response = await client.get("/api/v1/test/sleep/1", headers=auth_headers)
     response_data = response.json()
     assert response.status_code == 200
 
@@ -47,17 +48,17 @@ def test_usage_stats_filtering(client: TestClient, auth_headers, usage_service):
     start_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
     end_date = datetime.datetime.now(datetime.timezone.utc)
 
-    usages = usage_service.get_user_usage(
+    usages = await usage_service.get_user_usage(
         user_id,
         start_date=start_date,
         end_date=end_date
     )
     assert len(usages) > 0
 
-def test_usage_costs(client: TestClient, auth_headers, usage_service):
+async def test_usage_costs(client: AsyncClient, auth_headers, usage_service):
     """Test usage cost calculation"""
     # Create some usage data
-    response = client.get("/api/v1/test/sleep/1", headers=auth_headers)
+    response = await client.get("/api/v1/test/sleep/1", headers=auth_headers)
     response_data = response.json()
     assert response.status_code == 200
 
@@ -68,6 +69,52 @@ def test_usage_costs(client: TestClient, auth_headers, usage_service):
     user_id = response_data["user"]["id"]
 
     # Calculate costs
-    costs = usage_service.calculate_user_costs(user_id)
+    costs = await usage_service.calculate_user_costs(user_id)
     assert len(costs) > 0
-    assert "total_cost" in costs[0] 
\ No newline at end of file
+    assert "total_cost" in costs[0] 
+async def test_usage_records_pagination(client: AsyncClient, auth_headers, usage_service):
+    """Test that raw usage records are paged with a keyset cursor"""
+    for _ in range(5):
+        response = await client.get("/api/v1/tokens/", headers=auth_headers)
+        assert response.status_code == 200
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/api/v1/usage/records", headers=auth_headers, params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        assert all("token" not in item for item in page["items"])
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    # The five token listings plus every records page but the one in flight
+    assert len(seen) == len(set(seen)) >= 5
+
+async def test_usage_records_invalid_cursor(client: AsyncClient, auth_headers):
+    """Test that a malformed cursor is rejected"""
+    response = await client.get("/api/v1/usage/records", headers=auth_headers, params={"cursor": "nope"})
+    assert response.status_code == 400
+
+async def test_usage_export_formats(client: AsyncClient, auth_headers):
+    """Test that usage can be exported as NDJSON and CSV"""
+    await client.get("/api/v1/tokens/", headers=auth_headers)
+
+    response = await client.get("/api/v1/usage/export", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["endpoint"] == "/api/v1/tokens/"
+    assert "token" not in lines[0]
+
+    response = await client.get("/api/v1/usage/export", headers=auth_headers, params={"format": "csv"})
+    assert response.status_code == 200
+    rows = response.text.splitlines()
+    assert rows[0] == "timestamp,endpoint,method,status_code,response_time,token_id"
+    assert len(rows) >= 3
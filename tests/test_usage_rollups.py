@@ -0,0 +1,92 @@
+import pytest
+import datetime
+from httpx import AsyncClient
+
+from app.models.usage import APIUsage
+from app.services.usage_rollup_service import UsageRollupService, granularity_for, truncate
+
+NOW = datetime.datetime(2024, 5, 1, 12, 30, 15, tzinfo=datetime.timezone.utc)
+
+def make_usage(endpoint: str, status_code: int, response_time: float, minutes: int = 0, route: str | None = None) -> APIUsage:
+    return APIUsage(
+        user_id="user-1",
+        token="token-a",
+        endpoint=endpoint,
+        route=route,
+        status_code=status_code,
+        response_time=response_time,
+        timestamp=NOW + datetime.timedelta(minutes=minutes),
+    )
+
+def test_truncate_to_bucket():
+    """Test that timestamps are floored to their minute and hour buckets"""
+    assert truncate(NOW, "minute") == datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    assert truncate(NOW, "hour") == datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+def test_granularity_for_window():
+    """Test that minute buckets serve short windows only while they are retained"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    assert granularity_for(now - datetime.timedelta(hours=1), now) == "minute"
+    assert granularity_for(now - datetime.timedelta(days=2), now) == "hour"
+    # Minute buckets that old have expired
+    assert granularity_for(NOW, NOW + datetime.timedelta(hours=1)) == "hour"
+
+async def test_record_builds_incremental_buckets(test_db):
+    """Test that rollups accumulate counts, status classes and latency bounds"""
+    rollups = UsageRollupService()
+    await rollups.record([make_usage("/a", 200, 10.0), make_usage("/a", 404, 30.0)])
+    await rollups.record([make_usage("/a", 500, 20.0, minutes=1), make_usage("/b", 200, 5.0)])
+
+    assert await test_db.usage_rollups.count_documents({"granularity": "hour"}) == 2
+    assert await test_db.usage_rollups.count_documents({"granularity": "minute"}) == 3
+
+    hour = await test_db.usage_rollups.find_one({"endpoint": "/a", "granularity": "hour"})
+    assert hour["count"] == 3
+    assert hour["statuses"] == {"2xx": 1, "4xx": 1, "5xx": 1}
+    assert hour["latency_sum"] == 60.0
+    assert hour["latency_min"] == 10.0
+    assert hour["latency_max"] == 30.0
+
+async def test_record_keys_on_route_template(test_db):
+    """Test that calls to different IDs of one route share its buckets"""
+    rollups = UsageRollupService()
+    await rollups.record([
+        make_usage(f"/api/v1/tokens/{token_id}", 200, 1.0, route="/api/v1/tokens/{token_id}")
+        for token_id in ("a", "b", "c")
+    ])
+
+    assert await test_db.usage_rollups.distinct("endpoint") == ["/api/v1/tokens/{token_id}"]
+    hour = await test_db.usage_rollups.find_one({"granularity": "hour"})
+    assert hour["count"] == 3
+
+async def test_summary_and_costs_read_rollups(test_db, usage_service):
+    """Test that stats and costs come from the rollups, not the raw records"""
+    await usage_service.create_usages([make_usage("/a", 200, 10.0), make_usage("/a", 201, 30.0)])
+    await test_db.usage.delete_many({})
+
+    summary = await usage_service.get_usage_summary(
+        "user-1", NOW - datetime.timedelta(hours=1), NOW + datetime.timedelta(hours=1)
+    )
+    assert summary == [{
+        "endpoint": "/a",
+        "total_calls": 2,
+        "avg_response_time": 20.0,
+        "min_response_time": 10.0,
+        "max_response_time": 30.0,
+        "status_counts": {"1xx": 0, "2xx": 2, "3xx": 0, "4xx": 0, "5xx": 0},
+    }]
+
+    costs = await usage_service.calculate_user_costs("user-1")
+    assert costs[0]["total_calls"] == 2
+    assert costs[0]["total_cost"] == pytest.approx(0.02)
+
+async def test_usage_stats_endpoint(client: AsyncClient, auth_headers):
+    """Test that the stats endpoint reports the tracked calls"""
+    await client.get("/api/v1/tokens/", headers=auth_headers)
+    await client.get("/api/v1/tokens/missing", headers=auth_headers)
+    response = await client.get("/api/v1/usage/stats", headers=auth_headers)
+    assert response.status_code == 200
+    endpoints = {row["endpoint"]: row for row in response.json()["usage"]}
+    assert endpoints["/api/v1/tokens/"]["total_calls"] == 1
+    assert endpoints["/api/v1/tokens/{token_id}"]["total_calls"] == 1
+    assert "/api/v1/tokens/missing" not in endpoints
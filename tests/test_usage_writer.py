@@ -0,0 +1,74 @@
+import pytest
+import asyncio
+import datetime
+
+from app.models.usage import APIUsage
+from app.services.usage_writer import UsageWriter
+
+def make_usage(token: str = "token-a", minutes_ago: int = 0) -> APIUsage:
+    return APIUsage(
+        user_id="user-1",
+        token=token,
+        endpoint="/api/v1/test/sleep/1",
+        response_time=12.5,
+        timestamp=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=minutes_ago),
+    )
+
+async def test_writer_flushes_batches_on_stop(test_db):
+    """Test that queued records are written in batches and flushed on shutdown"""
+    await test_db.tokens.insert_many([{"token": "token-a"}, {"token": "token-b"}])
+    writer = UsageWriter(batch_size=3, flush_interval=60, max_queue_size=100, flush_timeout=5)
+    writer.start()
+    for i in range(7):
+        assert writer.submit(make_usage("token-a" if i % 2 else "token-b"))
+    await writer.stop()
+
+    assert await test_db.usage.count_documents({}) == 7
+    assert writer.stats() == {"queued": 7, "flushed": 7, "dropped": 0, "pending": 0}
+    async for token in test_db.tokens.find():
+        assert token["last_used"] is not None
+
+async def test_writer_flushes_on_interval(test_db):
+    """Test that a partial batch is written once the flush interval elapses"""
+    writer = UsageWriter(batch_size=100, flush_interval=0.05, max_queue_size=100, flush_timeout=5)
+    writer.start()
+    writer.submit(make_usage())
+    await asyncio.sleep(0.2)
+    assert await test_db.usage.count_documents({}) == 1
+    await writer.stop()
+
+async def test_writer_drops_when_queue_full(test_db):
+    """Test that a full queue drops records instead of blocking the caller"""
+    writer = UsageWriter(batch_size=10, flush_interval=60, max_queue_size=2, flush_timeout=5)
+    writer.start()
+    results = [writer.submit(make_usage()) for _ in range(5)]
+    assert results.count(False) == 3
+    assert writer.dropped == 3
+    await writer.stop()
+    assert await test_db.usage.count_documents({}) == 2
+
+async def test_writer_stamps_each_token_with_its_own_last_call(test_db):
+    """Test that a batch sets every token's last_used to that token's latest record"""
+    await test_db.tokens.insert_many([{"token": "token-a"}, {"token": "token-b"}])
+    writer = UsageWriter(batch_size=10, flush_interval=60, max_queue_size=100, flush_timeout=5)
+    writer.start()
+    for token, minutes_ago in [("token-a", 30), ("token-a", 20), ("token-b", 1)]:
+        writer.submit(make_usage(token, minutes_ago))
+    await writer.stop()
+
+    tokens = {token["token"]: token["last_used"] async for token in test_db.tokens.find()}
+    assert abs(tokens["token-b"] - tokens["token-a"] - datetime.timedelta(minutes=19)) < datetime.timedelta(seconds=1)
+
+async def test_writer_counts_stored_records_as_flushed(test_db, monkeypatch):
+    """Test that records already stored are not counted as dropped when a later step fails"""
+    async def failing_record(self, usages):
+        raise RuntimeError("rollups unavailable")
+    monkeypatch.setattr("app.services.usage_writer.UsageRollupService.record", failing_record)
+    writer = UsageWriter(batch_size=10, flush_interval=60, max_queue_size=100, flush_timeout=5)
+    writer.start()
+    for _ in range(3):
+        writer.submit(make_usage())
+    await writer.stop()
+
+    assert await test_db.usage.count_documents({}) == 3
+    assert writer.stats() == {"queued": 3, "flushed": 3, "dropped": 0, "pending": 0}